@@ -12,7 +12,9 @@ enum Order {
   STOP = 6,
   LED = 7,
   PIN = 8,
-  READ = 9
+  READ = 9,
+  SERVO_MULTI = 10,          // count, then count x (id, percentage). One acknowledgement for the whole order
+  SERVO_MULTI_RELATIVE = 11
 };
 
 typedef enum Order Order;
@@ -106,7 +106,7 @@ public:
         // setEaseToForAllServosSynchronizeAndStartInterrupt(tSpeed);
     }
 
-    void moveSingleServoByPercentage(uint8_t pServoIndex, int pPercent, boolean isRelative) {
+    void moveSingleServoByPercentage(uint8_t pServoIndex, int pPercent, boolean isRelative, boolean reply = true) {
         // Serial.print("PosMin: ");
         // Serial.print(PosMin[pServoIndex]);
         // Serial.print(" PosMax: ");
@@ -124,10 +124,10 @@ public:
             realChange = -realChange;
         }
         // PiConnect::write_i16(realChange);
-        moveSingleServo(pServoIndex, realChange, isRelative);
+        moveSingleServo(pServoIndex, realChange, isRelative, reply);
     }
 
-    void moveSingleServo(uint8_t pServoIndex, int pPos, boolean isRelative)
+    void moveSingleServo(uint8_t pServoIndex, int pPos, boolean isRelative, boolean reply = true)
     {
         if ((backpack == true || restrainingBolt == true) && pServoIndex < 6)
         {
@@ -141,8 +141,11 @@ public:
         {
             ServoEasing::ServoEasingNextPositionArray[pServoIndex] = pPos;
         }
-        // Return actual value to Pi
-        PiConnect::write_i16(ServoEasing::ServoEasingNextPositionArray[pServoIndex]);
+        // Return actual value to Pi (bulk orders send a single acknowledgement instead)
+        if (reply)
+        {
+            PiConnect::write_i16(ServoEasing::ServoEasingNextPositionArray[pServoIndex]);
+        }
     }
 
     void moveLegsAndStore(int x, int y, int *store)
@@ -297,6 +297,25 @@ boolean getOrdersFromPi()
         servoManager.moveSingleServoByPercentage(servo_identifier, servo_angle_percent, order_received == SERVO_RELATIVE);
         return true;
       }
+      case SERVO_MULTI:
+      case SERVO_MULTI_RELATIVE:
+      {
+        // Several servos in one order so they start moving together
+        int servo_count = PiConnect::read_i8();
+        for (int i = 0; i < servo_count; i++)
+        {
+          int servo_identifier = PiConnect::read_i8();
+          int servo_angle_percent = PiConnect::read_i16();
+          if (servo_identifier >= 0 && servo_identifier < SERVO_COUNT)
+          {
+            servoManager.moveSingleServoByPercentage(servo_identifier, servo_angle_percent, order_received == SERVO_MULTI_RELATIVE, false);
+          }
+        }
+        // Single acknowledgement for the whole order
+        PiConnect::write_i16(servo_count);
+        setSleep(2000);
+        return true;
+      }
       case PIN:
       {
         int pin = PiConnect::read_i8();
@@ -10,54 +10,22 @@ UNIX_DEPENDENCIES=()
 ADDITIONAL_URLS=()
 ACTIVE_MODULES=()
 
-# Install yaml package for Python
-myenv/bin/python3 -m pip install pyyaml
-
-# Helper function to parse dependencies from YAML files using Python
-parse_dependencies() {
-  myenv/bin/python3 - <<EOF
-import yaml, sys, os
-
-config_file = "$1"
-module_name = os.path.basename(config_file).replace('.yml', '')  # Get the module name from the filename
-try:
-    with open(config_file) as f:
-        config = yaml.safe_load(f)
-        if isinstance(config, dict):
-            for section in config.values():
-                # Ensure each section has 'enabled' set to true and 'dependencies' exists
-                if isinstance(section, dict) and section.get('enabled', False) and 'dependencies' in section:
-                    print(f"MODULE:{module_name}")
-                    for dep_type, deps in section['dependencies'].items():
-                        if dep_type == 'python':
-                            for dep in deps:
-                                print(f"PYTHON:{dep}")
-                        elif dep_type == 'unix':
-                            for dep in deps:
-                                print(f"UNIX:{dep}")
-                        elif dep_type == 'additional':
-                            for url in deps:
-                                print(f"ADDITIONAL:{module_name}:{url}")
-except yaml.YAMLError as e:
-    print(f"Error reading {config_file}: {e}", file=sys.stderr)
-EOF
-}
-
-# Iterate over each YAML config file in the config directory
-for config_file in config/*.yml; do
-  while IFS= read -r dependency; do
-    # Separate Python and Unix dependencies and capture active module names
-    if [[ $dependency == MODULE:* ]]; then
-      ACTIVE_MODULES+=("${dependency#MODULE:}")
-    elif [[ $dependency == PYTHON:* ]]; then
-      PYTHON_DEPENDENCIES+=("${dependency#PYTHON:}")
-    elif [[ $dependency == UNIX:* ]]; then
-      UNIX_DEPENDENCIES+=("${dependency#UNIX:}")
-    elif [[ $dependency == ADDITIONAL:* ]]; then
-      ADDITIONAL_URLS+=("${dependency#ADDITIONAL:}")
-    fi
-  done < <(parse_dependencies "$config_file")
-done
+# Install packages needed to read the config
+myenv/bin/python3 -m pip install pyyaml pypubsub
+
+# Read the dependencies of every enabled module from the config snapshot in one pass
+while IFS= read -r dependency; do
+  # Separate Python and Unix dependencies and capture active module names
+  if [[ $dependency == MODULE:* ]]; then
+    ACTIVE_MODULES+=("${dependency#MODULE:}")
+  elif [[ $dependency == PYTHON:* ]]; then
+    PYTHON_DEPENDENCIES+=("${dependency#PYTHON:}")
+  elif [[ $dependency == UNIX:* ]]; then
+    UNIX_DEPENDENCIES+=("${dependency#UNIX:}")
+  elif [[ $dependency == ADDITIONAL:* ]]; then
+    ADDITIONAL_URLS+=("${dependency#ADDITIONAL:}")
+  fi
+done < <(myenv/bin/python3 -m modules.config --dependencies)
 
 # Remove duplicate dependencies
 UNIQUE_PYTHON_DEPENDENCIES=($(echo "${PYTHON_DEPENDENCIES[@]}" | tr ' ' '\n' | sort -u | tr '\n' ' '))
@@ -1,15 +1,12 @@
 import os, sys
 import logging
-from time import sleep, time
 import signal
 # import schedule
 from pubsub import pub
 from modules.config import Config
 from module_loader import ModuleLoader
+from modules.scheduler import Scheduler
 
-# Set up logging
-logging.basicConfig(filename=os.path.dirname(__file__) + '/app.log', level=logging.INFO, format='%(levelname)s: %(asctime)s %(message)s',
-                            datefmt='%m/%d/%Y %I:%M:%S %p') # this doesn't work unless it's here
 from modules.logwrapper import LogWrapper
 
 def mode():
@@ -19,13 +16,14 @@ def main():
     print('Starting...')
     
     path = os.path.dirname(__file__)
-    log = LogWrapper(path=os.path.dirname(__file__))
+    # Set up logging, writes app.log on a background thread
+    log = LogWrapper(path=os.path.dirname(__file__), **Config.get('logwrapper', 'config'))
 
     # Throw exception to safely exit script when terminated
     signal.signal(signal.SIGTERM, Config.exit)
     
-    # Dynamically load and initialize modules
-    loader = ModuleLoader(config_folder="config")
+    # Dynamically load and initialize modules, changed config files are applied every second
+    loader = ModuleLoader(config_folder="config", watch='loop:1')
     module_instances = loader.load_modules()
 
     # Add your business logic here using module_instances as needed
@@ -71,28 +69,16 @@ def main():
     # Start loops or other tasks
     pub.sendMessage('log', msg="[Main] Loop started")
 
-    second_loop = time()
-    ten_second_loop = time()
-    minute_loop = time()
-    loop = True
-    
+    scheduler = Scheduler(**Config.get('scheduler', 'config'))
+
     try:
-        while loop:
-            pub.sendMessage('loop')
-            if time() - second_loop > 1:
-                second_loop = time()
-                pub.sendMessage('loop:1')
-            if time() - ten_second_loop > 10:
-                ten_second_loop = time()
-                pub.sendMessage('loop:10')
-            if time() - minute_loop > 60:
-                minute_loop = time()
-                pub.sendMessage('loop:60')
-                # schedule.run_pending()
+        # Publishes 'loop', 'loop:1', 'loop:10' and 'loop:60' at their configured intervals
+        scheduler.run()
 
     except Exception as ex:
         logging.error(f"Exception: {ex}", exc_info=True)
-        loop = False
+        pub.sendMessage('flightrecorder:dump', reason=f"Exception: {ex}")
+        scheduler.stop()
 
     finally:
         pub.sendMessage("exit")
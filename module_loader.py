@@ -1,75 +1,378 @@
-import os
-import yaml
-import importlib.util
+import importlib
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 from pubsub import pub
+from modules.config import Config, Snapshot
+from modules import lazy
 
 class ModuleLoader:
-    def __init__(self, config_folder='config'):
+    SHARED = (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType, types.MethodType, threading.Thread)  # never owned by an instance
+
+    def __init__(self, config_folder='config', max_workers=4, watch=None):
         """
         ModuleLoader class
+        Modules are started level by level: a module starts once the modules it depends on have been constructed,
+        modules on the same level are constructed together on a thread pool.
+        Modules marked as background are started on their own thread and not waited for, for constructors that never return.
+        Modules are imported as normal packages, so code shared between modules is only imported once.
+        The report splits each module's boot time into importing it and constructing its instances.
+
+        While watching, a changed config file is diffed against the running config and only the instances
+        whose config changed are touched. An instance with a reload(**config) method is updated in place
+        and keeps its hardware if the method returns True, otherwise the instance is torn down: the listeners bound
+        to it or to the objects it holds are unsubscribed, its exit() is called, and it is constructed again.
+        Reloads run on their own thread so a slow constructor does not hold up the topic being watched.
+        Animation files need no reload, Animate compiles a file again when it changes.
         :param config_folder: folder containing the module configuration files
-        
+        :param max_workers: modules constructed at the same time
+        :param watch: topic on which the config files are checked for changes, e.g. 'loop:1', None to not watch
+
         Example config file:
         config/modules.yml
         ---
         buzzer:
             enabled: true # Required
             path: "modules.audio.buzzer.Buzzer" # Required
+            depends_on: ['serial'] # Optional, names of modules that must be constructed first
+            background: false # Optional, true to start on a separate thread without waiting
             config: # Passed as **kwargs to the module's __init__ method
                 pin: 27
                 name: 'buzzer'
-        
+
         Example:
         loader = ModuleLoader()
         modules = loader.load_modules()
-        
+        print(loader.report())
+
         Reference module once loaded:
-        translator_inst = modules['Translator']        
+        translator_inst = modules['Translator']
         """
         self.config_folder = config_folder
+        self.max_workers = max_workers
         self.modules = self.load_yaml_files()
+        self.timings = {}  # module name: {'level', 'start', 'import', 'duration', 'background', 'error'}
+        self.instances = {}  # instance name: instance
+        self.owners = {}  # instance name: module name
+        self.reloading = threading.Lock()
+        if watch is not None:
+            pub.subscribe(self.check, watch)
 
-    def load_yaml_files(self):
-        """Load and parse YAML files from the config folder."""
-        config_files = [os.path.join(self.config_folder, f) for f in os.listdir(self.config_folder) if f.endswith('.yml')]
-        loaded_modules = []
-        for file_path in config_files:
-            with open(file_path, 'r') as stream:
-                try:
-                    config = yaml.safe_load(stream)
-                    for module_name, module_config in config.items():
-                        if module_config.get('enabled', False):
-                            loaded_modules.append(module_config)
-                except yaml.YAMLError as e:
-                    print(f"Error loading {file_path}: {e}")
+    def load_yaml_files(self, snapshot=None):
+        """Enabled modules from the config snapshot, the YAML files are parsed once and shared with Config."""
+        loaded_modules = {}
+        for sections in (snapshot or Snapshot.load(self.config_folder)).files.values():
+            for module_name, module_config in sections.items():
+                if module_config.get('enabled', False):
+                    loaded_modules[module_name] = module_config
         return loaded_modules
 
+    def levels(self):
+        """
+        Group the modules so that every module comes after the modules it depends on
+        :return: list of lists of module names
+        """
+        levels = {}
+        visiting = set()
+
+        def level(name):
+            if name in levels:
+                return levels[name]
+            if name in visiting:
+                raise ValueError(f"Circular dependency on module {name}")
+            visiting.add(name)
+            depth = 0
+            for dependency in self.modules[name].get('depends_on', []):
+                if dependency not in self.modules:
+                    print(f"Module {name} depends on {dependency}, which is not enabled")
+                    continue
+                if self.modules[dependency].get('background', False):
+                    print(f"Module {name} depends on {dependency}, which starts in the background and is not waited for")
+                depth = max(depth, level(dependency) + 1)
+            visiting.discard(name)
+            levels[name] = depth
+            return depth
+
+        grouped = []
+        for name in self.modules:
+            depth = level(name)
+            while len(grouped) <= depth:
+                grouped.append([])
+            grouped[depth].append(name)
+        return grouped
+
     def load_modules(self):
         """Dynamically load and instantiate the modules based on the config."""
-        instances = {}  # Use a dictionary to store instances for easy access
-        for module in self.modules:
-            print(f"Enabling {module['path']}")
-            # get path excluding the last part
-            module_path = module['path'].rsplit('.', 1)[0].replace('.', '/')  # e.g., "modules.servo"
-            module_name = module['path'].split('.')[-1]  # e.g., "Servo"
-            instances_config = module.get('instances', [module.get('config')])  # Get all instances or just use config 
-            if instances_config[0] is None:
-                instances_config = [{}]
-
-            # Dynamically load the module
-            spec = importlib.util.spec_from_file_location(module_name, f"{module_path}.py")
-            mod = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(mod)
-
-            # Create instances of the module
-            for instance_config in instances_config:
-                # Pass the instance config to the module's __init__ method as **kwargs
-                instance_name = module_name + '_' + instance_config.get('name') if instance_config.get('name') is not None else module_name # Use the module name and instance name as the key or module_name if single instance
-                instance = getattr(mod, module_name)(**instance_config)
-
-                # Store the instance in the dictionary
-                instances[instance_name] = instance
-                pub.sendMessage('log', msg=f"[ModuleLoader] Loaded module: {module_name} instance: {instance_name}")
+        instances = self.instances  # Use a dictionary to store instances for easy access
+        boot = perf_counter()
+        ModuleLoader.guard_topics()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ModuleLoader') as executor:
+            for depth, names in enumerate(self.levels()):
+                futures = []
+                for name in names:
+                    if self.modules[name].get('background', False):
+                        threading.Thread(target=self.load_module, args=(name, depth, boot), name=name, daemon=True).start()
+                    else:
+                        futures.append(executor.submit(self.load_module, name, depth, boot))
+                for future in futures:
+                    future.result()
 
         print("All modules loaded")
+        report = self.report(perf_counter() - boot)
+        print(report)
+        pub.sendMessage('log', msg='[ModuleLoader] ' + report)
         return instances  # Return the dictionary of instances
+
+    @staticmethod
+    def guard_topics():
+        """
+        Lock topic creation of the default topic manager, once for the whole process
+        Constructors running in parallel can subscribe or publish to a topic that does not exist yet, and pypubsub
+        creates topics without a lock. Delivering messages is not locked, listeners keep running concurrently.
+        """
+        manager = pub.getDefaultTopicMgr()
+        if getattr(manager, 'guarded', False):
+            return
+        create = manager.getOrCreateTopic
+        lock = threading.Lock()
+
+        def getOrCreateTopic(name, protoListener=None):
+            with lock:
+                return create(name, protoListener)
+
+        manager.getOrCreateTopic = getOrCreateTopic
+        manager.guarded = True
+
+    def load_module(self, name, depth, boot, only=None):
+        """
+        Import a module and create all of its instances, a failure is reported without stopping the others
+        :param only: names of the instances to create, None for all of them
+        """
+        module = self.modules[name]
+        start = perf_counter()
+        timing = self.timings[name] = {'level': depth, 'start': start - boot, 'import': None, 'duration': None,
+                                       'background': module.get('background', False), 'error': None}
+        print(f"Enabling {module['path']}")
+        try:
+            for instance_name, instance in self.create(name, module, only):
+                self.instances[instance_name] = instance
+                self.owners[instance_name] = name
+                pub.sendMessage('log', msg=f"[ModuleLoader] Loaded module: {module['path']} instance: {instance_name}")
+        except Exception as e:
+            timing['error'] = repr(e)
+            pub.sendMessage('log:error', msg=f"[ModuleLoader] Failed to load module: {name} {e!r}")
+        timing['duration'] = perf_counter() - start
+
+    @staticmethod
+    def instance_configs(module):
+        """
+        :return: list of (instance name, config) of a module section
+        """
+        module_name = module['path'].split('.')[-1]  # e.g., "Servo"
+        instances_config = module.get('instances', [module.get('config')])  # Get all instances or just use config
+        if instances_config[0] is None:
+            instances_config = [{}]
+        # Use the module name and instance name as the key or module_name if single instance
+        return [(module_name + '_' + instance_config.get('name') if instance_config.get('name') is not None else module_name,
+                 instance_config) for instance_config in instances_config]
+
+    def create(self, name, module, only=None):
+        # get path excluding the last part
+        module_path = module['path'].rsplit('.', 1)[0]  # e.g., "modules.actuators.servo"
+        module_name = module['path'].split('.')[-1]  # e.g., "Servo"
+
+        # Import the module, a module that was already imported is reused
+        start = perf_counter()
+        mod = importlib.import_module(module_path)
+        self.timings[name]['import'] = perf_counter() - start
+
+        # Create instances of the module
+        for instance_name, instance_config in ModuleLoader.instance_configs(module):
+            if only is None or instance_name in only:
+                # Pass the instance config to the module's __init__ method as **kwargs
+                yield instance_name, getattr(mod, module_name)(**instance_config)
+
+    def check(self):
+        """
+        Start a reload on its own thread if a config file was added, removed or changed
+        Only one reload runs at a time, a change made meanwhile is picked up by a later check.
+        :return: the reload thread, None if no file changed or a reload is still running
+        """
+        if Snapshot.fingerprint(self.config_folder) == Snapshot.load(self.config_folder).key:
+            return None
+        if not self.reloading.acquire(blocking=False):
+            return None
+
+        def run():
+            try:
+                self.apply()
+            finally:
+                self.reloading.release()
+
+        thread = threading.Thread(target=run, name='ModuleLoader-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def apply(self):
+        """
+        Reload the modules if a config file was added, removed or changed
+        :return: names of the instances that were reloaded, None if no file changed
+        """
+        try:
+            previous = Snapshot.load(self.config_folder)
+            snapshot = Snapshot.reload(self.config_folder)
+            if snapshot is None:
+                return None
+            if Config.snapshot is previous:
+                Config.snapshot, Config.config = snapshot, snapshot.config
+            return self.reload(snapshot)
+        except Exception as e:
+            pub.sendMessage('log:error', msg=f"[ModuleLoader] Failed to reload config: {e!r}")
+            return None
+
+    def reload(self, snapshot):
+        """
+        Apply a new config snapshot to the running modules
+        :return: names of the instances that were updated, removed or constructed
+        """
+        start = perf_counter()
+        old, self.modules = self.modules, self.load_yaml_files(snapshot)
+        touched = {}  # instance name: None, in order
+        rebuild = {}  # module name: instance names to construct, None for all of them
+        for name, module in old.items():
+            new = self.modules.get(name)
+            if new == module:
+                continue
+            if new is None or ModuleLoader.settings(new) != ModuleLoader.settings(module):
+                # Disabled, or its path or dependencies changed
+                touched.update(dict.fromkeys(self.teardown([instance_name for instance_name, owner in self.owners.items() if owner == name])))
+                if new is not None:
+                    rebuild[name] = None
+                continue
+            old_configs = dict(ModuleLoader.instance_configs(module))
+            new_configs = dict(ModuleLoader.instance_configs(new))
+            touched.update(dict.fromkeys(self.teardown([instance_name for instance_name in old_configs if instance_name not in new_configs])))
+            names = []
+            for instance_name, config in new_configs.items():
+                if old_configs.get(instance_name) == config:
+                    continue
+                touched[instance_name] = None
+                instance = self.instances.get(instance_name)
+                if instance_name in old_configs and hasattr(instance, 'reload') and instance.reload(**config):
+                    pub.sendMessage('log', msg=f"[ModuleLoader] Updated instance: {instance_name}")
+                    continue
+                self.teardown([instance_name])
+                names.append(instance_name)
+            if names:
+                rebuild[name] = names
+        for name in self.modules:
+            if name not in old:
+                rebuild[name] = None
+        for name, names in rebuild.items():
+            if names is None:
+                touched.update(dict.fromkeys(instance_name for instance_name, _ in ModuleLoader.instance_configs(self.modules[name])))
+
+        for depth, names in enumerate(self.levels()):
+            for name in names:
+                if name not in rebuild:
+                    continue
+                if self.modules[name].get('background', False):
+                    threading.Thread(target=self.load_module, args=(name, depth, start, rebuild[name]), name=name, daemon=True).start()
+                else:
+                    self.load_module(name, depth, start, rebuild[name])
+        pub.sendMessage('log', msg=f"[ModuleLoader] Reloaded config in {(perf_counter() - start) * 1000:.1f} ms: {', '.join(touched) or 'no changes'}")
+        return list(touched)
+
+    @staticmethod
+    def settings(module):
+        """Everything of a module section except the config passed to its instances"""
+        return {key: value for key, value in module.items() if key not in ('config', 'instances')}
+
+    def teardown(self, instance_names):
+        """Unsubscribe the listeners of instances and stop them, their hardware is released by exit()"""
+        for instance_name in instance_names:
+            instance = self.instances.get(instance_name)
+            if instance is not None:
+                self.unsubscribe(instance)
+            self.instances.pop(instance_name, None)
+            self.owners.pop(instance_name, None)
+            if hasattr(instance, 'exit'):
+                try:
+                    instance.exit()
+                except Exception as e:
+                    pub.sendMessage('log:error', msg=f"[ModuleLoader] Failed to stop instance: {instance_name} {e!r}")
+            pub.sendMessage('log', msg=f"[ModuleLoader] Removed instance: {instance_name}")
+        return list(instance_names)
+
+    def owned(self, instance, depth=2):
+        """
+        The instance and the objects it created, found in its attributes up to depth attributes away,
+        directly or in a list, tuple, set or dict, e.g. its behaviours or its tracker
+        Modules, classes, functions, threads, other running instances and the objects they hold are shared and not followed.
+        :return: {id: object}
+        """
+        others = [other for other in self.instances.values() if other is not instance]
+        shared = {id(other) for other in others}
+        for other in others:
+            shared.update(id(value) for value in ModuleLoader.held(other))
+        owned = {id(instance): instance}
+        level = [instance]
+        for _ in range(depth):
+            found = []
+            for obj in level:
+                for value in ModuleLoader.held(obj):
+                    if id(value) not in owned and id(value) not in shared:
+                        owned[id(value)] = value
+                        found.append(value)
+            level = found
+        return owned
+
+    @staticmethod
+    def held(obj):
+        """Objects with attributes of their own held by obj, directly or in a list, tuple, set or dict attribute"""
+        held = []
+        for value in list(vars(obj).values()) if hasattr(obj, '__dict__') else []:
+            if isinstance(value, dict):
+                values = list(value.values())
+            elif isinstance(value, (list, tuple, set)):
+                values = list(value)
+            else:
+                values = [value]
+            held.extend(item for item in values if hasattr(item, '__dict__') and not isinstance(item, ModuleLoader.SHARED))
+        return held
+
+    def unsubscribe(self, instance):
+        """
+        Unsubscribe the bound listeners of an instance and of the objects it holds from every topic
+        Plain functions are shared by all instances of a class (e.g. Servo.move_multi) and stay subscribed.
+        """
+        owned = self.owned(instance)
+        topics = [pub.getDefaultTopicMgr().getRootAllTopics()]
+        while topics:
+            topic = topics.pop()
+            topics.extend(topic.getSubtopics())
+            for listener in topic.getListeners():
+                function = listener.getCallable()
+                if id(getattr(function, '__self__', None)) in owned:
+                    try:
+                        topic.unsubscribe(function)
+                    except Exception:
+                        pass  # already unsubscribed
+        return owned
+
+    def report(self, total=None):
+        """Boot timing per module, slowest first"""
+        lines = ['Module boot times:']
+        for name, timing in sorted(self.timings.items(), key=lambda item: -(item[1]['duration'] or 0)):
+            duration = 'running' if timing['duration'] is None else f"{timing['duration'] * 1000:8.1f} ms"
+            imported = '-' if timing['import'] is None else f"{timing['import'] * 1000:.1f} ms"
+            notes = ' background' if timing['background'] else ''
+            notes += f" failed: {timing['error']}" if timing['error'] else ''
+            lines.append(f"  {name:<16} level {timing['level']}  start {timing['start'] * 1000:8.1f} ms  {duration} (import {imported}){notes}")
+        if total is not None:
+            lines.append(f"  Total {total * 1000:.1f} ms")
+        # Heavy dependencies that were needed during boot after all
+        for module, seconds in sorted(lazy.profile.items(), key=lambda item: -item[1]):
+            lines.append(f"  Lazy import {module}: {seconds * 1000:.1f} ms")
+        return '\n'.join(lines)
@@ -6,6 +6,7 @@ from time import sleep
 from pubsub import pub
 
 class Servo:
+    instances = {}  # name: Servo, used by 'servo:multi'
 
     def __init__(self, **kwargs):
         """
@@ -30,10 +31,15 @@ class Servo:
         
         Subscribes to 'servo:<name>:mv' to move servo to relative position
         - Argument: percentage (int) - percentage to move servo
+
+        Subscribes to 'servo:multi' to move several servos together (one serial order)
+        - Argument: targets (dict) - servo name: percentage
+        - Argument: relative (bool, optional) - True for relative moves
         
         Example:
         pub.sendMessage('servo:pan:mvabs', percentage=90)
         pub.sendMessage('servo:pan:mv', percentage=10)
+        pub.sendMessage('servo:multi', targets={'leg_l_hip': 20, 'leg_r_hip': 80})
         """
         self.pin = kwargs.get('pin')
         self.identifier = kwargs.get('name')
@@ -56,10 +62,33 @@ class Servo:
 
         pub.subscribe(self.move, 'servo:' + self.identifier + ':mvabs')
         pub.subscribe(self.move_relative, 'servo:' + self.identifier + ':mv')
+        if not Servo.instances:
+            pub.subscribe(Servo.move_multi, 'servo:multi')
+        Servo.instances[self.identifier] = self
 
     def __del__(self):
         pass #self.reset()
 
+    def reload(self, **kwargs):
+        """
+        Apply a changed config without moving the servo, used by ModuleLoader when config/servos.yml changes
+        :return: False if the servo has to be created again (name, id, pin or connection changed)
+        """
+        if (kwargs.get('name'), kwargs.get('id'), kwargs.get('pin'), kwargs.get('serial', True)) != \
+                (self.identifier, self.index, self.pin, self.serial):
+            return False
+        self.range = kwargs.get('range')
+        self.power = kwargs.get('power', False)
+        self.start = kwargs.get('start_pos', 50)
+        self.buffer = kwargs.get('buffer', 0)
+        self.delta = kwargs.get('delta', 1.5)
+        self.pos = min(self.range[1], max(self.range[0], self.pos))
+        return True
+
+    def exit(self):
+        if Servo.instances.get(self.identifier) is self:
+            del Servo.instances[self.identifier]
+
     def move_relative(self, percentage, safe=True):
         # Only calculate relative position if not using serial
         # Otherwise it is done by the arduino
@@ -94,6 +123,38 @@ class Servo:
             pub.sendMessage('log:error', '[Servo] Percentage %d out of range' % percentage)
             raise ValueError('Percentage %d out of range' % percentage)
 
+    @staticmethod
+    def move_multi(targets, relative=False):
+        """
+        Move several servos with a single serial order so they start together
+        Servos not connected over serial are moved individually.
+        :param targets: dict of servo name: percentage
+        :param relative: True for relative moves
+        """
+        identifiers = []
+        values = []
+        for name, percentage in targets.items():
+            servo = Servo.instances.get(name)
+            if servo is None:
+                pub.sendMessage('log:error', msg='[Servo] Unknown servo ' + str(name))
+                continue
+            if not servo.serial:
+                servo.move_relative(percentage) if relative else servo.move(percentage)
+                continue
+            if not relative:
+                servo.pos = min(servo.range[1], max(servo.range[0], servo.translate(percentage)))
+            identifiers.append(servo.index)
+            values.append(percentage)
+        if not identifiers:
+            return
+        powered = [Servo.instances[name] for name in targets if name in Servo.instances and Servo.instances[name].power]
+        if powered:
+            pub.sendMessage('power:use')
+        type = ArduinoSerial.DEVICE_SERVO_MULTI_RELATIVE if relative else ArduinoSerial.DEVICE_SERVO_MULTI
+        pub.sendMessage('serial', type=type, identifier=identifiers, message=values)
+        if powered and all(servo.pos == servo.start for servo in powered):
+            pub.sendMessage('power:release')
+
     def execute_move(self, sequence, is_relative=False):
         """
         Recursive function to handle each movement in sequence.
@@ -1,54 +1,208 @@
 import json
 import os.path
+import threading
+from collections import deque
+from time import monotonic
 from pubsub import pub
-from time import sleep
 from gpiozero import LED
 
 class Animate:
+    # Step kinds
+    MESSAGE = 0
+    PIN = 1
+    WAIT = 2
+
     def __init__(self, **kwargs):
         """
         Animation module to move servos in sequence
+        All animation files are compiled once at startup into a list of timed steps and recompiled when a file changes.
+        Playback runs on a timeline thread, so publishing 'animate' returns immediately.
         :kwarg path: path to animation files
-        
+        :kwarg priorities: dict of animation name: priority (default 0)
+
         Install: pip install gpiozero
-        
+
         Subscribes to 'animate' to start an animation
         - Argument: action (string) - name of animation file
-        
+        - Argument: priority (int, optional) - overrides the configured priority
+
+        An animation with a higher priority than the one playing interrupts it,
+        otherwise it is queued and played when the current animation ends.
+
+        Consecutive servo steps of the same kind are sent together with 'servo:multi' so the servos move in sync
+        Nested 'animate' steps are inlined when the file is compiled
+
+        Subscribes to 'animate:stop' to cancel the current animation and clear the queue
+
         Example:
         pub.sendMessage('animate', action='head_nod')
+        pub.sendMessage('animate', action='sleep', priority=10)
         """
         self.path = kwargs.get('path', os.path.dirname(os.path.realpath(__file__)) + '/../animations') + '/'
-        pub.subscribe(self.animate, "animate")
+        self.priorities = kwargs.get('priorities', {})
+        self.compiled = {}  # action: (mtimes, steps)
+        self.leds = {}
+        self.queue = deque()
+        self.current = None
+        self.current_priority = 0
+        self.lock = threading.Condition()
+        self.cancel = threading.Event()
+        self.exit_event = threading.Event()
+
+        for file in sorted(os.listdir(self.path)):
+            if file.endswith('.json'):
+                try:
+                    self.load(file[:-5])
+                except ValueError as e:
+                    pub.sendMessage('log:error', msg='[Animate] ' + str(e))
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        pub.subscribe(self.animate, 'animate')
+        pub.subscribe(self.stop, 'animate:stop')
+        pub.subscribe(self.exit, 'exit')
 
-    def animate(self, action):
+    def animate(self, action, priority=None):
         """
-        Move pan and tilt servos in sequence defined by given file
-        :param filename: animation file in path specified in init
+        Queue or start an animation
+        :param action: animation file in path specified in init
+        :param priority: higher priorities interrupt the current animation
+        """
+        steps = self.load(action)
+        if priority is None:
+            priority = self.priorities.get(action, 0)
+        with self.lock:
+            if self.current is not None and priority > self.current_priority:
+                # Preempt, anything queued behind the current animation still plays afterwards
+                self.queue.appendleft((action, steps, priority))
+                self.cancel.set()
+            else:
+                self.queue.append((action, steps, priority))
+            self.lock.notify()
+
+    def stop(self):
+        with self.lock:
+            self.queue.clear()
+            self.cancel.set()
+            self.lock.notify()
+
+    def exit(self):
+        self.exit_event.set()
+        self.stop()
+        self.thread.join(1)
+
+    def run(self):
+        while not self.exit_event.is_set():
+            with self.lock:
+                while not self.queue and not self.exit_event.is_set():
+                    self.lock.wait()
+                if self.exit_event.is_set():
+                    return
+                self.current, steps, self.current_priority = self.queue.popleft()
+                self.cancel.clear()
+            self.play(steps)
+            with self.lock:
+                self.current = None
+
+    def play(self, steps):
+        """Publish each step at its offset from the start, absolute deadlines so publishing time does not add up"""
+        start = monotonic()
+        for offset, kind, topic, arg in steps:
+            wait = start + offset - monotonic()
+            if wait > 0 and self.cancel.wait(wait):
+                return
+            if self.cancel.is_set():
+                return
+            if kind == Animate.MESSAGE:
+                pub.sendMessage(topic, **arg)
+            elif kind == Animate.PIN:
+                led = self.leds.get(arg)
+                if led is None:
+                    led = self.leds[arg] = LED(arg)
+                led.on() if topic == 'pin:high' else led.off()
+
+    def load(self, action):
+        """
+        Return the compiled steps for an animation, recompiling if it or a nested animation changed
+        :param action: animation name
+        :return: tuple of (offset, kind, topic, arg)
+        """
+        cached = self.compiled.get(action)
+        if cached is not None and all(self.mtime(name) == mtime for name, mtime in cached[0].items()):
+            return cached[1]
+        mtimes = {}
+        steps = []
+        end = self.compile(action, 0, steps, mtimes, ())
+        if not steps or end > steps[-1][0]:
+            # Keep a trailing sleep so a queued animation waits for it
+            steps.append((end, Animate.WAIT, None, None))
+        steps = tuple(steps)
+        self.compiled[action] = (mtimes, steps)
+        return steps
+
+    def mtime(self, action):
+        try:
+            return os.path.getmtime(self.path + action + '.json')
+        except OSError:
+            return None
+
+    def compile(self, action, offset, steps, mtimes, parents):
+        """
+        Flatten an animation file into timed steps, sleep steps are folded into the offsets
+        :param action: animation name
+        :param offset: start time of this animation within the compiled timeline
+        :param steps: list the (offset, kind, topic, arg) steps are appended to
+        :param mtimes: dict filled with the mtime of every file used, for invalidation
+        :param parents: names of the animations including this one, to catch loops
+        :return: end time of this animation
         """
         file = self.path + action + '.json'
         if not os.path.isfile(file):
             raise ValueError('Animation does not exist: ' + action)
+        if action in parents:
+            raise ValueError('Animation includes itself: ' + ' > '.join(parents + (action,)))
+        mtimes[action] = self.mtime(action)
 
         with open(file, 'r') as f:
             parsed = json.load(f)
 
+        batch = {}
+        batch_relative = False
         for step in parsed:
             cmd = list(step.keys())[0]
             args = list(step.values())
+            if cmd.startswith('servo:') and cmd.count(':') == 2 and cmd.split(':')[2] in ('mv', 'mvabs'):
+                name, kind = cmd.split(':')[1:]
+                relative = kind == 'mv'
+                if batch and (relative != batch_relative or name in batch):
+                    steps.append(Animate.servo_step(offset, batch, batch_relative))
+                    batch = {}
+                batch[name] = args[0]
+                batch_relative = relative
+                continue
+            if batch:
+                steps.append(Animate.servo_step(offset, batch, batch_relative))
+                batch = {}
             if 'servo:' in cmd:
-                pub.sendMessage(cmd, percentage=args[0])
+                steps.append((offset, Animate.MESSAGE, cmd, {'percentage': args[0]}))
             elif 'sleep' == cmd:
-                sleep(args[0])
+                offset += args[0]
             elif 'animate' == cmd:
-                pub.sendMessage(cmd, action=args[0])
+                offset = self.compile(args[0], offset, steps, mtimes, parents + (action,))
             elif 'led:' in cmd:
-                pub.sendMessage(cmd, color=args[0])
+                steps.append((offset, Animate.MESSAGE, cmd, {'color': args[0]}))
             elif 'speak' == cmd:
-                pub.sendMessage(cmd, message=args[0])
+                steps.append((offset, Animate.MESSAGE, cmd, {'message': args[0]}))
             elif 'pin' in cmd:
-                led = LED(args[0])
-                if 'pin:high' == cmd:
-                    led.on()
-                else:
-                    led.off()
+                steps.append((offset, Animate.PIN, cmd, args[0]))
+        if batch:
+            steps.append(Animate.servo_step(offset, batch, batch_relative))
+        return offset
+
+    @staticmethod
+    def servo_step(offset, targets, relative):
+        """Compile a group of servo steps, a single step keeps its own topic"""
+        if len(targets) == 1:
+            name, percentage = next(iter(targets.items()))
+            return (offset, Animate.MESSAGE, 'servo:' + name + (':mv' if relative else ':mvabs'), {'percentage': percentage})
+        return (offset, Animate.MESSAGE, 'servo:multi', {'targets': dict(targets), 'relative': relative})
@@ -1,9 +1,11 @@
 from pubsub import pub
 from time import sleep
-import pyttsx3
-
-from elevenlabs import ElevenLabs, VoiceSettings, play
 import os
+from modules.lazy import lazy_import
+
+# Only the configured service is imported
+pyttsx3 = lazy_import('pyttsx3')
+elevenlabs = lazy_import('elevenlabs')
 
 class TTS:
     
@@ -60,7 +62,7 @@ class TTS:
         self.engine.runAndWait()
     
     def init_elevenlabs(self, voice_id):
-        self.client = ElevenLabs(
+        self.client = elevenlabs.ElevenLabs(
             api_key=os.getenv('ELEVENLABS_KEY') or ''
         )
         self.voice_id = voice_id
@@ -72,14 +74,14 @@ class TTS:
             optimize_streaming_latency="0",
             output_format="mp3_22050_32",
             text="msg",
-            voice_settings=VoiceSettings(
+            voice_settings=elevenlabs.VoiceSettings(
                 stability=0.1,
                 similarity_boost=0.3,
                 style=0.2,
             ),
         )
 
-        play(output)
+        elevenlabs.play(output)
                 
 if __name__ == '__main__':
     tts = TTS()
@@ -1,6 +1,6 @@
 from random import randint, randrange
 from pubsub import pub
-from datetime import datetime, timedelta
+from time import monotonic
 
 from modules.config import Config
 
@@ -23,7 +23,7 @@ class Faces:
         if not self.face_detected:
             pub.sendMessage('log:info', msg='[Personality] Face detected: ' + str(name))
         self.face_detected = True
-        self.last_face = datetime.now()
+        self.last_face = monotonic()
         # self.state.set_state(Config.STATE_IDLE)
         self.state.set_eye('green')
         if name not in self.current_faces:
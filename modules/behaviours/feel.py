@@ -1,6 +1,5 @@
 from pubsub import pub
-from datetime import datetime, timedelta
-from random import randint, randrange
+from time import monotonic
 from modules.config import Config
 
 class Feel:
@@ -17,21 +16,53 @@ class Feel:
     BEHAVE_INTERVAL = 2
     OUTPUT_INTERVAL = 30
 
+    # Get gradually bored and tired, points lost per second
+    DECAY = {'attention': 0.75, 'happiness': 0.75, 'wakefulness': 0.15, 'contentment': 0.75}
+    # Values at which a feeling starts or stops while decaying, see evaluate()
+    THRESHOLDS = {'attention': (90, 30), 'happiness': (10,), 'wakefulness': (90, 20), 'contentment': (20,)}
+
     def __init__(self, state):
-        self.happiness = Feel.RANGE_MAX / 2
-        self.contentment = Feel.RANGE_MAX / 2
-        self.attention = Feel.RANGE_MAX / 2
-        self.wakefulness = Feel.RANGE_MAX / 2
+        """
+        Feelings decay continuously, the values are only worked out from the time passed when an input changes them
+        or when decay reaches the next threshold. The feelings are kept until then.
+
+        Publishes 'feel:changed' when the feelings change
+        - Argument: feelings (list) - current feelings, e.g. ['bored', 'tired']
+        - Argument: previous (list) - feelings before the change, empty at start
+        """
+        self.values = {name: Feel.RANGE_MAX / 2 for name in Feel.DECAY}
+        self.updated = monotonic()  # time the values were worked out
+        self.feelings = []
+        self.next_change = 0  # time decay can change the feelings, due at once to publish the first ones
 
         self.state = state  # the personality instance
         pub.subscribe(self.loop, 'loop:1')
-        pub.subscribe(self.feel, 'loop:10')
         pub.subscribe(self.loop_minute, 'loop:60')
         # pub.subscribe(self.face, 'vision:detect:face') # every loop if a face is detected
         # pub.subscribe(self.motion, 'motion') # every second when detected
         pub.subscribe(self.speech, 'speech') # Speech input detected
         pub.subscribe(self.puppet, 'puppet')  # Being puppeteered
 
+    @property
+    def attention(self):
+        return self.value('attention')
+
+    @property
+    def happiness(self):
+        return self.value('happiness')
+
+    @property
+    def wakefulness(self):
+        return self.value('wakefulness')
+
+    @property
+    def contentment(self):
+        return self.value('contentment')
+
+    def value(self, name, now=None):
+        elapsed = (monotonic() if now is None else now) - self.updated
+        return self.limit(self.values[name] - Feel.DECAY[name] * elapsed)
+
     def loop(self):
 
         # Throttle face detection behaviour to every second, rather than every loop
@@ -42,13 +73,9 @@ class Feel:
         if self.state.behaviours.motion.is_motion():
             self.input(Feel.INPUT_TYPE_COMPANY)
 
-    def feel(self):
-        # Get gradually bored and tired
-        self.attention = self.limit(self.attention - randint(5,10))
-        self.happiness = self.limit(self.happiness - randint(5, 10))
-        self.wakefulness = self.limit(self.wakefulness - randint(1, 2))
-        self.contentment = self.limit(self.contentment - randint(5, 10))
-        # print(f'[Feelings] {str(self.attention)} {str(self.happiness)} {str(self.wakefulness)} {str(self.contentment)}')
+        now = monotonic()
+        if now >= self.next_change:
+            self.update(now)
 
     def loop_minute(self):
         # print(f"[Feelings] {str(self.attention)} {str(self.happiness)} {str(self.wakefulness)} {str(self.contentment)}")
@@ -57,61 +84,87 @@ class Feel:
         pub.sendMessage('led', identifiers='status4', color=self.happiness, gradient='bg')
 
     def get_feelings(self):
+        now = monotonic()
+        if now >= self.next_change:
+            self.update(now)
+        return self.feelings
+
+    def evaluate(self, values):
         feelings = []
-        if self.attention > 90 and self.wakefulness > 90:
+        if values['attention'] > 90 and values['wakefulness'] > 90:
             feelings.append('excited')
-        if self.happiness < 10:
+        if values['happiness'] < 10:
             feelings.append('sad')
-        if self.attention < 30:
+        if values['attention'] < 30:
             feelings.append('bored')
-        if self.wakefulness < 20:
+        if values['wakefulness'] < 20:
             feelings.append('tired')
-        if self.wakefulness < 0:
+        if values['wakefulness'] < 0:
             feelings.append('asleep')
-        if self.contentment < 20:
+        if values['contentment'] < 20:
             feelings.append('restless')
         if len(feelings) == 0:
             feelings.append('ok')
         return feelings
 
+    def update(self, now):
+        """Work out the values at now, publish the feelings if they changed and find when decay changes them next"""
+        self.values = {name: self.value(name, now) for name in self.values}
+        self.updated = now
+        feelings = self.evaluate(self.values)
+        # The time the first value decays past one of its thresholds
+        wait = min(((value - threshold) / Feel.DECAY[name] for name, value in self.values.items()
+                    for threshold in Feel.THRESHOLDS[name] if value >= threshold), default=None)
+        self.next_change = float('inf') if wait is None else now + wait
+        if feelings != self.feelings:
+            previous, self.feelings = self.feelings, feelings
+            pub.sendMessage('feel:changed', feelings=feelings, previous=previous)
+
     def input(self, input_type):
         # print('Feeling input: ' + str(input_type))
+        now = monotonic()
+        self.values = {name: self.value(name, now) for name in self.values}
+        self.updated = now
+        values = self.values
         if input_type == Feel.INPUT_TYPE_INTERESTING:
             # Should make me more attentive and wake me up a little
-            self.attention = Feel.RANGE_MAX
-            self.happiness += 10
-            self.wakefulness += 10
-            self.contentment += 30
+            values['attention'] = Feel.RANGE_MAX
+            values['happiness'] += 10
+            values['wakefulness'] += 10
+            values['contentment'] += 30
         elif input_type == Feel.INPUT_TYPE_COMPANY:
             # Has to keep me awake a little, otherwise nothing wakes me up again!
-            self.happiness += 10
-            self.wakefulness += 5
-            self.contentment += 10
+            values['happiness'] += 10
+            values['wakefulness'] += 5
+            values['contentment'] += 10
         elif input_type == Feel.INPUT_TYPE_SCARY:
             # Should make me more attentive, but less content and happy
-            self.attention = Feel.RANGE_MAX
-            self.happiness -= 20
-            self.wakefulness += 50
-            self.contentment -= 30
+            values['attention'] = Feel.RANGE_MAX
+            values['happiness'] -= 20
+            values['wakefulness'] += 50
+            values['contentment'] -= 30
         elif input_type == Feel.INPUT_TYPE_FUN:
             # Should make me much happer and attentive, wake me up and make me feel more content
-            self.attention += 50
-            self.happiness += 50
-            self.wakefulness += 50
-            self.contentment += 50
+            values['attention'] += 50
+            values['happiness'] += 50
+            values['wakefulness'] += 50
+            values['contentment'] += 50
         elif input_type == Feel.INPUT_TYPE_STARTLING:
             # Should make me more attentive and awake, but less content and happy
-            self.attention = Feel.RANGE_MAX
-            self.happiness -= 40
-            self.wakefulness = Feel.RANGE_MAX
-            self.contentment -= 10
+            values['attention'] = Feel.RANGE_MAX
+            values['happiness'] -= 40
+            values['wakefulness'] = Feel.RANGE_MAX
+            values['contentment'] -= 10
         elif input_type == Feel.INPUT_TYPE_MAX:
             # Should make me more attentive and awake, but less content and happy
-            self.attention = Feel.RANGE_MAX
-            self.happiness =  Feel.RANGE_MAX
-            self.wakefulness = Feel.RANGE_MAX
-            self.contentment =  Feel.RANGE_MAX
-        # print(str(self.attention) + ' ' + str(self.happiness) + ' ' + str(self.wakefulness) + ' ' + str(self.contentment))
+            values['attention'] = Feel.RANGE_MAX
+            values['happiness'] =  Feel.RANGE_MAX
+            values['wakefulness'] = Feel.RANGE_MAX
+            values['contentment'] =  Feel.RANGE_MAX
+        # print(str(values['attention']) + ' ' + str(values['happiness']) + ' ' + str(values['wakefulness']) + ' ' + str(values['contentment']))
+        for name, value in values.items():
+            values[name] = self.limit(value)
+        self.update(now)
 
     @staticmethod
     def limit(val):
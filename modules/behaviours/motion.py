@@ -1,21 +1,21 @@
 from random import randint, randrange
 from pubsub import pub
-from datetime import datetime, timedelta
+from time import monotonic
 
 from modules.config import Config
 
 class Motion:
     def __init__(self, state):
         self.state = state # the personality instance
-        self.last_motion = datetime.now()
+        self.last_motion = monotonic()
         pub.subscribe(self.motion, 'motion')
 
     def motion(self):
-        self.last_motion = datetime.now()
+        self.last_motion = monotonic()
         # print(self.last_motion)
         if not self.state.behaviours.faces.face_detected and self.state.lt(self.state.behaviours.faces.last_face, self.state.past(2)):
             self.state.set_eye('blue')
             pub.sendMessage('vision:start')
 
     def is_motion(self):
-        return not self.state.lt(self.state.behaviours.motion.last_motion, self.state.past(2))
\ No newline at end of file
+        return monotonic() - self.last_motion <= 2
\ No newline at end of file
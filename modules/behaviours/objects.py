@@ -1,6 +1,6 @@
 from random import randint, randrange
 from pubsub import pub
-from datetime import datetime, timedelta
+from time import monotonic
 
 from modules.config import Config
 
@@ -21,6 +21,6 @@ class Objects:
         if not self.is_detected:
             pub.sendMessage('log:info', msg='[Personality] Object detected: ' + name)
         self.is_detected = True
-        self.last_detection = datetime.now()
+        self.last_detection = monotonic()
         # self.state.set_state(Config.STATE_IDLE)
         self.state.set_eye('purple')
@@ -2,9 +2,10 @@ from pubsub import pub
 from time import sleep, localtime
 from modules.config import Config
 from random import randrange
+from modules.lazy import lazy_import
 
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
+nltk = lazy_import('nltk')
+vader = lazy_import('nltk.sentiment.vader')
 
 class Sentiment:
 
@@ -12,10 +13,8 @@ class Sentiment:
         
         self.state = state  # the personality instance
         pub.subscribe(self.speech, 'speech')
-        # Do this the first time
-        nltk.download('vader_lexicon')
-        # initialize NLTK sentiment analyzer
-        self.analyzer = SentimentIntensityAnalyzer()
+        # NLTK sentiment analyzer, loaded on first use
+        self.analyzer = None
 
     def speech(self, text):
         if self.state.is_resting():
@@ -24,6 +23,10 @@ class Sentiment:
         pub.sendMessage('sentiment', score=score)
         
     def get_sentiment(self, text):
+        if self.analyzer is None:
+            # Do this the first time
+            nltk.download('vader_lexicon')
+            self.analyzer = vader.SentimentIntensityAnalyzer()
         scores = self.analyzer.polarity_scores(text)
         pub.sendMessage('log', msg='[Sentiment] ' + str(scores))
         return scores['compound']
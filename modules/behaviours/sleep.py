@@ -1,5 +1,4 @@
 from pubsub import pub
-from time import sleep, localtime
 from modules.config import Config
 class Sleep:
     SLEEP_TIMEOUT = 2 * 60
@@ -7,26 +6,39 @@ class Sleep:
 
     def __init__(self, state):
         self.state = state  # the personality instance
-        pub.subscribe(self.loop, 'loop:1')
+        pub.subscribe(self.changed, 'feel:changed')
+        # Morning can wake it without a change of feelings
+        pub.subscribe(self.loop_minute, 'loop:60')
 
-    def loop(self):
-        if self.state.is_asleep():
-            sleep(5)
+    def changed(self, feelings, previous):
+        self.decide(feelings)
 
+    def loop_minute(self):
+        self.decide(self.state.behaviours.feel.get_feelings())
+
+    def decide(self, feelings):
+        # Each state can lead to another (sleeping -> resting -> idle), follow them until the state settles
+        for _ in range(4):
+            state = self.state.state
+            self.transition(feelings)
+            if self.state.state == state:
+                break
+
+    def transition(self, feelings):
         # if sleeping and not tired, then wake (during the day)
-        if self.state.is_asleep() and not Config.is_night() and 'tired' not in self.state.behaviours.feel.get_feelings():
+        if self.state.is_asleep() and not Config.is_night() and 'tired' not in feelings:
             self.state.set_state(Config.STATE_RESTING)
 
         # if not sleeping tired, sleep
-        elif not self.state.is_asleep() and 'tired' in self.state.behaviours.feel.get_feelings():
+        elif not self.state.is_asleep() and 'tired' in feelings:
             self.state.set_state(Config.STATE_SLEEPING)
 
         # if not resting and bored, rest
-        elif not self.state.is_resting() and 'bored' in self.state.behaviours.feel.get_feelings():
+        elif not self.state.is_resting() and 'bored' in feelings:
             self.state.set_state(Config.STATE_RESTING)
 
-        elif 'ok' in self.state.behaviours.feel.get_feelings():
+        elif 'ok' in feelings:
             self.state.set_state(Config.STATE_IDLE)
 
-        elif 'excited' in self.state.behaviours.feel.get_feelings():
-            self.state.set_state(Config.STATE_ALERT)
\ No newline at end of file
+        elif 'excited' in feelings:
+            self.state.set_state(Config.STATE_ALERT)
@@ -2,8 +2,9 @@ from pubsub import pub
 from time import sleep
 import os
 import re
+from modules.lazy import lazy_import
 
-from openai import OpenAI
+openai = lazy_import('openai')
 
 class ChatGPT:
     def __init__(self, **kwargs):
@@ -26,7 +27,7 @@ class ChatGPT:
         """
         self.persona = kwargs.get('persona', 'You are a helpful assistant. You respond with short phrases where possible.')
         self.model = kwargs.get('model', 'gpt-4o-mini')
-        self.client = OpenAI()
+        self.client = None  # created on the first message
         pub.subscribe(self.completion, 'speech')
         
     def completion(self, text):
@@ -38,6 +39,8 @@ class ChatGPT:
         Publishes 'animate' with head nod or shake
         Publishes 'tts' with response
         """
+        if self.client is None:
+            self.client = openai.OpenAI()
         completion = self.client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
@@ -1,15 +1,149 @@
 #! /usr/bin/python
 from time import localtime
+from types import MappingProxyType
+from collections.abc import Mapping
 import yaml
+from pubsub import pub
 import glob
 import json
+import os
+import pickle
+import sys
+
+def freeze(value):
+    """Read-only copy of parsed yaml, dicts become mapping proxies and lists become tuples"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def thaw(value):
+    """Plain dicts and lists again, for printing or editing"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+class Snapshot:
+    CACHE_FILE = '.config_cache.pickle'
+    snapshots = {}
+
+    def __init__(self, files, key=None):
+        """
+        Snapshot class
+        Read-only view of every yaml file in the config folder, parsed once per process.
+        The parsed files are cached next to them and reused while no file was added, removed or changed (mtime and size).
+        :param files: dict of file path: parsed yaml
+        :param key: fingerprint of the files when they were parsed, see fingerprint()
+
+        Example:
+        snapshot = Snapshot.load('config')
+        snapshot.config['servos']['path']
+        for file, sections in snapshot.files.items(): ...
+        """
+        self.files = freeze(files)
+        self.key = key
+        merged = {}
+        for sections in files.values():
+            merged.update(sections)
+        self.config = freeze(merged)
+
+    @staticmethod
+    def load(folder='config'):
+        """
+        :return: the Snapshot of a folder, shared by all callers in this process
+        """
+        snapshot = Snapshot.snapshots.get(folder)
+        if snapshot is None:
+            # Fingerprint first, a file changed while parsing is then picked up by the next reload
+            key = Snapshot.fingerprint(folder)
+            snapshot = Snapshot.snapshots[folder] = Snapshot(Snapshot.parse(folder), key)
+        return snapshot
+
+    @staticmethod
+    def reload(folder='config'):
+        """
+        Parse the folder again if a file was added, removed or changed since its shared Snapshot was made
+        :return: the new shared Snapshot, or None if nothing changed
+        """
+        key = Snapshot.fingerprint(folder)
+        if key == Snapshot.load(folder).key:
+            return None
+        snapshot = Snapshot.snapshots[folder] = Snapshot(Snapshot.parse(folder), key)
+        return snapshot
+
+    @staticmethod
+    def fingerprint(folder):
+        """
+        :return: list of (file, mtime, size) of the yaml files in the folder
+        """
+        key = []
+        for file in sorted(glob.glob(os.path.join(folder, '*.yml'))):
+            stat = os.stat(file)
+            key.append((file, stat.st_mtime_ns, stat.st_size))
+        return key
+
+    @staticmethod
+    def parse(folder):
+        """
+        :return: dict of file path: parsed yaml, from the cache when it is up to date
+        """
+        key = Snapshot.fingerprint(folder)
+        files = [file for file, _, _ in key]
+        cache = os.path.join(folder, Snapshot.CACHE_FILE)
+        try:
+            with open(cache, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['key'] == key:
+                return cached['files']
+        except Exception:
+            pass  # missing, outdated format or corrupt, parse again
+
+        parsed = {}
+        for file in files:
+            with open(file, 'r') as stream:
+                try:
+                    parsed[file] = yaml.safe_load(stream) or {}
+                except yaml.YAMLError as e:
+                    print(f"Error loading {file}: {e}")
+                    parsed[file] = {}
+        try:
+            with open(cache + '.tmp', 'wb') as f:
+                pickle.dump({'key': key, 'files': parsed}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache + '.tmp', cache)
+        except OSError:
+            pass  # read-only folder, parse every time
+        return parsed
+
+    def dependencies(self):
+        """
+        Dependencies of the enabled modules, one line each as used by install.sh
+        MODULE:<config file name>, PYTHON:<package>, UNIX:<package> or ADDITIONAL:<config file name>:<url>
+        """
+        for file, sections in self.files.items():
+            module_name = os.path.basename(file).replace('.yml', '')
+            for section in sections.values():
+                if isinstance(section, Mapping) and section.get('enabled', False) and 'dependencies' in section:
+                    yield f"MODULE:{module_name}"
+                    for dep_type, deps in section['dependencies'].items():
+                        if dep_type == 'python':
+                            for dep in deps:
+                                yield f"PYTHON:{dep}"
+                        elif dep_type == 'unix':
+                            for dep in deps:
+                                yield f"UNIX:{dep}"
+                        elif dep_type == 'additional':
+                            for url in deps:
+                                yield f"ADDITIONAL:{module_name}:{url}"
 
 class Config:
-    # Load all yaml files in config folder
-    config = dict()
-    for file in glob.glob("config/*.yml"):
-        config.update(yaml.safe_load(open(file)))
-        
+    # All yaml files in config folder, merged into one read-only snapshot
+    snapshot = Snapshot.load('config')
+    config = snapshot.config
+
+    
     @staticmethod
     def get(key):
         return Config.get(key, None)
@@ -85,6 +219,7 @@ class Config:
 
     @staticmethod
     def exit(signum, frame):
+        pub.sendMessage('flightrecorder:dump', reason='SIGTERM')
         raise Exception('Exit command received!')
 
     @staticmethod
@@ -96,6 +231,10 @@ class Config:
 
 # if main
 if __name__ == "__main__":
-    c = Config()
-    print(json.dumps(Config.config, indent=2))
-    print('Pins: ' + str(Config.get_all_pins()))
+    if '--dependencies' in sys.argv:
+        # Used by install.sh
+        for line in Config.snapshot.dependencies():
+            print(line)
+    else:
+        print(json.dumps(thaw(Config.config), indent=2))
+        print('Pins: ' + str(Config.get_all_pins()))
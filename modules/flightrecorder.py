@@ -0,0 +1,175 @@
+import itertools
+import json
+import struct
+import sys
+import threading
+from time import monotonic
+
+import numpy as np
+from pubsub import pub
+
+def summarize(data, width):
+    """
+    Short description of a message's arguments, values that are not numbers or strings are only described by type and length
+    :return: bytes of at most about width characters
+    """
+    parts = []
+    length = 0
+    for key, value in data.items():
+        if isinstance(value, float):
+            text = f'{value:.4g}'
+        elif isinstance(value, (bool, int)) or value is None:
+            text = str(value)
+        elif isinstance(value, str):
+            text = value[:width]
+        elif isinstance(value, (list, tuple, dict, set)):
+            text = f'{type(value).__name__}[{len(value)}]'
+        else:
+            text = type(value).__name__
+        parts.append(f'{key}={text}')
+        length += len(key) + len(text) + 2
+        if length >= width:
+            break
+    return ' '.join(parts).encode('utf-8', 'replace')
+
+class FlightRecorder:
+    MAGIC = b'FLRC'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHIIdI')  # magic, version, records, width, dump time, metadata length
+
+    def __init__(self, **kwargs):
+        """
+        FlightRecorder class
+        Keeps the most recent pubsub messages in a preallocated ring buffer so the events that led up to a crash can be read back.
+        Each message costs a few array writes: the topic as a number, the monotonic time and a short summary of its arguments.
+        The buffer is written to a binary file when an exception reaches main, on SIGTERM, when a thread dies
+        or on request. Nothing is written if no message was recorded since the last dump.
+        :param kwargs: size, width, path, exclude
+        :param size: number of messages kept
+        :param width: bytes kept of each message summary
+        :param path: file the buffer is written to
+        :param exclude: topics that are not recorded
+
+        Subscribes to all topics to record them
+
+        Subscribes to 'flightrecorder:dump' to write the buffer to a file
+        - Argument: reason (string, optional) - stored in the file
+        - Argument: filename (string, optional) - defaults to path
+
+        Example:
+        pub.sendMessage('flightrecorder:dump', reason='manual')
+
+        Decode a dump:
+        python -m modules.flightrecorder flightrecorder.bin
+        """
+        self.size = kwargs.get('size', 4096)
+        self.width = kwargs.get('width', 64)
+        self.path = kwargs.get('path', 'flightrecorder.bin')
+        self.exclude = set(kwargs.get('exclude', ['loop'])) | {'flightrecorder:dump'}
+        self.times = np.zeros(self.size, dtype=np.float64)
+        self.topics = np.zeros(self.size, dtype=np.uint16)
+        self.summaries = np.zeros(self.size, dtype=f'S{self.width}')
+        self.counter = itertools.count()
+        self.recorded = 0
+        self.dumped = 0
+        self.topic_ids = {}  # topic: index in topic_names, -1 if excluded
+        self.topic_names = []
+        self.lock = threading.Lock()
+
+        self.excepthook = threading.excepthook
+        threading.excepthook = self.thread_exception
+
+        pub.subscribe(self.record, pub.ALL_TOPICS)
+        pub.subscribe(self.dump, 'flightrecorder:dump')
+
+    def register(self, topic):
+        with self.lock:
+            name = topic.getName()
+            if name in self.exclude:
+                topic_id = -1
+            else:
+                topic_id = len(self.topic_names)
+                self.topic_names.append(name)
+            self.topic_ids[topic] = topic_id
+            return topic_id
+
+    def record(self, topic=pub.AUTO_TOPIC, **data):
+        topic_id = self.topic_ids.get(topic)
+        if topic_id is None:
+            topic_id = self.register(topic)
+        if topic_id < 0:
+            return
+        index = next(self.counter)
+        slot = index % self.size
+        self.times[slot] = monotonic()
+        self.topics[slot] = topic_id
+        self.summaries[slot] = summarize(data, self.width)
+        self.recorded = max(self.recorded, index + 1)
+
+    def dump(self, reason='request', filename=None):
+        """
+        Write the buffer, oldest message first
+        :return: the file written, or None if nothing was recorded since the last dump
+        """
+        recorded = self.recorded
+        if recorded == self.dumped:
+            return None
+        filename = filename or self.path
+        count = min(recorded, self.size)
+        order = np.arange(recorded - count, recorded) % self.size
+        metadata = json.dumps({'reason': reason, 'topics': self.topic_names}).encode('utf-8')
+        with open(filename, 'wb') as f:
+            f.write(FlightRecorder.HEADER.pack(FlightRecorder.MAGIC, FlightRecorder.VERSION, count, self.width, monotonic(), len(metadata)))
+            f.write(metadata)
+            f.write(self.times[order].tobytes())
+            f.write(self.topics[order].tobytes())
+            f.write(self.summaries[order].tobytes())
+        pub.sendMessage('log', msg='[FlightRecorder] %d messages written to %s (%s)', args=(count, filename, reason))
+        # The log message above does not count as a change
+        self.dumped = self.recorded
+        return filename
+
+    def thread_exception(self, args):
+        self.dump(reason=f'{args.exc_type.__name__} in thread {args.thread.name if args.thread else ""}')
+        self.excepthook(args)
+
+    @staticmethod
+    def load(filename):
+        """
+        Read a dump
+        :return: dict with reason, time of the dump and records as a list of (time, topic, summary)
+        """
+        with open(filename, 'rb') as f:
+            data = f.read()
+        magic, version, count, width, time, length = FlightRecorder.HEADER.unpack_from(data)
+        if magic != FlightRecorder.MAGIC or version != FlightRecorder.VERSION:
+            raise ValueError('Not a flight recorder file: ' + filename)
+        offset = FlightRecorder.HEADER.size
+        metadata = json.loads(data[offset:offset + length])
+        offset += length
+        times = np.frombuffer(data, dtype=np.float64, count=count, offset=offset)
+        offset += times.nbytes
+        topics = np.frombuffer(data, dtype=np.uint16, count=count, offset=offset)
+        offset += topics.nbytes
+        summaries = np.frombuffer(data, dtype=f'S{width}', count=count, offset=offset)
+        names = metadata['topics']
+        return {
+            'reason': metadata['reason'],
+            'time': time,
+            'records': [(t, names[topic], summary.decode('utf-8', 'replace'))
+                        for t, topic, summary in zip(times.tolist(), topics.tolist(), summaries.tolist())]
+        }
+
+def main(argv):
+    """Print a dump as a timeline, times are seconds before the dump"""
+    if len(argv) != 2:
+        print('Usage: python -m modules.flightrecorder <file>')
+        return 1
+    dump = FlightRecorder.load(argv[1])
+    print(f"Reason: {dump['reason']}, {len(dump['records'])} messages")
+    for time, topic, summary in dump['records']:
+        print(f"{time - dump['time']:+11.3f}s  {topic:<28} {summary}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,153 @@
+import json
+import threading
+from collections import deque
+from time import perf_counter
+from pubsub import pub
+from pubsub.core.listener import Listener
+
+class ListenerStats:
+    __slots__ = ('count', 'errors', 'total', 'self_total', 'max', 'samples')
+
+    def __init__(self, samples):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.self_total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=samples)
+
+    def add(self, elapsed, self_time, error):
+        self.count += 1
+        self.total += elapsed
+        self.self_total += self_time
+        self.max = max(self.max, elapsed)
+        self.samples.append(elapsed)
+        if error:
+            self.errors += 1
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_ms': round(self.total * 1000, 3),
+            'self_ms': round(self.self_total * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+            'p50_ms': round(ListenerStats.percentile(ordered, 50) * 1000, 3),
+            'p95_ms': round(ListenerStats.percentile(ordered, 95) * 1000, 3),
+            'p99_ms': round(ListenerStats.percentile(ordered, 99) * 1000, 3)
+        }
+
+    @staticmethod
+    def percentile(ordered, pct):
+        """Nearest-rank percentile of an already sorted list"""
+        if not ordered:
+            return 0.0
+        index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+class Instrumentation:
+    def __init__(self, **kwargs):
+        """
+        Instrumentation class
+        Opt-in profiler for the pubsub bus. Every listener registered through pub.subscribe is timed
+        and call counts, latency percentiles and exceptions are recorded per topic and listener.
+        Latency is inclusive of any messages sent by the listener, self time excludes them.
+        :param kwargs: samples, top, report_topic, path
+        :param samples: number of latency samples kept per listener for percentiles
+        :param top: number of listeners included in the periodic summary
+        :param report_topic: topic that triggers the summary (default 'loop:60')
+        :param path: default file for 'instrumentation:dump'
+
+        Subscribes to 'instrumentation:dump' to write all stats to a JSON file
+        - Argument: filename (string, optional) - defaults to path
+
+        Subscribes to 'instrumentation:reset' to clear recorded stats
+
+        Publishes 'instrumentation:summary' on each report_topic
+        - Argument: summary (list) - slowest listeners by total time
+
+        Example:
+        pub.sendMessage('instrumentation:dump', filename='bus_profile.json')
+        pub.subscribe(handler, 'instrumentation:summary')
+        """
+        self.samples = kwargs.get('samples', 1000)
+        self.top = kwargs.get('top', 10)
+        self.path = kwargs.get('path', 'instrumentation.json')
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.original_call = None
+        self.install()
+
+        pub.subscribe(self.report, kwargs.get('report_topic', 'loop:60'))
+        pub.subscribe(self.dump, 'instrumentation:dump')
+        pub.subscribe(self.reset, 'instrumentation:reset')
+        pub.subscribe(self.uninstall, 'exit')
+
+    def install(self):
+        """Wrap pypubsub's Listener so that every delivery to a subscribed callable is timed"""
+        if self.original_call is not None:
+            return
+        original = self.original_call = Listener.__call__
+        instrumentation = self
+
+        def timed_call(listener, kwargs, actualTopic, allKwargs=None):
+            return instrumentation.call(original, listener, kwargs, actualTopic, allKwargs)
+
+        Listener.__call__ = timed_call
+
+    def uninstall(self):
+        if self.original_call is not None:
+            Listener.__call__ = self.original_call
+            self.original_call = None
+
+    def call(self, original, listener, kwargs, topic, all_kwargs):
+        # Per-thread stack of time spent in nested listeners, used to calculate self time
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(0.0)
+        error = False
+        start = perf_counter()
+        try:
+            return original(listener, kwargs, topic, all_kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.record(topic.getName(), listener.typeName(), elapsed, elapsed - nested, error)
+
+    def record(self, topic, listener, elapsed, self_time, error):
+        key = (topic, listener)
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = ListenerStats(self.samples)
+            stats.add(elapsed, self_time, error)
+
+    def summary(self, limit=None):
+        with self.lock:
+            items = [dict(topic=topic, listener=listener, **stats.summary()) for (topic, listener), stats in self.stats.items()]
+        items.sort(key=lambda item: item['total_ms'], reverse=True)
+        return items[:limit] if limit else items
+
+    def report(self):
+        summary = self.summary(self.top)
+        pub.sendMessage('instrumentation:summary', summary=summary)
+        for item in summary[:3]:
+            pub.sendMessage('log', msg='[Instrumentation] ' + item['topic'] + ' -> ' + item['listener'] + ': ' + str(item['count']) + ' calls, p95 ' + str(item['p95_ms']) + 'ms, max ' + str(item['max_ms']) + 'ms, errors ' + str(item['errors']))
+
+    def dump(self, filename=None):
+        filename = filename or self.path
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        pub.sendMessage('log', msg='[Instrumentation] Stats written to ' + filename)
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
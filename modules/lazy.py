@@ -0,0 +1,44 @@
+import importlib
+import threading
+from time import perf_counter
+
+# module name: seconds it took to import, for every lazy import that has been loaded
+profile = {}
+
+class LazyModule:
+    def __init__(self, name):
+        """
+        LazyModule class
+        Stands in for a heavy optional dependency and imports it the first time one of its attributes is used,
+        so modules that are configured but never used do not pay for the import at startup.
+
+        Example:
+        transformers = lazy_import('transformers')
+        classifier = transformers.pipeline('text-classification')  # imported here
+        """
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = perf_counter()
+                    module = importlib.import_module(self._name)
+                    profile[self._name] = perf_counter() - start
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}' ({'loaded' if self._module is not None else 'not loaded'})>"
+
+def lazy_import(name):
+    """
+    :param name: full module name, e.g. 'nltk.sentiment.vader'
+    :return: LazyModule that imports name on first use
+    """
+    return LazyModule(name)
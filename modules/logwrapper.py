@@ -1,38 +1,99 @@
+import gzip
 import logging
-from pubsub import pub
+import logging.handlers
 import os
+import queue
+import shutil
+import threading
+from time import monotonic
+from pubsub import pub
 # from viam.logging import getLogger
 # LOGGER = getLogger(__name__)
 # LOGGER.debug('INIT MAKERFORGE LOGGER')
 
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The record stays in this process, so leave msg % args for the writer thread
+        return record
+
+class TranslateHandler(logging.Handler):
+    def __init__(self, translator):
+        super().__init__()
+        self.translator = translator
+
+    def emit(self, record):
+        if self.translator is not None:
+            self.translator.request(record.getMessage())
+
 class LogWrapper:
     levels = ['notset', 'debug', 'info', 'warning', 'error', 'critical']
+    FORMAT = '%(levelname)s: %(asctime)s %(message)s'
+    DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
 
     def __init__(self, **kwargs):
         """
         LogWrapper class
-        :param kwargs: path, filename, translator
-        
+        Log calls only put a record on a queue, a background thread formats it, writes it to the log file
+        and translates it. The message is formatted with its args on that thread, and only if the level is enabled.
+        The file is rotated by size and old files are compressed.
+        Each tag (the '[Module]' prefix of a message) may log at most rate messages per second with bursts of burst,
+        the number of dropped messages is logged once the tag is allowed again. Errors are never dropped.
+        :param kwargs: path, filename, translator, level, max_bytes, backup_count, rate, burst
+        :param path: folder of the log file
+        :param filename: name of the log file
+        :param translator: Translator instance, messages are translated on the background thread
+        :param level: lowest level logged (debug, info, warning, error, critical)
+        :param max_bytes: size at which the log file is rotated
+        :param backup_count: number of compressed log files kept
+        :param rate: messages per second allowed per tag
+        :param burst: messages a tag may log at once before the rate applies
+
         Install: pip install pubsub
-        
+
         Subscribes to 'log' to log messages
         - Argument: type (string) - log level
-        - Argument: msg (string) - message to log
-        
+        - Argument: msg (string) - message to log, may contain % placeholders
+        - Argument: args (tuple, optional) - values for the placeholders in msg
+
+        Subscribes to 'exit' to write the remaining messages and stop the background thread
+
         Example:
         pub.sendMessage('log', type='info', msg='This is an info message')
+        pub.sendMessage('log', msg='[Serial] Sent %s to %s', args=(value, identifier))
         pub.sendMessage('log:debug', msg='This is a debug message')
         pub.sendMessage('log:info', msg='This is an info message')
         pub.sendMessage('log:error', msg='This is an error message')
         pub.sendMessage('log:critical', msg='This is a critical message')
         pub.sendMessage('log:warning', msg='This is a warning message')
-        
+
         """
         self.path = kwargs.get('path', '/')
         self.filename = kwargs.get('filename', 'app.log')
         self.file = self.path + '/' + self.filename
-        
-        self.translator = kwargs.get('translator', None)
+        self.rate = kwargs.get('rate', 10)
+        self.burst = kwargs.get('burst', 20)
+        self.buckets = {}  # tag: [tokens, last time, dropped]
+        self.bucket_lock = threading.Lock()
+
+        self.logger = logging.getLogger()
+        self.logger.setLevel(LogWrapper.levels.index(kwargs.get('level', 'info')) * 10)
+
+        formatter = logging.Formatter(LogWrapper.FORMAT, datefmt=LogWrapper.DATE_FORMAT)
+        file_handler = logging.handlers.RotatingFileHandler(self.file, maxBytes=kwargs.get('max_bytes', 1024 * 1024),
+                                                            backupCount=kwargs.get('backup_count', 3))
+        file_handler.namer = LogWrapper.namer
+        file_handler.rotator = LogWrapper.rotator
+        file_handler.setFormatter(formatter)
+        self.translate_handler = TranslateHandler(kwargs.get('translator', None))
+        self.handlers = [file_handler, self.translate_handler]
+
+        self.queue = queue.SimpleQueue()
+        self.queue_handler = DeferredQueueHandler(self.queue)
+        for handler in self.logger.handlers[:]:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self.queue_handler)
+        self.listener = logging.handlers.QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
 
         pub.subscribe(self.log, 'log', type='info')
         pub.subscribe(self.log, 'log:debug', type='debug')
@@ -40,21 +101,75 @@ class LogWrapper:
         pub.subscribe(self.log, 'log:error', type='error')
         pub.subscribe(self.log, 'log:critical', type='critical')
         pub.subscribe(self.log, 'log:warning', type='warning')
+        pub.subscribe(self.exit, 'exit')
+
+    @property
+    def translator(self):
+        return self.translate_handler.translator
+
+    @translator.setter
+    def translator(self, translator):
+        self.translate_handler.translator = translator
+
+    @staticmethod
+    def namer(name):
+        return name + '.gz'
+
+    @staticmethod
+    def rotator(source, dest):
+        with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
 
-    def __del__(self):
-        if os.path.isfile(self.file):
-            os.rename(self.file, self.file + '.previous')
+    def exit(self):
+        """Write what is queued, later messages are written directly"""
+        if self.listener is None:
+            return
+        self.listener.stop()
+        self.listener = None
+        self.logger.removeHandler(self.queue_handler)
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
 
-    def log(self, type, msg):
+    def allow(self, msg):
+        """
+        Token bucket per tag
+        :return: number of messages dropped since the tag was last allowed, or None to drop this one
+        """
+        tag = msg[:msg.find(']') + 1] if msg.startswith('[') else ''
+        now = monotonic()
+        with self.bucket_lock:
+            bucket = self.buckets.get(tag)
+            if bucket is None:
+                bucket = self.buckets[tag] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return None
+            bucket[0] -= 1
+            dropped, bucket[2] = bucket[2], 0
+            return dropped
+
+    def log(self, type, msg, args=None):
         #msg = '[LOGGING] ' + msg
         # Translate type string to log level (0 - 50)
-        logging.log(LogWrapper.levels.index(type)*10, msg)
-        # if type == 'error' or type == 'warning':
-        if self.translator is not None:
-            msg = self.translator.request(msg)
-        #print('LogWrapper: ' + type + ' - ' + str(msg))
+        level = LogWrapper.levels.index(type) * 10
+        if not self.logger.isEnabledFor(level):
+            return
+        if level < logging.ERROR:
+            dropped = self.allow(msg)
+            if dropped is None:
+                return
+            if dropped:
+                self.record(logging.WARNING, '[LogWrapper] Dropped %d messages like: %s', (dropped, msg))
+        self.record(level, msg, args)
         # self.log_viam(type, msg)
-        
+
+    def record(self, level, msg, args):
+        # makeRecord skips the caller lookup logging.log would do, the caller is always this listener
+        self.logger.handle(self.logger.makeRecord(self.logger.name, level, __file__, 0, msg, args or (), None))
+
     # def log_viam(self, type, msg):
     #     if type == 'debug':
     #         LOGGER.debug(msg)
@@ -65,4 +180,4 @@ class LogWrapper:
     #     elif type == 'error':
     #         LOGGER.error(msg)
     #     elif type == 'critical':
-    #         LOGGER.critical(msg)
\ No newline at end of file
+    #         LOGGER.critical(msg)
@@ -0,0 +1,63 @@
+import threading
+
+class Mailbox:
+    registry = {}
+    registry_lock = threading.Lock()
+
+    def __init__(self):
+        """
+        Mailbox class
+        Holds only the latest value from a producer thread. Putting never blocks, a value that was not
+        read before the next one arrives is replaced, so a slow consumer cannot hold up the producer.
+        Consumers keep the version they last read and wait for a newer one.
+
+        Example:
+        mailbox = Mailbox.named('vision:detections')
+        mailbox.put(detections)  # producer
+
+        version = 0
+        version, detections = mailbox.wait(version, timeout=1)  # consumer
+        """
+        self.condition = threading.Condition()
+        self.value = None
+        self.version = 0
+        self.replaced = 0  # values overwritten before anyone read them
+        self.read_version = 0
+
+    @staticmethod
+    def named(name):
+        """Shared mailbox for a name, created on first use so producer and consumer can start in any order"""
+        with Mailbox.registry_lock:
+            mailbox = Mailbox.registry.get(name)
+            if mailbox is None:
+                mailbox = Mailbox.registry[name] = Mailbox()
+            return mailbox
+
+    def put(self, value):
+        with self.condition:
+            if self.read_version != self.version:
+                self.replaced += 1
+            self.value = value
+            self.version += 1
+            self.condition.notify_all()
+
+    def get(self):
+        """
+        :return: (version, value) of the latest value without waiting
+        """
+        with self.condition:
+            self.read_version = self.version
+            return self.version, self.value
+
+    def wait(self, version, timeout=None):
+        """
+        Wait for a value newer than version
+        :param version: the version the caller last read
+        :param timeout: seconds to wait
+        :return: (version, value), the version is unchanged on timeout
+        """
+        with self.condition:
+            if self.version == version:
+                self.condition.wait(timeout)
+            self.read_version = self.version
+            return self.version, self.value
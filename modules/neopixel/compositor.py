@@ -0,0 +1,155 @@
+from time import monotonic
+
+import numpy as np
+
+from modules.neopixel.framebuffer import FrameBuffer
+
+class Compositor(FrameBuffer):
+    LAYERS = ['status', 'eye', 'animation', 'override']  # bottom to top
+
+    def __init__(self, pixels, count, fps=30, layers=None):
+        """
+        Compositor class
+        Frame buffer made of named layers. Each layer holds colors and a mask of the pixels it covers,
+        every frame the layers are stacked bottom to top and the top-most covered color of each pixel is shown,
+        so a status update underneath a running animation is kept and shows again once the animation stops.
+        Animations are generators played on a layer by the render thread, each step yields
+        (colors, seconds until the next step). Replacing or stopping an animation just drops its generator,
+        a finished animation uncovers its pixels.
+        Steps are never closer together than one frame, and an animation that falls behind skips ahead
+        instead of catching up. With no animation playing the render thread sleeps until something changes.
+        :param pixels: neopixel object, created with auto_write=False
+        :param count: number of pixels
+        :param fps: maximum frames per second
+        :param layers: layer names, bottom to top
+
+        Example:
+        compositor = Compositor(pixels, 12)
+        compositor.set('status', [0], (0, 0, 100))
+        compositor.play('animation', [5, 6, 7], spinner())
+        compositor.stop_animation('animation')
+        """
+        self.layers = {name: (np.zeros((count, 3), dtype=np.uint8), np.zeros(count, dtype=bool))
+                       for name in (layers or Compositor.LAYERS)}
+        self.animations = {}  # layer: [indexes, generator, due]
+        self.changed = False
+        super().__init__(pixels, count, fps)
+
+    def get(self, layer, index):
+        """
+        :return: (R, G, B) of the pixel on the layer, None if the layer does not cover it
+        """
+        colors, mask = self.layers[layer]
+        return tuple(colors[index].tolist()) if mask[index] else None
+
+    def set(self, layer, indexes, colors):
+        """
+        :param layer: layer name
+        :param indexes: array of pixel indexes
+        :param colors: uint8 (R, G, B) for all of them, or an array with one row per index
+        """
+        with self.lock:
+            self.paint(layer, indexes, colors)
+        self.ready.set()
+
+    def paint(self, layer, indexes, colors):
+        layer_colors, mask = self.layers[layer]
+        layer_colors[indexes] = colors
+        mask[indexes] = True
+        self.changed = True
+
+    def clear(self, layer, indexes=None):
+        """Uncover the pixels of a layer, all of them when no indexes are given"""
+        with self.lock:
+            mask = self.layers[layer][1]
+            if indexes is None:
+                mask[:] = False
+            else:
+                mask[indexes] = False
+            self.changed = True
+        self.ready.set()
+
+    def play(self, layer, indexes, animation):
+        """
+        Play an animation on a layer, replacing the one already playing there
+        :param layer: layer name
+        :param indexes: array of pixel indexes the animation draws
+        :param animation: generator yielding (colors, delay)
+        """
+        with self.lock:
+            self.animations[layer] = [indexes, animation, monotonic()]
+        self.ready.set()
+
+    def stop_animation(self, layer):
+        """Stop the animation on a layer and uncover its pixels"""
+        with self.lock:
+            animation = self.animations.pop(layer, None)
+        if animation is not None:
+            self.clear(layer, animation[0])
+
+    def playing(self, layer):
+        return layer in self.animations
+
+    def step(self, now):
+        """Advance the animations that are due, returns the time the next one is due or None"""
+        with self.lock:
+            animations = list(self.animations.items())
+        next_due = None
+        for layer, animation in animations:
+            indexes, generator, due = animation
+            if due <= now:
+                try:
+                    colors, delay = next(generator)
+                except StopIteration:
+                    # Finished, uncover its pixels
+                    with self.lock:
+                        if self.animations.get(layer) is animation:
+                            del self.animations[layer]
+                            self.layers[layer][1][indexes] = False
+                            self.changed = True
+                    continue
+                with self.lock:
+                    # Skip the frame if the animation was replaced or stopped meanwhile
+                    if self.animations.get(layer) is not animation:
+                        continue
+                    self.paint(layer, indexes, colors)
+                due = animation[2] = now + max(delay, self.interval)
+            next_due = due if next_due is None else min(next_due, due)
+        return next_due
+
+    def compose(self):
+        """Stack the layers into the frame buffer"""
+        with self.lock:
+            if not self.changed:
+                return
+            self.changed = False
+            frame = np.zeros((self.count, 3), dtype=np.uint8)
+            for colors, mask in self.layers.values():
+                frame[mask] = colors[mask]
+        self.update(np.arange(self.count), frame)
+
+    def run(self):
+        next_due = None
+        while not self.exit_event.is_set():
+            # Sleep until something changes or the next animation step is due
+            self.ready.wait(None if next_due is None else max(0, next_due - monotonic()))
+            if self.exit_event.is_set():
+                break
+            wait = self.last_flush + self.interval - monotonic()
+            if wait > 0:
+                self.exit_event.wait(wait)
+            self.ready.clear()
+            next_due = self.step(monotonic())
+            self.compose()
+            self.flush()
+            self.last_flush = monotonic()
+
+    def stop(self):
+        """Stop the render thread and show the final frame"""
+        with self.lock:
+            self.animations.clear()
+        self.exit_event.set()
+        self.ready.set()
+        self.thread.join(1)
+        self.compose()
+        self.flush()
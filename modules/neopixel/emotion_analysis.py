@@ -1,13 +1,16 @@
 import random
-from transformers import pipeline
 from itertools import combinations
 from pubsub import pub
+from modules.lazy import lazy_import
+
+transformers = lazy_import('transformers')
 
 class EmotionAnalysis:
     def __init__(self, **kwargs):
         """
         Emotion analysis module
         Analyzes text for emotions and sends colors to NeoPixel LEDs
+        The model is loaded on the first text to analyze
         
         Install: pip install transformers
         
@@ -20,8 +23,8 @@ class EmotionAnalysis:
         # Load color sets from YAML file via Config class
         self.color_sets = kwargs.get('colors')
 
-        # Emotion analyzer
-        self.emotion_analyzer = pipeline('text-classification', model='joeddav/distilbert-base-uncased-go-emotions-student')
+        # Emotion analyzer, loaded on first use
+        self.analyzer = None
 
         # Emotion to keyword mapping
         self.emotion_to_keyword = {
@@ -57,6 +60,16 @@ class EmotionAnalysis:
 
         pub.subscribe(self.analyze_text, 'speech')
 
+    def reload(self, **kwargs):
+        """Use changed color sets, the loaded model is kept"""
+        self.color_sets = kwargs.get('colors')
+        return True
+
+    def emotion_analyzer(self, text):
+        if self.analyzer is None:
+            self.analyzer = transformers.pipeline('text-classification', model='joeddav/distilbert-base-uncased-go-emotions-student')
+        return self.analyzer(text)
+
     def get_different_colors(self, color_dict, num_colors):
         colors = list(color_dict.values())
         if len(colors) <= num_colors:
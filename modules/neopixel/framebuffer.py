@@ -0,0 +1,87 @@
+import threading
+from time import monotonic
+
+import numpy as np
+
+from pubsub import pub
+
+class FrameBuffer:
+    def __init__(self, pixels, count, fps=30):
+        """
+        FrameBuffer class
+        Holds the colour of every pixel so callers never wait on the strip.
+        Writes only update the buffer and mark the pixel dirty, a render thread copies the dirty pixels
+        to the strip and calls show() once per frame, at most fps times a second.
+        The first write after an idle period is shown immediately.
+        :param pixels: neopixel object, created with auto_write=False
+        :param count: number of pixels
+        :param fps: maximum frames per second
+
+        Example:
+        buffer = FrameBuffer(pixels, 12, fps=30)
+        buffer.update([0, 11], [(100, 0, 0), (0, 0, 100)])
+        """
+        self.pixels = pixels
+        self.count = count
+        self.interval = 1 / fps
+        self.frame = np.zeros((count, 3), dtype=np.uint8)
+        self.dirty = np.zeros(count, dtype=bool)
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.exit_event = threading.Event()
+        self.last_flush = 0
+        self.frames = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __getitem__(self, index):
+        return tuple(self.frame[index].tolist())
+
+    def update(self, indexes, colors):
+        """
+        :param indexes: array of pixel indexes
+        :param colors: (R, G, B) for all of them, or an array with one row per index
+        """
+        indexes = np.asarray(indexes, dtype=np.intp)
+        colors = np.broadcast_to(np.asarray(colors, dtype=np.uint8), (len(indexes), 3))
+        with self.lock:
+            changed = (self.frame[indexes] != colors).any(axis=1)
+            self.frame[indexes] = colors
+            self.dirty[indexes[changed]] = True
+        if changed.any():
+            self.ready.set()
+
+    def flush(self):
+        """Copy the dirty pixels to the strip and show them, returns False when nothing changed"""
+        with self.lock:
+            indexes = np.flatnonzero(self.dirty)
+            colors = self.frame[indexes].tolist()
+            self.dirty[:] = False
+        if not len(indexes):
+            return False
+        try:
+            for index, color in zip(indexes.tolist(), colors):
+                self.pixels[index] = tuple(color)
+            self.pixels.show()
+            self.frames += 1
+        except Exception as e:
+            pub.sendMessage('log', msg='[LED] Error in show pixels: ' + str(e))
+        return True
+
+    def run(self):
+        while not self.exit_event.is_set():
+            if not self.ready.wait(0.5):
+                continue
+            wait = self.last_flush + self.interval - monotonic()
+            if wait > 0:
+                self.exit_event.wait(wait)
+            self.ready.clear()
+            self.flush()
+            self.last_flush = monotonic()
+
+    def stop(self):
+        """Stop the render thread and show the final frame"""
+        self.exit_event.set()
+        self.ready.set()
+        self.thread.join(1)
+        self.flush()
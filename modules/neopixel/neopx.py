@@ -1,9 +1,32 @@
 from pubsub import pub
 from time import sleep
-from colour import Color
+import colorsys
+import numpy as np
 import board
     
-import threading
+from modules.neopixel.compositor import Compositor
+
+def gradient(start, end, steps=100):
+    """
+    Colors from start to end, interpolated in HLS like colour.Color.range_to
+    :param start: (hue, lightness, saturation)
+    :param end: (hue, lightness, saturation)
+    :return: (steps, 3) array of RGB values from 0 to 100
+    """
+    hls = np.linspace(start, end, steps)
+    return np.round(np.array([colorsys.hls_to_rgb(*c) for c in hls]) * 100)
+
+def wheel(p):
+    """Generate rainbow colors across 0-255 positions."""
+    # https://github.com/jgarff/rpi_ws281x/blob/master/python/examples/strandtest.py
+    if p < 85:
+        return (p * 3, 255 - p * 3, 0)
+    elif p < 170:
+        p -= 85
+        return (255 - p * 3, 0, p * 3)
+    else:
+        p -= 170
+        return (0, p * 3, 255 - p * 3)
 
 class NeoPx:
     COLOR_OFF = (0, 0, 0)
@@ -14,9 +37,19 @@ class NeoPx:
     COLOR_WHITE = (100, 100, 100)
     COLOR_WHITE_FULL = (255, 255, 255)
     COLOR_WHITE_DIM = (50, 50, 50)
-    COLOR_RED_TO_GREEN_100 = list(Color("red").range_to(Color("green"),100))
-    COLOR_BLUE_TO_RED_100 = list(Color("blue").range_to(Color("red"),100)) # also passes through green
-    COLOR_BLUE_TO_GREEN_100 = list(Color("blue").range_to(Color("green"),100))
+    # (hue, lightness, saturation) of red, web green (#008000) and blue
+    HLS_RED = (0, 0.5, 1)
+    HLS_GREEN = (1 / 3, 0.25, 1)
+    HLS_BLUE = (2 / 3, 0.5, 1)
+    COLOR_RED_TO_GREEN_100 = gradient(HLS_RED, HLS_GREEN)
+    COLOR_BLUE_TO_RED_100 = gradient(HLS_BLUE, HLS_RED) # also passes through green
+    COLOR_BLUE_TO_GREEN_100 = gradient(HLS_BLUE, HLS_GREEN)
+    GRADIENTS = {
+        'rg': COLOR_RED_TO_GREEN_100,
+        'br': COLOR_BLUE_TO_RED_100,
+        'bg': COLOR_BLUE_TO_GREEN_100
+    }
+    WHEEL = np.array([wheel(p) for p in range(256)])
 
     COLOR_MAP = {
         'red': COLOR_RED,
@@ -32,11 +65,18 @@ class NeoPx:
     def __init__(self, **kwargs):
         """
         NeoPx class
-        :param kwargs: count, positions, brightness, i2c
+        :param kwargs: count, positions, brightness, protocol, pin, fps
         :param count: number of neopixels
         :param positions: dictionary of positions
         :param brightness: list of brightness values for each neopixel
-        :param i2c: boolean to use i2c
+        :param protocol: GPIO, I2C or SPI
+        :param pin: GPIO pin, only used for GPIO
+        :param fps: maximum frames per second written to the strip
+        
+        Colors are written to a frame buffer and shown by a render thread, so setting a pixel never blocks.
+        Gradients and named colors are looked up in tables with the brightness of each pixel already applied.
+        Pixels are drawn on layers, bottom to top: status ('led', 'led:full'), eye ('led:eye', 'led:ring'),
+        animation and override (flashlight). A higher layer hides the pixels it covers without erasing the ones below.
         
         Install: pip install adafruit-circuitpython-seesaw
         
@@ -54,12 +94,19 @@ class NeoPx:
         - Argument: color (string or tuple) - string map of COLOR_MAP or tuple (R, G, B)
         
         Subscribes to 'led:off' to turn off all pixels
+
+        Subscribes to 'power:sleep' to stop the animation and turn off the eye, so the render thread idles
         
         Subscribes to 'led:flashlight' to turn on/off all pixels
         - Argument: on (bool) - turn on or off
         
         Subscribes to 'led:party' to start party mode
         
+        Subscribes to 'led:animate' to start an animation, replacing any animation already playing
+        - Argument: identifiers (int or list) - pixel numbers or positions
+        - Argument: color (string or tuple) - string map of COLOR_MAP or tuple (R, G, B)
+        - Argument: animation (string) - spinner, breathe, rainbow or rainbow_cycle
+        
         Subscribes to 'exit' to clean up
         
         Subscribes to 'speech' to handle speech commands
@@ -73,21 +120,21 @@ class NeoPx:
         pub.sendMessage('led:off')
         pub.sendMessage('led:flashlight', on=True)
         pub.sendMessage('led:party')
+        pub.sendMessage('led:animate', identifiers='ring', color='blue', animation='spinner')
         pub.sendMessage('exit')
         pub.sendMessage('speech', msg='light on')
         """
         # Initialise
         self.count = kwargs.get('count')
         self.positions = kwargs.get('positions')
-        # Manually adjust brightness of individual neopixels
-        self.brightness = kwargs.get('brightness')
         self.all = range(self.count)
+        self.indexes_all = np.arange(self.count)
+        # Manually adjust brightness of individual neopixels
+        self.tables(kwargs.get('brightness'))
         self.all_eye = ['right', 'top_right', 'top_left', 'left', 'bottom_left', 'bottom_right', 'middle']
         self.ring_eye = ['right', 'top_right', 'top_left', 'left', 'bottom_left', 'bottom_right']
-        self.animation = False
-        self.thread = None
-        self.overridden = False  # prevent any further changes until released (for flashlight)
         self.protocol = kwargs.get('protocol')
+        self.pin = kwargs.get('pin')
         if self.protocol == 'I2C':
             import busio
             from rainbowio import colorwheel
@@ -101,7 +148,7 @@ class NeoPx:
                 self.i2c = busio.I2C(board.SCL, board.SDA)
                 ss = seesaw.Seesaw(self.i2c, addr=0x60)
             neo_pin = 15 # Unclear how this is used
-            self.pixels = neopixel.NeoPixel(ss, neo_pin, self.count, brightness = 0.1)
+            self.pixels = neopixel.NeoPixel(ss, neo_pin, self.count, brightness = 0.1, auto_write=False)
         elif self.protocol == 'SPI':
             import neopixel_spi as neopixel
             spi = board.SPI()
@@ -132,10 +179,10 @@ class NeoPx:
             print("End of test")
         else: # GPIO
             import neopixel
-            self.pixels = neopixel.NeoPixel(kwargs.get('pin'), self.count)
+            self.pixels = neopixel.NeoPixel(kwargs.get('pin'), self.count, auto_write=False)
+        self.buffer = Compositor(self.pixels, self.count, kwargs.get('fps', 30))
         # Default states
         self.set(self.all, NeoPx.COLOR_OFF)
-        sleep(0.1)
         self.set(self.positions['middle'], NeoPx.COLOR_BLUE)
 
         # Set subscribers
@@ -144,22 +191,42 @@ class NeoPx:
         pub.subscribe(self.eye, 'led:eye')
         pub.subscribe(self.ring, 'led:ring')
         pub.subscribe(self.off, 'led:off')
-        pub.subscribe(self.eye, 'led:flashlight')
+        pub.subscribe(self.off, 'power:sleep')
+        pub.subscribe(self.flashlight, 'led:flashlight')
         pub.subscribe(self.party, 'led:party')
+        pub.subscribe(self.animate, 'led:animate')
         pub.subscribe(self.exit, 'exit')
         pub.subscribe(self.speech, 'speech')
 
+    def tables(self, brightness):
+        """Lookup tables of count x colors x RGB with the brightness of each pixel applied"""
+        self.brightness = np.array(brightness, dtype=float)[:, None]
+        self.gradients = {name: self.scale(self.indexes_all[:, None], colors[None, :, :])
+                          for name, colors in NeoPx.GRADIENTS.items()}
+        self.colors = {name: self.scale(self.indexes_all, color) for name, color in NeoPx.COLOR_MAP.items()}
+
+    def reload(self, **kwargs):
+        """
+        Apply changed positions, brightness or fps to the running strip, used by ModuleLoader when config/neopixel.yml changes
+        Colors already shown keep their brightness until they are set again.
+        :return: False if the strip has to be opened again (protocol, pin or count changed)
+        """
+        if (kwargs.get('protocol'), kwargs.get('pin'), kwargs.get('count')) != (self.protocol, self.pin, self.count):
+            return False
+        self.positions = kwargs.get('positions')
+        self.tables(kwargs.get('brightness'))
+        self.buffer.interval = 1 / kwargs.get('fps', 30)
+        return True
+
     def exit(self):
         """
         On close of application carry out clean up
         """
-        if self.animation:
-            self.animation = False
-            self.thread.join()
-        self.set(self.all, NeoPx.COLOR_OFF)
+        for layer in self.buffer.layers:
+            self.buffer.clear(layer)
+        self.buffer.stop()
         if self.protocol == 'I2C':
             self.i2c.deinit()
-        sleep(1)
 
     def speech(self, text):
         if 'light on' in text:
@@ -167,82 +234,77 @@ class NeoPx:
         if 'light off' in text:
             self.flashlight(False)
 
-    def set(self, identifiers, color, gradient=False):
+    def set(self, identifiers, color, gradient=False, layer='status'):
         """
         Set color of pixel
         (255, 0, 0) # set to red, full brightness
         (0, 128, 0) # set to green, half brightness
         (0, 0, 64)  # set to blue, quarter brightness
         :param identifiers: pixel number (starting from 0) - can be list
-        :param color: string map of COLOR_MAP or tuple (R, G, B)
+        :param color: string map of COLOR_MAP, tuple (R, G, B) or a number 0-99 on the gradient
+        :param gradient: 'br' blue to red, 'bg' blue to green, otherwise red to green
+        :param layer: layer to draw on
         """
-        if self.overridden:
-            return
-        # convert single identifier to list
-        if type(identifiers) is int:
-            identifiers = [identifiers]
-        elif type(identifiers) is str:
-            identifiers = [self.positions[identifiers]]
-        # lookup color if string
-        if type(color) is float:
-            color = int(color)
-        if type(color) is int:
-            # Make color gradiant use possible @todo refactor
-            if color >= 100:
-                color = 99 # max in range
-            if gradient == 'br':
-                color = NeoPx.COLOR_BLUE_TO_RED_100[color].rgb
-            elif gradient == 'bg':
-                color = NeoPx.COLOR_BLUE_TO_GREEN_100[color].rgb
+        try:
+            indexes = self.indexes(identifiers)
+            if type(color) in (int, float):
+                # Position on the gradient, 0-99
+                colors = self.gradients.get(gradient, self.gradients['rg'])[indexes, min(max(int(color), 0), 99)]
+            elif type(color) is str:
+                colors = self.colors[color][indexes]
             else:
-                color = NeoPx.COLOR_RED_TO_GREEN_100[color].rgb
-            color = (round(color[0]*100), round(color[1]*100), round(color[2]*100)) # increase values to be used as LED RGB
-        elif type(color) is str:
-            color = NeoPx.COLOR_MAP[color]
-        for i in identifiers:
-            if type(i) is str:
-                i = self.positions[i]
-            # print(str(i) + str(color))
-            try:
-                if i >= self.count:
-                    pub.sendMessage('log', msg='[LED] Error in set pixels: index out of range')
-                    print('Error in set pixels: index out of range')
-                    i = self.count-1                
-                self.pixels[i] = self.apply_brightness_modifier(i, color)
-            except Exception as e:
-                print(e)
-                pub.sendMessage('log', msg='[LED] Error in set pixels: ' + str(e))
-                pass
-        
-        self.pixels.show()
-        sleep(.1)
+                colors = self.scale(indexes, color)
+        except Exception as e:
+            print(e)
+            pub.sendMessage('log', msg='[LED] Error in set pixels: ' + str(e))
+            return
+        self.buffer.set(layer, indexes, colors)
 
-    def apply_brightness_modifier(self, identifier, color):
-        # Some neopixels do not need to be full brightness. Reduce intensity with the BRIGHTNESS_MODIFIER for each neopixel
-        return (round(color[0]*self.brightness[identifier]), round(color[1]*self.brightness[identifier]), round(color[2]*self.brightness[identifier]))
+    def indexes(self, identifiers):
+        """
+        :param identifiers: pixel number, position name or a list of either
+        :return: array of pixel numbers
+        """
+        if type(identifiers) is str and identifiers == 'ring':
+            identifiers = self.ring_eye
+        elif type(identifiers) in (int, str):
+            identifiers = [identifiers]
+        indexes = np.array([self.positions[i] if type(i) is str else i for i in identifiers], dtype=np.intp)
+        if (indexes >= self.count).any():
+            pub.sendMessage('log', msg='[LED] Error in set pixels: index out of range')
+            print('Error in set pixels: index out of range')
+            indexes = np.minimum(indexes, self.count - 1)
+        return indexes
+
+    def scale(self, indexes, colors):
+        """
+        Some neopixels do not need to be full brightness. Reduce intensity with the brightness of each neopixel
+        :param indexes: array of pixel numbers
+        :param colors: (R, G, B) or array of colors that broadcasts against the indexes
+        :return: uint8 array of colors
+        """
+        return np.clip(np.round(np.asarray(colors) * self.brightness[indexes]), 0, 255).astype(np.uint8)
 
     def ring(self, color):
-        self.set(self.ring_eye, color)
+        self.set(self.ring_eye, color, layer='eye')
 
     def flashlight(self, on):
+        # Covers everything below until released
         if on:
-            self.set(self.all_eye, NeoPx.COLOR_WHITE_FULL)
-            self.overridden = True
+            self.set(self.all_eye, NeoPx.COLOR_WHITE_FULL, layer='override')
         else:
-            self.overridden = False
-            self.set(self.all_eye, NeoPx.COLOR_OFF)
+            self.buffer.clear('override')
 
     def off(self):
-        if self.thread:
+        if self.buffer.playing('animation'):
             pub.sendMessage('log', msg='[LED] Animation stopping')
-            self.animation = False
-            self.thread.animation = False
-            self.thread.join()
+            self.buffer.stop_animation('animation')
+        self.buffer.clear('eye')
         self.set(self.all, NeoPx.COLOR_OFF)
-        sleep(.5)
 
     def full(self, color):
         if color in NeoPx.COLOR_MAP.keys():
+            self.buffer.clear('eye')
             self.set(self.all, NeoPx.COLOR_MAP[color])
 
     def eye(self, color):
@@ -254,71 +316,54 @@ class NeoPx:
         if (self.count < index):
             index = self.count - 1
             pub.sendMessage('log', msg='[LED] Error in set pixels: index out of range, changing to last pixel')
-        if self.pixels[index] != color:
+        if self.buffer.get('eye', index) != tuple(self.colors[color][index].tolist()):
             pub.sendMessage('log', msg='[LED] Setting eye colour: ' + color)
-            self.set(index, NeoPx.COLOR_MAP[color])
+            self.set(index, NeoPx.COLOR_MAP[color], layer='eye')
 
     def party(self):
-        # self.animate(self.all, 'off', 'rainbow_cycle')
-
-        for j in range(256 * 1):
-            for i in range(self.count):
-                self.set(i, NeoPx._wheel((int(i * 256 / self.count) + j) & 255))
-            return
-        print('done')
-
-        # threading.Thread(target=self.rainbow_cycle(self.all, 'off'))
-        # self.thread.start()
+        self.animate(self.all, 'off', 'rainbow_cycle')
 
     def animate(self, identifiers, color, animation):
         """
-        Trigger one of the LED animations
+        Trigger one of the LED animations, replacing the one already playing
         :param identifiers: single index or array or indexes
         :param color: string map of COLOR_MAP or tuple (R, G, B)
         :param animation: string name of animation listed in map below
         :return:
         """
-        if self.animation:
-            pub.sendMessage('log', msg='[LED] Animation already started. Command ignored')
-            return
-
-        pub.sendMessage('log', msg='[LED] Animation starting: ' + animation)
-
         animations = {
             'spinner': self.spinner,
             'breathe': self.breathe,
             'rainbow': self.rainbow,
             'rainbow_cycle': self.rainbow_cycle
         }
+        if animation not in animations:
+            pub.sendMessage('log', msg='[LED] Animation not found: ' + animation)
+            return
 
-        self.animation = True
-        if animation in animations:
-            self.thread = threading.Thread(target=animations[animation], args=(identifiers, color,))
-        self.thread.start()
-
+        pub.sendMessage('log', msg='[LED] Animation starting: ' + animation)
+        if type(color) is str:
+            color = NeoPx.COLOR_MAP[color]
+        indexes = self.indexes(identifiers)
+        self.buffer.play('animation', indexes, animations[animation](indexes, color))
 
-    def spinner(self, identifiers, color, index=1):
+    def spinner(self, indexes, color, wait=.3):
         """
-        Create a spinner effect around outer LEDs of 7 LED ring.
-        :param color: string map of COLOR_MAP or tuple (R, G, B)
-        :param index: current LED to change
-        :return:
+        Create a spinner effect, lighting one pixel at a time.
+        :param indexes: pixels to spin around
+        :param color: tuple (R, G, B)
+        :param wait: seconds per step
         """
-        sleep(.3)
-
-        self.set(range(1, 7), NeoPx.COLOR_OFF)
-        self.set(index, color)
-
-        index = (index + 1) % self.count
-        # don't set the center led
-        if index == 0:
-            index = 1
-
-        t = threading.currentThread()
-        if getattr(t, "animation", True):
-            self.spinner(identifiers, color, index)
-
-    def breathe(self, identifiers, color):
+        colors = self.colors['off'][indexes]
+        lit = self.scale(indexes, color)
+        index = 0
+        while True:
+            frame = colors.copy()
+            frame[index] = lit[index]
+            yield frame, wait
+            index = (index + 1) % len(indexes)
+
+    def breathe(self, indexes, color, wait=.1, hold=2):
         """
         Begin a breathing animation for whatever color has been passed in.
 
@@ -326,54 +371,25 @@ class NeoPx:
         All values > 0 will become aligned to that max value.
         E.g. (0, 100, 255) will brighten to (0, 255, 255) and then darken to (0, 0, 0) repeatedly
 
-        :param identifiers: pins to apply animation
-        :param color: string map of COLOR_MAP or tuple (R, G, B)
+        :param indexes: pins to apply animation
+        :param color: tuple (R, G, B)
         """
-        if type(color) is str:
-            color = NeoPx.COLOR_MAP[color]
-        t = threading.currentThread()
-        if getattr(t, "animation", True):
-            for dc in range(0, max(color), 1):  # Increase brightness to max of color
-                self.set(identifiers, (dc if color[0] > 0 else 0, dc if color[0] > 0 else 0, dc if color[0] > 0 else 0))
-                sleep(0.10)
-            sleep(2)
-            for dc in range(max(color), 0, -1):  # Decrease brightness to 0
-                self.set(identifiers, (dc if color[0] > 0 else 0, dc if color[0] > 0 else 0, dc if color[0] > 0 else 0))
-                sleep(0.10)
-            sleep(2)
-
-    @staticmethod
-    def _wheel(p):
-        """Generate rainbow colors across 0-255 positions."""
-        # https://github.com/jgarff/rpi_ws281x/blob/master/python/examples/strandtest.py
-        if p < 85:
-            return (p * 3, 255 - p * 3, 0)
-        elif p < 170:
-            p -= 85
-            return (255 - p * 3, 0, p * 3)
-        else:
-            p -= 170
-            return (0, p * 3, 255 - p * 3)
-
-    def rainbow(self, identifiers, color, wait_ms=20, iterations=1):
+        channels = np.array(color) > 0
+        levels = list(range(0, max(color))) + list(range(max(color), 0, -1))
+        while levels:
+            for i, dc in enumerate(levels):
+                # Hold at the brightest and the darkest level
+                yield self.scale(indexes, channels * dc), hold if i in (max(color) - 1, len(levels) - 1) else wait
+
+    def rainbow(self, indexes, color, wait_ms=20, iterations=1):
         """Draw rainbow that fades across all pixels at once."""
         for j in range(256 * iterations):
-            for i in range(self.count):
-                self.set(i, NeoPx._wheel((i + j) & 255))
-            t = threading.currentThread()
-            if not getattr(t, "animation", True):
-                return
-            sleep(wait_ms / 1000)
-
-    def rainbow_cycle(self, identifiers, color, wait_ms=20, iterations=5):
+            yield self.scale(indexes, NeoPx.WHEEL[(indexes + j) & 255]), wait_ms / 1000
+
+    def rainbow_cycle(self, indexes, color, wait_ms=20, iterations=5):
         """Draw rainbow that uniformly distributes itself across all pixels."""
         for j in range(256 * iterations):
-            for i in range(self.count):
-                self.set(i, NeoPx._wheel((int(i * 256 / self.count) + j) & 255))
-            t = threading.currentThread()
-            if not getattr(t, "animation", True):
-                return
-            sleep(wait_ms / 1000)
+            yield self.scale(indexes, NeoPx.WHEEL[(indexes * 256 // self.count + j) & 255]), wait_ms / 1000
 
 
 if __name__ == '__main__':
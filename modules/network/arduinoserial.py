@@ -1,32 +1,87 @@
 from __future__ import print_function, division, absolute_import
-import time
-from modules.network.robust_serial.robust_serial import write_order, Order, write_i8, write_i16, read_i8, read_i16, read_i32, read_order
-from modules.network.robust_serial.utils import open_serial_port
+import threading
+from collections import deque
+from modules.network.robust_serial.robust_serial import Order, encode_servo, encode_servo_multi, encode_pin, encode_read, encode_led
+from modules.network.robust_serial.threads import Command, CommandThread, ListenerThread
+from modules.network.robust_serial.utils import open_serial_port, CustomQueue, queue
+from modules.network.coalescer import Coalescer
 from pubsub import pub
 
 class ArduinoSerial:
     """
     Communicate with Arduino over Serial
     """
-    type_map=['led', 'servo', 'servo_relative', ' pin', 'read']
+    type_map=['led', 'servo', 'pin', 'pin_read', 'servo_relative', 'received', 'servo_multi', 'servo_multi_relative']
     DEVICE_LED = 0
     DEVICE_SERVO = 1
     DEVICE_PIN = 2
     DEVICE_PIN_READ = 3
     DEVICE_SERVO_RELATIVE = 4
     ORDER_RECEIVED = 5
+    DEVICE_SERVO_MULTI = 6
+    DEVICE_SERVO_MULTI_RELATIVE = 7
+    SERVO_ORDERS = (Order.SERVO.value, Order.SERVO_RELATIVE.value, Order.SERVO_MULTI.value, Order.SERVO_MULTI_RELATIVE.value)
     def __init__(self, **kwargs):
+        """
+        ArduinoSerial class
+        Orders are framed into a single buffer and queued for a background writer thread,
+        a listener thread matches the Arduino's acknowledgements to outstanding orders.
+        Servo orders pass through a Coalescer first, so only the latest target for each servo is sent per control period.
+        Several servo targets are sent as one SERVO_MULTI order with a single acknowledgement, so they move together.
+        :param kwargs: port, baudrate, timeout, queue_size, max_pending, ack_timeout, resync_timeout, control_rate
+        :param port: serial port
+        :param baudrate: baud rate
+        :param timeout: read timeout in seconds for the listener thread
+        :param queue_size: maximum number of orders waiting to be written
+        :param max_pending: maximum number of orders waiting for acknowledgement
+        :param ack_timeout: seconds to wait for an acknowledgement before giving up on an order,
+                            longer than the slowest servo ease as the Arduino only reads orders between eases
+        :param resync_timeout: seconds without an acknowledgement before it is considered lost and the link is resynchronised
+        :param control_rate: servo coalescing rate in Hz (0 sends every servo order as received)
+
+        Subscribes to 'serial' to send an order
+        - Argument: type (int or string) - one of the DEVICE_ types
+        - Argument: identifier (int or list) - pin, servo or LED number (list of servo indexes for DEVICE_SERVO_MULTI)
+        - Argument: message (int, tuple or list) - value to send (list of percentages for DEVICE_SERVO_MULTI)
+
+        Subscribes to 'exit' to stop the serial threads
+
+        Publishes 'serial:servo' from the writer thread whenever a servo order is written (e.g. to pause image stabilization)
+
+        Example:
+        pub.sendMessage('serial', type=ArduinoSerial.DEVICE_SERVO, identifier=7, message=50)
+        pub.sendMessage('serial', type=ArduinoSerial.DEVICE_SERVO_MULTI, identifier=[0, 1, 2], message=[20, 40, 60])
+        """
         self.port = kwargs.get('port', '/dev/ttyAMA0')
         self.baudrate = kwargs.get('baudrate', 115200)
-        self.serial_file = ArduinoSerial.initialise(self.port, self.baudrate)
+        self.timeout = kwargs.get('timeout', 0.1)
+        self.queue_size = kwargs.get('queue_size', 64)
+        self.max_pending = kwargs.get('max_pending', 2)
+        self.ack_timeout = kwargs.get('ack_timeout', 10)
+        self.resync_timeout = kwargs.get('resync_timeout', 30)
+        self.control_rate = kwargs.get('control_rate', 50)
+
+        self.command_queue = CustomQueue(maxsize=self.queue_size)
+        self.pending = deque()
+        self.exit_event = threading.Event()
+        self.n_received_semaphore = threading.Semaphore(self.max_pending)
+        self.serial_lock = threading.Lock()
+        self.command_thread = None
+        self.listener_thread = None
+        self.busy = False
+
+        self.serial_file = ArduinoSerial.initialise(self.port, self.baudrate, self.timeout)
+        self.start()
+        self.coalescer = Coalescer(self.write_servos, self.control_rate) if self.control_rate else None
         self.file = None
         pub.subscribe(self.send, 'serial')
+        pub.subscribe(self.exit, 'exit')
 
     @staticmethod
-    def initialise(port, baudrate):
+    def initialise(port, baudrate, timeout=0.1):
         try:
             print('Trying to select port ' + port)
-            serial_file = open_serial_port(serial_port=port, baudrate=baudrate, timeout=None)
+            serial_file = open_serial_port(serial_port=port, baudrate=baudrate, timeout=timeout)
         except Exception as e:
             raise e
         is_connected = True # assume connection
@@ -50,15 +105,60 @@ class ArduinoSerial:
         #     pub.sendMessage('log', msg="[ArduinoSerial] NOT CONNECTED")
         #     serial_file = None
         return serial_file
-    
-    def read(self):
-        return read_i8(self.serial_file)
 
-    def read16(self):
-        return read_i16(self.serial_file)
-        
+    def start(self):
+        """Start the writer and listener threads for the current serial_file"""
+        if self.serial_file is None:
+            return
+        self.exit_event.clear()
+        self.command_thread = CommandThread(self.serial_file, self.command_queue, self.exit_event,
+                                            self.n_received_semaphore, self.serial_lock, self.pending, on_sent=self.sent)
+        self.listener_thread = ListenerThread(self.serial_file, self.exit_event, self.n_received_semaphore,
+                                              self.pending, ack_timeout=self.ack_timeout,
+                                              resync_timeout=self.resync_timeout, on_ack=self.acknowledged)
+        self.command_thread.start()
+        self.listener_thread.start()
+
+    def exit(self):
+        if self.coalescer is not None:
+            self.coalescer.stop()
+        self.exit_event.set()
+        for thread in (self.command_thread, self.listener_thread):
+            if thread is not None:
+                thread.join(1)
+
+    def encode(self, type, identifier, message):
+        """
+        Frame an order for the Arduino
+        :return: Command or None if type is unknown
+        """
+        # Formatted by the logger only when it is written
+        description = (ArduinoSerial.type_map[type] if isinstance(type, int) and type < len(ArduinoSerial.type_map) else type, identifier, message)
+        if type == ArduinoSerial.DEVICE_SERVO or type == 'servo':
+            return Command(encode_servo(Order.SERVO, identifier, int(message)), reply=True, description=description)
+        if type == ArduinoSerial.DEVICE_SERVO_RELATIVE or type == 'servo_relative':
+            return Command(encode_servo(Order.SERVO_RELATIVE, identifier, int(message)), reply=True, description=description)
+        if type == ArduinoSerial.DEVICE_SERVO_MULTI or type == 'servo_multi':
+            pairs = [(i, int(m)) for i, m in zip(identifier, message)]
+            return Command(encode_servo_multi(Order.SERVO_MULTI, pairs), reply=True, description=description)
+        if type == ArduinoSerial.DEVICE_SERVO_MULTI_RELATIVE or type == 'servo_multi_relative':
+            pairs = [(i, int(m)) for i, m in zip(identifier, message)]
+            return Command(encode_servo_multi(Order.SERVO_MULTI_RELATIVE, pairs), reply=True, description=description)
+        if type == ArduinoSerial.DEVICE_LED or type == 'led':
+            if isinstance(identifier, list) or isinstance(identifier, range):
+                identifier = list(identifier)
+            else:
+                identifier = [identifier]
+            return Command(encode_led(identifier, message), description=description)
+        if type == ArduinoSerial.DEVICE_PIN or type == 'pin':
+            return Command(encode_pin(identifier, message), description=description)
+        if type == ArduinoSerial.DEVICE_PIN_READ or type == 'pin_read':
+            return Command(encode_read(identifier), reply=True, description=description, wait=True)
+        return None
+
     def send(self, type, identifier, message):
         """
+        Queue an order for the Arduino. Returns immediately except for pin reads, which wait for the value.
         Examples:
         # send(ArduinoSerial.DEVICE_SERVO, 18, 20)
         # send(ArduinoSerial.DEVICE_LED, 1, (20,20,20))
@@ -66,59 +166,81 @@ class ArduinoSerial:
         :param type: one of the DEVICE_ types
         :param identifier: an identifier or list / range of identifiers, pin or LED number
         :param message: the packet to send to the arduino
+        :return: value read from the Arduino for DEVICE_PIN_READ, otherwise None
         """
         # If serial_file is None, call initialise(), if still fails then exit
         if self.serial_file is None:
             pub.sendMessage('led', identifiers='status5', color='red')
             pub.sendMessage('log', msg="[ArduinoSerial] Attempting to recover connection...")
-            self.serial_file = ArduinoSerial.initialise()
+            self.serial_file = ArduinoSerial.initialise(self.port, self.baudrate, self.timeout)
+            self.start()
         if self.serial_file is None:
             return
 
-        pub.sendMessage('led', identifiers='status5', color='blue')
-        # print('[ArduinoSerial] ' + str(ArduinoSerial.type_map[type]) + ' id: ' + str(identifier) + ' val: ' + str(message))
+        if self.coalescer is not None:
+            if type == ArduinoSerial.DEVICE_SERVO or type == 'servo':
+                return self.coalescer.add(identifier, message)
+            if type == ArduinoSerial.DEVICE_SERVO_RELATIVE or type == 'servo_relative':
+                return self.coalescer.add(identifier, message, relative=True)
+            if type in (ArduinoSerial.DEVICE_SERVO_MULTI, 'servo_multi', ArduinoSerial.DEVICE_SERVO_MULTI_RELATIVE, 'servo_multi_relative'):
+                relative = type in (ArduinoSerial.DEVICE_SERVO_MULTI_RELATIVE, 'servo_multi_relative')
+                for i, m in zip(identifier, message):
+                    self.coalescer.add(i, m, relative=relative)
+                return
 
-        pub.sendMessage('log', msg='[ArduinoSerial] ' + str(ArduinoSerial.type_map[type]) + ' id: ' + str(identifier) + ' val: ' + str(message))
-        if type == ArduinoSerial.DEVICE_SERVO or type == 'servo':
-            write_order(self.serial_file, Order.SERVO)
-            write_i8(self.serial_file, identifier)
-            write_i16(self.serial_file, int(message))
-            pub.sendMessage('log', msg="[ArduinoSerial] Servo(relative) " + str(identifier) + " " + str(message))
-            # print('[ArduinoSerial] Moved value from Arduino: ' + str(self.read16()))
-            pub.sendMessage('log', msg='[ArduinoSerial] Moved value from Arduino: ' + str(self.read16()))
-        if type == ArduinoSerial.DEVICE_SERVO_RELATIVE or type == 'servo_relative':
-            write_order(self.serial_file, Order.SERVO_RELATIVE)
-            write_i8(self.serial_file, identifier)
-            write_i16(self.serial_file, int(message))
-            pub.sendMessage('log', msg="[ArduinoSerial] Servo(relative) " + str(identifier) + " " + str(message))
-            # print('[ArduinoSerial] Moved value from Arduino: ' + str(self.read16()))
-            pub.sendMessage('log', msg='[ArduinoSerial] Moved value from Arduino: ' + str(self.read16()))
-        elif type == ArduinoSerial.DEVICE_LED or type == 'led':
-            write_order(self.serial_file, Order.LED)
-            if isinstance(identifier, list) or isinstance(identifier, range):
-                # write the number of leds to update
-                write_i8(self.serial_file, len(identifier))
-                for i in identifier:
-                    write_i8(self.serial_file, i)
-            else:
-                write_i8(self.serial_file, 1)
-                write_i8(self.serial_file, identifier)
+        command = self.encode(type, identifier, message)
+        if command is None:
+            pub.sendMessage('log:error', msg='[ArduinoSerial] Unknown order type: %s', args=(type,))
+            return
+        return self.enqueue(command)
 
-            if isinstance(message, tuple):
-                for v in message:
-                    write_i8(self.serial_file, v)
-            else:
-                write_i16(self.serial_file, message)
+    def write_servos(self, batch):
+        """
+        Queue the servo targets from one control period, called by the Coalescer
+        Absolute and relative targets are sent as one order each, a single target uses the plain SERVO order.
+        :param batch: list of (identifier, value, relative)
+        """
+        for relative in (False, True):
+            targets = [(identifier, value) for identifier, value, rel in batch if rel == relative]
+            if len(targets) == 1:
+                type = ArduinoSerial.DEVICE_SERVO_RELATIVE if relative else ArduinoSerial.DEVICE_SERVO
+                self.enqueue(self.encode(type, targets[0][0], targets[0][1]))
+            elif targets:
+                type = ArduinoSerial.DEVICE_SERVO_MULTI_RELATIVE if relative else ArduinoSerial.DEVICE_SERVO_MULTI
+                identifiers, values = zip(*targets)
+                self.enqueue(self.encode(type, list(identifiers), list(values)))
+
+    def enqueue(self, command):
+        """
+        Put a framed order on the writer queue
+        :return: the acknowledgement value if the command waits for it, otherwise None
+        """
+        pub.sendMessage('log:debug', msg='[ArduinoSerial] %s id: %s val: %s', args=command.description)
+        if command.reply and not self.busy:
+            self.busy = True
+            pub.sendMessage('led', identifiers='status5', color='blue')
+        try:
+            self.command_queue.put(command, timeout=self.ack_timeout)
+        except queue.Full:
+            pub.sendMessage('log:error', msg='[ArduinoSerial] Command queue full, dropped %s id: %s val: %s', args=command.description)
+            return
+
+        if command.event is not None:
+            return command.wait(self.ack_timeout * 2)
 
-        elif type == ArduinoSerial.DEVICE_PIN or type == 'pin':
-            write_order(self.serial_file, Order.PIN)
-            write_i8(self.serial_file, identifier)
-            write_i8(self.serial_file, message)
+    def sent(self, command):
+        """Called from the writer thread once an order is written"""
+        if command.frame[0] in ArduinoSerial.SERVO_ORDERS:
+            pub.sendMessage('serial:servo')
 
-        elif type == ArduinoSerial.DEVICE_PIN_READ or type == 'pin_read':
-            pub.sendMessage('led', identifiers='status5', color='green')
-            write_order(self.serial_file, Order.READ)
-            write_i8(self.serial_file, identifier)
+    def acknowledged(self, command):
+        """Called from the listener thread once an order is acknowledged (result), expired (None) or acknowledged late"""
+        if command.late is not None:
+            pub.sendMessage('log:debug', msg='[ArduinoSerial] Late acknowledgement %s for %s id: %s val: %s', args=(command.late,) + tuple(command.description))
+        elif command.result is None:
+            pub.sendMessage('log:warning', msg='[ArduinoSerial] No acknowledgement for %s id: %s val: %s', args=command.description)
+        elif command.event is None:
+            pub.sendMessage('log:debug', msg='[ArduinoSerial] Moved value from Arduino: %s', args=(command.result,))
+        if self.busy and not self.pending and self.command_queue.empty():
+            self.busy = False
             pub.sendMessage('led', identifiers='status5', color='off')
-            return read_i16(self.serial_file)
-        pub.sendMessage('led', identifiers='status5', color='off')
@@ -0,0 +1,72 @@
+import threading
+from time import monotonic
+
+class Coalescer:
+    def __init__(self, sink, rate=50):
+        """
+        Coalescer class
+        Merges bursts of servo commands so only the latest target for each servo is sent.
+        Relative moves are summed, an absolute target replaces anything queued before it,
+        and a relative move after an absolute target is folded into that target.
+        Targets are flushed to the sink at most once per control period; the first command
+        after an idle period is sent immediately.
+        All targets from one period are handed to the sink together so they can be sent as a single order.
+        :param sink: callable(batch) that sends a list of (identifier, value, relative) servo targets
+        :param rate: control rate in Hz
+
+        Example:
+        coalescer = Coalescer(arduino.write_servos, rate=50)
+        coalescer.add(7, 10, relative=True)
+        """
+        self.sink = sink
+        self.interval = 1 / rate
+        self.targets = {}  # identifier: [value, relative]
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.exit_event = threading.Event()
+        self.last_flush = 0
+        self.received = 0
+        self.sent = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, identifier, value, relative=False):
+        with self.lock:
+            self.received += 1
+            target = self.targets.get(identifier)
+            if target is None or not relative:
+                self.targets[identifier] = [value, relative]
+            elif target[1]:
+                # relative + relative
+                target[0] += value
+            else:
+                # absolute + relative, keep it absolute
+                target[0] = min(100, max(0, target[0] + value))
+        self.ready.set()
+
+    def flush(self):
+        with self.lock:
+            targets = self.targets
+            self.targets = {}
+        batch = [(identifier, value, relative) for identifier, (value, relative) in targets.items()
+                 if not (relative and value == 0)]
+        if batch:
+            self.sent += len(batch)
+            self.sink(batch)
+
+    def run(self):
+        while not self.exit_event.is_set():
+            if not self.ready.wait(0.5):
+                continue
+            wait = self.last_flush + self.interval - monotonic()
+            if wait > 0:
+                self.exit_event.wait(wait)
+            self.ready.clear()
+            self.flush()
+            self.last_flush = monotonic()
+
+    def stop(self):
+        self.exit_event.set()
+        self.ready.set()
+        self.thread.join(1)
+        self.flush()
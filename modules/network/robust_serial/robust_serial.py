@@ -20,6 +20,63 @@ class Order(Enum):
     LED = 7
     PIN = 8
     READ = 9
+    SERVO_MULTI = 10
+    SERVO_MULTI_RELATIVE = 11
+
+# Precompiled frames (little endian, matching PiConnect on the Arduino)
+# Each order is packed into a single buffer so it can be sent with one write
+SERVO_FRAME = struct.Struct('<bbh')  # order, servo id, value
+PIN_FRAME = struct.Struct('<bbb')    # order, pin, value
+READ_FRAME = struct.Struct('<bb')    # order, pin
+I16 = struct.Struct('<h')            # acknowledgement / read value
+
+
+def encode_servo(order, identifier, value):
+    """
+    :param order: (Order Enum Object) SERVO or SERVO_RELATIVE
+    :param identifier: (int8_t) servo index
+    :param value: (int16_t) percentage
+    :return: (bytes)
+    """
+    return SERVO_FRAME.pack(order.value, identifier, value)
+
+
+def encode_servo_multi(order, pairs):
+    """
+    :param order: (Order Enum Object) SERVO_MULTI or SERVO_MULTI_RELATIVE
+    :param pairs: ([(int8_t, int16_t)]) servo index and percentage for each servo
+    :return: (bytes) order, count, then an index and value per servo
+    """
+    values = [item for pair in pairs for item in pair]
+    return struct.pack('<bb' + 'bh' * len(pairs), order.value, len(pairs), *values)
+
+
+def encode_pin(identifier, value):
+    """
+    :param identifier: (int8_t) pin number
+    :param value: (int8_t)
+    :return: (bytes)
+    """
+    return PIN_FRAME.pack(Order.PIN.value, identifier, value)
+
+
+def encode_read(identifier):
+    """
+    :param identifier: (int8_t) pin number
+    :return: (bytes)
+    """
+    return READ_FRAME.pack(Order.READ.value, identifier)
+
+
+def encode_led(identifiers, color):
+    """
+    :param identifiers: ([int8_t]) LED indexes
+    :param color: (tuple) RGB values as int8_t or a single int16_t value
+    :return: (bytes)
+    """
+    if isinstance(color, tuple):
+        return struct.pack('<bb%db%db' % (len(identifiers), len(color)), Order.LED.value, len(identifiers), *identifiers, *color)
+    return struct.pack('<bb%dbh' % len(identifiers), Order.LED.value, len(identifiers), *identifiers, color)
 
 def read_order(f):
     """
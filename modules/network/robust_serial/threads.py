@@ -5,52 +5,98 @@ import time
 
 import serial
 
-from .robust_serial import write_order, Order, write_i8, write_i16, decode_order
+from .robust_serial import I16
 from .utils import queue
 
 rate = 1 / 2000  # 2000 Hz (limit the rate of communication with the arduino)
 
 
+class Command(object):
+    """
+    A single order, framed into one buffer ready to be written to the serial port.
+
+    :param frame: (bytes) the complete order as produced by the robust_serial encode_* helpers
+    :param reply: (bool) True if the arduino sends an int16 acknowledgement for this order
+    :param description: (tuple) (type, identifier, value) for logging
+    :param wait: (bool) True if the sender will block on the result (creates an Event)
+    """
+    __slots__ = ('frame', 'reply', 'description', 'result', 'sent', 'event', 'expired', 'late')
+
+    def __init__(self, frame, reply=False, description=(), wait=False):
+        self.frame = frame
+        self.reply = reply
+        self.description = description
+        self.result = None
+        self.sent = None
+        self.event = threading.Event() if wait else None
+        self.expired = False  # given up on, its acknowledgement is still expected
+        self.late = None  # acknowledgement that arrived after the command expired
+
+    def done(self, result):
+        self.result = result
+        if self.event is not None:
+            self.event.set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the command has been acknowledged
+        :return: the acknowledgement value or None on timeout
+        """
+        if self.event is None or not self.event.wait(timeout):
+            return None
+        return self.result
+
+
 class CommandThread(threading.Thread):
     """
     Thread that send orders to the arduino
-    it blocks if there no more send_token left (here it is the n_received_semaphore).
+    Each order is written with a single write call.
+    It blocks if there no more send_token left (here it is the n_received_semaphore),
+    so only a limited number of orders are waiting to be acknowledged at any time.
 
     :param serial_file: (Serial object)
-    :param command_queue: (Queue)
+    :param command_queue: (Queue) of Command objects
     :param exit_event: (Threading.Event object)
     :param n_received_semaphore: (threading.Semaphore)
     :param serial_lock: (threading.Lock)
+    :param pending: (collections.deque) commands awaiting acknowledgement, shared with the ListenerThread
+    :param on_sent: (callable) optional, called with each command after it is written
     """
 
-    def __init__(self, serial_file, command_queue, exit_event, n_received_semaphore, serial_lock):
+    def __init__(self, serial_file, command_queue, exit_event, n_received_semaphore, serial_lock, pending, on_sent=None):
         threading.Thread.__init__(self)
-        self.deamon = True
+        self.daemon = True
         self.serial_file = serial_file
         self.command_queue = command_queue
         self.exit_event = exit_event
         self.n_received_semaphore = n_received_semaphore
         self.serial_lock = serial_lock
+        self.pending = pending
+        self.on_sent = on_sent
 
     def run(self):
         while not self.exit_event.is_set():
-            self.n_received_semaphore.acquire()
-            if self.exit_event.is_set():
-                break
             try:
-                order, param = self.command_queue.get_nowait()
+                command = self.command_queue.get(timeout=0.1)
             except queue.Empty:
-                time.sleep(rate)
-                self.n_received_semaphore.release()
                 continue
 
+            if command.reply:
+                # Wait for a send token, released by the ListenerThread when an acknowledgement arrives
+                while not self.n_received_semaphore.acquire(timeout=0.1):
+                    if self.exit_event.is_set():
+                        return
+                command.sent = time.monotonic()
+                # Register before writing so the listener can always match the reply
+                self.pending.append(command)
+
             with self.serial_lock:
-                write_order(self.serial_file, order)
-                # print("Sent {}".format(order))
-                if order == Order.MOTOR:
-                    write_i8(self.serial_file, param)
-                elif order == Order.SERVO:
-                    write_i16(self.serial_file, param)
+                self.serial_file.write(command.frame)
+
+            if not command.reply:
+                command.done(None)
+            if self.on_sent is not None:
+                self.on_sent(command)
             time.sleep(rate)
         print("Command Thread Exited")
 
@@ -58,40 +104,94 @@ class CommandThread(threading.Thread):
 class ListenerThread(threading.Thread):
     """
     Thread that listen to the Arduino
-    It is used to add send_tokens to the n_received_semaphore
+    Matches each int16 acknowledgement to the oldest outstanding command
+    and adds a send_token to the n_received_semaphore.
+    The Arduino answers in order, so a command that is not acknowledged within ack_timeout is expired
+    (its sender stops waiting) but stays in line: its late acknowledgement is discarded when it arrives
+    and only then is its send token returned, so replies never shift onto the next command.
+    If the oldest expired command is still not acknowledged after resync_timeout the reply was lost,
+    the input is flushed and every outstanding command is dropped to get back in step.
 
-    :param serial_file: (Serial object)
+    :param serial_file: (Serial object) opened with a read timeout
     :param exit_event: (threading.Event object)
     :param n_received_semaphore: (threading.Semaphore)
-    :param serial_lock: (threading.Lock)
+    :param pending: (collections.deque) commands awaiting acknowledgement, shared with the CommandThread
+    :param ack_timeout: (float) seconds before an unacknowledged command is expired
+    :param resync_timeout: (float) seconds before an unacknowledged command is considered lost
+    :param on_ack: (callable) optional, called with each command once acknowledged, expired or acknowledged late
     """
 
-    def __init__(self, serial_file, exit_event, n_received_semaphore, serial_lock):
+    def __init__(self, serial_file, exit_event, n_received_semaphore, pending, ack_timeout=10, resync_timeout=30, on_ack=None):
         threading.Thread.__init__(self)
-        self.deamon = True
+        self.daemon = True
         self.serial_file = serial_file
         self.exit_event = exit_event
         self.n_received_semaphore = n_received_semaphore
-        self.serial_lock = serial_lock
+        self.pending = pending
+        self.ack_timeout = ack_timeout
+        self.resync_timeout = resync_timeout
+        self.on_ack = on_ack
+        self.buffer = bytearray()
 
     def run(self):
         while not self.exit_event.is_set():
             try:
-                bytes_array = bytearray(self.serial_file.read(1))
+                data = self.serial_file.read(I16.size - len(self.buffer))
             except serial.SerialException:
                 time.sleep(rate)
                 continue
-            if not bytes_array:
-                time.sleep(rate)
+            if not data:
+                self.expire()
                 continue
-            byte = bytes_array[0]
-            with self.serial_lock:
-                try:
-                    order = Order(byte)
-                except ValueError:
-                    continue
-                if order == Order.RECEIVED:
-                    self.n_received_semaphore.release()
-                decode_order(self.serial_file, byte)
-            time.sleep(rate)
+            self.receive(data)
         print("Listener Thread Exited")
+
+    def receive(self, data):
+        self.buffer += data
+        if len(self.buffer) < I16.size:
+            return
+        value = I16.unpack(self.buffer)[0]
+        self.buffer.clear()
+        try:
+            command = self.pending.popleft()
+        except IndexError:
+            # Unsolicited data, nothing is waiting for it
+            return
+        if command.expired:
+            command.late = value
+        else:
+            command.done(value)
+        self.n_received_semaphore.release()
+        if self.on_ack is not None:
+            self.on_ack(command)
+
+    def expire(self):
+        now = time.monotonic()
+        if self.pending and now - self.pending[0].sent > self.resync_timeout:
+            self.resync()
+            return
+        # Commands are queued in the order they were sent, stop at the first one still in time
+        for command in list(self.pending):
+            if now - command.sent <= self.ack_timeout:
+                break
+            if not command.expired:
+                command.expired = True
+                command.done(None)
+                if self.on_ack is not None:
+                    self.on_ack(command)
+
+    def resync(self):
+        """An acknowledgement was lost, drop everything outstanding and start again from an empty input"""
+        self.serial_file.reset_input_buffer()
+        self.buffer.clear()
+        while True:
+            try:
+                command = self.pending.popleft()
+            except IndexError:
+                break
+            if not command.expired:
+                command.expired = True
+                command.done(None)
+                if self.on_ack is not None:
+                    self.on_ack(command)
+            self.n_received_semaphore.release()
@@ -1,7 +1,6 @@
 from random import randint
-from time import sleep, localtime
+from time import sleep, localtime, monotonic
 from pubsub import pub
-from datetime import datetime, timedelta
 
 from modules.config import Config
 
@@ -54,7 +53,10 @@ class Personality:
 
     def loop(self):
         # pub.sendMessage('speech', text="Hello, I am happy") # for testing sentiment responses
-        if not self.is_asleep() and not self.behaviours.faces.face_detected and not self.behaviours.motion.is_motion() and not self.behaviours.objects.is_detected:
+        # Nothing to check while asleep, feelings and sleep are handled by their own events
+        if self.is_asleep():
+            return
+        if not self.behaviours.faces.face_detected and not self.behaviours.motion.is_motion() and not self.behaviours.objects.is_detected:
             self.set_eye('red')
 
         if self.state == Config.STATE_ALERT and self.lt(self.behaviours.faces.last_face, self.past(2*60)) and self.lt(self.behaviours.objects.last_detection, self.past(2*60)):
@@ -122,4 +124,5 @@ class Personality:
         return date is None or date < compare
 
     def past(self, seconds):
-        return datetime.now() - timedelta(seconds=seconds)
\ No newline at end of file
+        """Monotonic time some seconds ago, to compare with the last_* times of the behaviours"""
+        return monotonic() - seconds
\ No newline at end of file
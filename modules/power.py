@@ -0,0 +1,82 @@
+from time import monotonic
+from pubsub import pub
+from modules.config import Config
+from modules.scheduler import Scheduler
+
+class Power:
+    def __init__(self, **kwargs):
+        """
+        Power class
+        Puts the robot in low power while it sleeps: the heavy producers (vision capture, LED animation)
+        are paused with 'power:sleep' and the scheduler ticks slower, only cheap checks keep running.
+        Speech input is not resumed, it stops on 'sleep' and 'rest' and waits for 'speech:listen'.
+        Motion from the PIR sensor resumes everything at once, if the robot does not wake up
+        low power is entered again once no motion was seen for wake_time seconds.
+        :param kwargs: rates, wake_time
+        :param rates: dictionary of topic: interval in seconds while in low power, restored to the scheduler config on wake
+        :param wake_time: seconds without motion before a sleeping robot woken by motion goes back to low power
+
+        Subscribes to 'sleep' to enter low power
+        Subscribes to 'rest' and 'wake' to leave low power
+        Subscribes to 'motion' to leave low power while there is motion
+        Subscribes to 'loop:1' to go back to low power after wake_time
+
+        Publishes 'power:sleep' when entering low power, producers pause
+        Publishes 'power:wake' when leaving low power, producers resume
+        Publishes 'scheduler:rate' to change the tick rates
+
+        Example:
+        pub.subscribe(self.pause, 'power:sleep')
+        pub.subscribe(self.resume, 'power:wake')
+        """
+        self.rates = kwargs.get('rates', {'loop': 1})
+        self.wake_time = kwargs.get('wake_time', 30)
+        topics = Config.get('scheduler', 'config').get('topics', Scheduler.DEFAULT_TOPICS)
+        self.awake_rates = {topic: topics.get(topic, Scheduler.DEFAULT_TOPICS.get(topic)) for topic in self.rates}
+        self.sleeping = False  # the robot is asleep
+        self.low_power = False  # producers are paused
+        self.last_motion = None
+        self.since = None  # time low power was entered
+
+        pub.subscribe(self.sleep, 'sleep')
+        pub.subscribe(self.wake, 'rest')
+        pub.subscribe(self.wake, 'wake')
+        pub.subscribe(self.motion, 'motion')
+        pub.subscribe(self.loop, 'loop:1')
+
+    def sleep(self):
+        self.sleeping = True
+        self.enter()
+
+    def wake(self):
+        self.sleeping = False
+        self.leave()
+
+    def motion(self):
+        if self.sleeping:
+            self.last_motion = monotonic()
+            self.leave()
+
+    def loop(self):
+        if self.sleeping and not self.low_power and (self.last_motion is None or monotonic() - self.last_motion > self.wake_time):
+            self.enter()
+
+    def enter(self):
+        if self.low_power:
+            return
+        self.low_power = True
+        self.since = monotonic()
+        pub.sendMessage('power:sleep')
+        for topic, interval in self.rates.items():
+            pub.sendMessage('scheduler:rate', topic=topic, interval=interval)
+        pub.sendMessage('log', msg='[Power] Low power')
+
+    def leave(self):
+        if not self.low_power:
+            return
+        self.low_power = False
+        for topic, interval in self.awake_rates.items():
+            if interval is not None:
+                pub.sendMessage('scheduler:rate', topic=topic, interval=interval)
+        pub.sendMessage('power:wake')
+        pub.sendMessage('log', msg='[Power] Resumed after %.0f s in low power', args=(monotonic() - self.since,))
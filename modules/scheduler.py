@@ -0,0 +1,170 @@
+import threading
+from time import monotonic
+from pubsub import pub
+
+class Task:
+    """
+    Book-keeping for a single scheduled topic
+    """
+    __slots__ = ('topic', 'interval', 'deadline', 'ticks', 'overruns', 'skipped', 'max_lateness', 'max_duration')
+
+    def __init__(self, topic, interval):
+        self.topic = topic
+        self.interval = interval
+        self.deadline = None
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.max_lateness = 0
+        self.max_duration = 0
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'max_lateness': round(self.max_lateness, 4),
+            'max_duration': round(self.max_duration, 4)
+        }
+
+class Scheduler:
+    DEFAULT_TOPICS = {'loop': 0.033, 'loop:1': 1, 'loop:10': 10, 'loop:60': 60}
+
+    def __init__(self, **kwargs):
+        """
+        Scheduler class
+        Publishes the main loop topics at a fixed rate and sleeps until the next deadline instead of busy-waiting.
+        Deadlines are kept on the monotonic clock and advanced by whole intervals, so slow ticks do not cause drift.
+        :param kwargs: topics, report_interval
+        :param topics: dictionary of topic: interval in seconds
+        :param report_interval: seconds between scheduler reports (0 to disable)
+
+        Subscribes to 'scheduler:rate' to change the interval of a topic
+        - Argument: topic (string) - topic to change
+        - Argument: interval (float) - new interval in seconds
+
+        Subscribes to 'scheduler:stop' to stop the scheduler after the current tick
+
+        Publishes 'scheduler:stats' every report_interval seconds
+        - Argument: stats (dict) - ticks, overruns, skipped ticks, max lateness and max duration per topic
+
+        Example:
+        scheduler = Scheduler(topics={'loop': 0.05, 'loop:1': 1})
+        scheduler.run() # blocks until stopped
+        pub.sendMessage('scheduler:rate', topic='loop', interval=0.5)
+        """
+        topics = kwargs.get('topics', Scheduler.DEFAULT_TOPICS)
+        self.tasks = {topic: Task(topic, float(interval)) for topic, interval in topics.items()}
+        self.report_interval = kwargs.get('report_interval', 60)
+        self.next_report = None
+        self.running = False
+        # set_rate is called on the publisher's thread, tasks are only changed or read while holding the lock
+        self.lock = threading.Lock()
+        # Set to interrupt the sleep between ticks (rate change or stop)
+        self.wake = threading.Event()
+
+        pub.subscribe(self.set_rate, 'scheduler:rate')
+        pub.subscribe(self.stop, 'scheduler:stop')
+
+    def set_rate(self, topic, interval):
+        """
+        Change the interval of a topic. The next deadline is recalculated from the last tick.
+        Safe to call from any thread, an interval that is not a positive number is rejected.
+        :param topic: topic to change (added if not already scheduled)
+        :param interval: new interval in seconds
+        """
+        try:
+            interval = float(interval)
+        except (TypeError, ValueError):
+            interval = 0
+        if not interval > 0:
+            pub.sendMessage('log:error', msg='[Scheduler] Invalid interval for ' + topic + ': ' + str(interval))
+            return
+        with self.lock:
+            task = self.tasks.get(topic)
+            if task is None:
+                task = Task(topic, interval)
+                if self.running:
+                    task.deadline = monotonic() + interval
+                self.tasks[topic] = task
+            else:
+                if task.deadline is not None:
+                    task.deadline = task.deadline - task.interval + interval
+                task.interval = interval
+        pub.sendMessage('log', msg='[Scheduler] ' + topic + ' interval set to ' + str(interval))
+        self.wake.set()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def run(self):
+        """
+        Publish each topic when its deadline is reached, then sleep until the next one.
+        Blocks until stop() is called. Exceptions raised by listeners are propagated to the caller.
+        """
+        with self.lock:
+            self.running = True
+            start = monotonic()
+            for task in self.tasks.values():
+                task.deadline = start + task.interval
+        if self.report_interval:
+            self.next_report = start + self.report_interval
+
+        while self.running:
+            now = monotonic()
+            with self.lock:
+                due = [task for task in self.tasks.values() if now >= task.deadline]
+            # Listeners run without the lock, they may change rates themselves
+            for task in due:
+                if now >= task.deadline:
+                    self.tick(task, now)
+                    if not self.running:
+                        return
+
+            if self.next_report is not None and now >= self.next_report:
+                self.report()
+                self.next_report += self.report_interval
+
+            # Cleared before the delay is worked out, so a rate change made meanwhile still ends the wait
+            self.wake.clear()
+            with self.lock:
+                delay = min(task.deadline for task in self.tasks.values()) - monotonic()
+            if delay > 0 and self.running:
+                self.wake.wait(delay)
+
+    def tick(self, task, now):
+        lateness = now - task.deadline
+        pub.sendMessage(task.topic)
+        duration = monotonic() - now
+
+        task.ticks += 1
+        if duration > task.interval:
+            task.overruns += 1
+        task.max_lateness = max(task.max_lateness, lateness)
+        task.max_duration = max(task.max_duration, duration)
+
+        # Advance by whole intervals from the previous deadline to avoid drift.
+        # If we fell behind by more than one interval, skip the missed ticks rather than bursting to catch up.
+        missed = int(lateness // task.interval) if lateness > task.interval else 0
+        with self.lock:
+            task.skipped += missed
+            task.deadline += task.interval * (missed + 1)
+
+    def stats(self):
+        with self.lock:
+            return {topic: task.stats() for topic, task in self.tasks.items()}
+
+    def report(self):
+        stats = self.stats()
+        pub.sendMessage('scheduler:stats', stats=stats)
+        for topic, task in stats.items():
+            if task['overruns'] or task['skipped']:
+                pub.sendMessage('log', msg='[Scheduler] ' + topic + ' ' + str(task))
+        with self.lock:
+            for task in self.tasks.values():
+                task.reset()
@@ -77,6 +77,9 @@ class Calibration:
             # print(f'Initial: {initial_center_x}, New: {new_center_x}, Diff: {pixel_movement}, Px/%: {pixels_per_percent}')
             
             print(f"Calibration complete: New PIXELS_PER_DEG assigned for axis {axis}. values: {Tracking.PIXELS_PER_DEG}")
+            # Keep the result for the next start
+            self.tracking.calibration.gains = Tracking.PIXELS_PER_DEG
+            self.tracking.calibration.save()
             
         else:
             print('No second match to calibrate against!')
@@ -0,0 +1,121 @@
+import json
+import os.path
+from collections import deque
+from statistics import median
+
+class OnlineCalibration:
+    def __init__(self, gains, **kwargs):
+        """
+        OnlineCalibration class
+        Keeps refining the pixels per percent gain of each servo axis (Tracking.PIXELS_PER_DEG) while tracking.
+        Every commanded servo move is recorded, and each time the followed object is detected again its displacement
+        is divided by the moves commanded in between. The gain is the median of the recent slopes,
+        a robust fit through the origin, so an object walking away or a bad detection does not throw it off.
+        Results are written to a file and loaded at startup.
+        :param gains: (x, y) starting gains, used until there are enough samples
+        :param kwargs: path, window, min_samples, min_move, max_gap, latency, save_interval
+        :param path: calibration file
+        :param window: number of recent samples per axis
+        :param min_samples: samples needed before the gain is updated
+        :param min_move: smallest move in percent between two detections that gives a sample
+        :param max_gap: maximum seconds between two detections of the object for a sample
+        :param latency: seconds between a frame being captured and its detections arriving
+        :param save_interval: minimum seconds between writes of the calibration file
+
+        Example:
+        calibration = OnlineCalibration(Tracking.PIXELS_PER_DEG, path='calibration.json')
+        calibration.commanded(now, (2, 0))
+        gains = calibration.observe(now, track_id, (cx, cy))
+        """
+        self.gains = tuple(gains)
+        self.path = kwargs.get('path', 'calibration.json')
+        self.window = kwargs.get('window', 50)
+        self.min_samples = kwargs.get('min_samples', 10)
+        self.min_move = kwargs.get('min_move', 1)
+        self.max_gap = kwargs.get('max_gap', 3.0)
+        self.latency = kwargs.get('latency', 0.05)
+        self.save_interval = kwargs.get('save_interval', 30)
+        self.moves = deque(maxlen=1000)  # (time, x, y) commanded moves in percent
+        self.samples = (deque(maxlen=self.window), deque(maxlen=self.window))
+        self.last = None  # (time, target, center) of the last detection of the followed object
+        self.saved = None
+        self.saved_time = None
+
+    def load(self):
+        """
+        :return: (x, y) gains from the calibration file, or None if there is no file
+        """
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            self.gains = self.saved = tuple(json.load(f)['pixels_per_percent'])
+        return self.gains
+
+    def save(self):
+        if self.gains == self.saved:
+            return
+        with open(self.path, 'w') as f:
+            json.dump({'pixels_per_percent': list(self.gains), 'samples': [len(s) for s in self.samples]}, f)
+        self.saved = self.gains
+
+    def commanded(self, now, moves):
+        """
+        Record a relative servo move
+        :param now: time of the move
+        :param moves: (x, y) in percent
+        """
+        if moves[0] or moves[1]:
+            self.moves.append((now, moves[0], moves[1]))
+
+    def moved(self, start, end):
+        """Total move per axis commanded between two capture times"""
+        start, end = start - self.latency, end - self.latency
+        total = [0.0, 0.0]
+        for time, x, y in reversed(self.moves):
+            if time <= start:
+                break
+            if time <= end:
+                total[0] += x
+                total[1] += y
+        return total
+
+    def observe(self, now, target, center):
+        """
+        Add a detection of the followed object
+        :param now: time of the detection
+        :param target: track id
+        :param center: (x, y) detected center in pixels
+        :return: the new (x, y) gains if they changed, otherwise None
+        """
+        last, self.last = self.last, (now, target, center)
+        if last is None or last[1] != target or now - last[0] > self.max_gap:
+            return None
+        moved = self.moved(last[0], now)
+        changed = False
+        for axis in (0, 1):
+            if abs(moved[axis]) < self.min_move:
+                continue
+            # The object moves the opposite way to the camera
+            self.samples[axis].append(-(center[axis] - last[2][axis]) / moved[axis])
+            changed = True
+        if not changed:
+            return None
+        gains = self.estimate()
+        if gains == self.gains:
+            return None
+        self.gains = gains
+        if self.saved_time is None or now - self.saved_time >= self.save_interval:
+            self.saved_time = now
+            self.save()
+        return gains
+
+    def estimate(self):
+        gains = list(self.gains)
+        for axis in (0, 1):
+            if len(self.samples[axis]) < self.min_samples:
+                continue
+            gain = median(self.samples[axis])
+            # A flipped sign means the samples are noise rather than a better estimate
+            if gain and (gains[axis] == 0 or (gain > 0) == (gains[axis] > 0)):
+                gains[axis] = gain
+        return tuple(gains)
@@ -0,0 +1,81 @@
+from functools import lru_cache
+
+import cv2
+from picamera2 import MappedArray
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.5
+
+@lru_cache(maxsize=512)
+def text_size(text):
+    """Text size and baseline, the distance labels repeat often enough that measuring each one every frame is wasted"""
+    return cv2.getTextSize(text, FONT, FONT_SCALE, 1)
+
+class Overlay:
+    def __init__(self, imx500, labels, preserve_aspect_ratio=False, alpha=0.30):
+        """
+        Overlay class
+        Draws detections onto the camera frame in place.
+        Only the label backgrounds are blended, each as a small ROI of the frame, so no full frame copy is made.
+        :param imx500: IMX500 device, used for the ROI when preserving the aspect ratio
+        :param labels: list of category labels
+        :param preserve_aspect_ratio: draw the network input ROI
+        :param alpha: opacity of the label backgrounds
+
+        Example:
+        overlay = Overlay(imx500, vision.get_labels())
+        picam2.pre_callback = lambda request: overlay.draw(request, detections)
+        """
+        self.imx500 = imx500
+        self.labels = labels
+        self.preserve_aspect_ratio = preserve_aspect_ratio
+        self.alpha = alpha
+
+    @lru_cache(maxsize=None)
+    def label(self, category):
+        return self.labels[int(category)]
+
+    def draw(self, request, detections, stream='main'):
+        """Draw the detections for this request onto the ISP output."""
+        if not detections and not self.preserve_aspect_ratio:
+            return
+        with MappedArray(request, stream) as m:
+            frame = m.array
+            height, width = frame.shape[:2]
+            screen_center_x = width // 2
+            screen_center_y = height // 2
+
+            for detection in detections:
+                x, y, w, h = detection.box
+                detection_center_x = x + w // 2
+                detection_center_y = y + h // 2
+
+                # Draw detection box
+                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0, 0), thickness=2)
+                # Draw horizontal line (X-axis)
+                cv2.line(frame, (detection_center_x, detection_center_y), (screen_center_x, detection_center_y), (0, 255, 255), 2)
+                # Draw vertical line (Y-axis)
+                cv2.line(frame, (screen_center_x, detection_center_y), (screen_center_x, screen_center_y), (255, 0, 255), 2)
+
+                text_x = x + 5
+                self.text(frame, f"{self.label(detection.category)} ({detection.conf:.2f})", text_x, y + 15)
+                self.text(frame, f"X-Dist: {abs(detection.distance_x)} px {detection_center_x - screen_center_x}", text_x, y + 30)
+                self.text(frame, f"Y-Dist: {abs(detection.distance_y)} px {detection_center_y - screen_center_y}", text_x, y + 45)
+
+            if self.preserve_aspect_ratio:
+                b_x, b_y, b_w, b_h = self.imx500.get_roi_scaled(request)
+                color = (255, 0, 0)  # red
+                cv2.putText(frame, "ROI", (b_x + 5, b_y + 15), FONT, FONT_SCALE, color, 1)
+                cv2.rectangle(frame, (b_x, b_y), (b_x + b_w, b_y + b_h), (255, 0, 0, 0))
+
+    def text(self, frame, text, x, y):
+        """Draw text over a translucent white background, blending only the area behind the text"""
+        (text_width, text_height), baseline = text_size(text)
+        height, width = frame.shape[:2]
+        x0, y0 = max(x, 0), max(y - text_height, 0)
+        x1, y1 = min(x + text_width, width), min(y + baseline, height)
+        if x1 > x0 and y1 > y0:
+            roi = frame[y0:y1, x0:x1]
+            # roi * (1 - alpha) + white * alpha
+            cv2.addWeighted(roi, 1 - self.alpha, roi, 0, 255 * self.alpha, dst=roi)
+        cv2.putText(frame, text, (x, y), FONT, FONT_SCALE, (0, 0, 255), 1)
@@ -0,0 +1,72 @@
+class PID:
+    def __init__(self, kp, ki=0.0, kd=0.0, deadband=0.0, output_limit=None, rate_limit=None, integral_limit=None):
+        """
+        PID class
+        PID controller with a deadband on the error, a limit on the output and on how fast the output may change.
+        Inside the deadband the output is brought to zero, the integral is kept for the next correction.
+        The integral stops growing while the output is saturated (anti-windup).
+        :param kp: proportional gain
+        :param ki: integral gain
+        :param kd: derivative gain
+        :param deadband: errors smaller than this are treated as zero
+        :param output_limit: maximum absolute output
+        :param rate_limit: maximum change of the output per second
+        :param integral_limit: maximum absolute integral
+
+        Example:
+        pid = PID(2.0, ki=0.1, deadband=15, output_limit=400, rate_limit=2000)
+        velocity = pid.update(error, dt)
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.deadband = deadband
+        self.output_limit = output_limit
+        self.rate_limit = rate_limit
+        self.integral_limit = integral_limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.last_error = None
+        self.output = 0.0
+
+    def update(self, error, dt):
+        """
+        :param error: setpoint - measurement
+        :param dt: seconds since the last update
+        :return: the new output
+        """
+        if dt <= 0:
+            return self.output
+        if abs(error) <= self.deadband:
+            self.last_error = None
+            return self.limit(0.0, dt)[0]
+
+        integral = self.integral + error * dt
+        if self.integral_limit is not None:
+            integral = max(-self.integral_limit, min(self.integral_limit, integral))
+        derivative = 0.0 if self.last_error is None else (error - self.last_error) / dt
+        self.last_error = error
+
+        output, saturated = self.limit(self.kp * error + self.ki * integral + self.kd * derivative, dt)
+        if not saturated:
+            self.integral = integral
+        return output
+
+    def limit(self, output, dt):
+        """
+        Apply the output and rate limits
+        :return: (output, True if it was limited)
+        """
+        saturated = False
+        if self.output_limit is not None and abs(output) > self.output_limit:
+            output = max(-self.output_limit, min(self.output_limit, output))
+            saturated = True
+        if self.rate_limit is not None:
+            step = self.rate_limit * dt
+            limited = max(self.output - step, min(self.output + step, output))
+            saturated = saturated or limited != output
+            output = limited
+        self.output = output
+        return output, saturated
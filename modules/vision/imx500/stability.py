@@ -0,0 +1,85 @@
+import numpy as np
+from time import monotonic
+
+class StabilityDetector:
+    def __init__(self, **kwargs):
+        """
+        StabilityDetector class
+        Decides whether the camera image has settled, using a downsampled grayscale (luma) frame.
+        Pixels only count as changed when they differ by more than pixel_threshold, so sensor noise is ignored.
+        All buffers are allocated once for the first frame and reused.
+        While the servos are moving the image check is skipped entirely.
+        :param kwargs: threshold, pixel_threshold, stable_frames, step, settle_time
+        :param threshold: fraction of pixels that may change between stable frames
+        :param pixel_threshold: grey level difference needed for a pixel to count as changed
+        :param stable_frames: number of consecutive stable frames to confirm stabilization
+        :param step: only every step-th pixel in each direction is compared
+        :param settle_time: seconds to treat the image as moving after a servo order
+
+        Example:
+        stability = StabilityDetector(step=2)
+        stability.motion()  # servo order sent
+        stable = stability.update(luma)
+        """
+        self.threshold = kwargs.get('threshold', 0.05)
+        self.pixel_threshold = kwargs.get('pixel_threshold', 15)
+        self.stable_frames = kwargs.get('stable_frames', 8)
+        self.step = kwargs.get('step', 2)
+        self.settle_time = kwargs.get('settle_time', 0.5)
+        self.stable_count = 0
+        self.moving_until = 0
+        self.skipped = 0
+        self.current = None
+        self.previous = None
+        self.diff = None
+        self.mask = None
+        self.has_previous = False
+
+    def motion(self):
+        """Servo order sent, the image is moving until settle_time has passed"""
+        self.moving_until = monotonic() + self.settle_time
+        self.stable_count = 0
+        self.has_previous = False
+
+    def is_moving(self):
+        return monotonic() < self.moving_until
+
+    def update(self, luma):
+        """
+        Compare a frame with the previous one
+        :param luma: 2D uint8 array (e.g. the Y plane of the lores stream), may be a view
+        :return: True once the image has been stable for stable_frames
+        """
+        if self.is_moving():
+            self.skipped += 1
+            return False
+
+        view = luma[::self.step, ::self.step]
+        if self.current is None or self.current.shape != view.shape:
+            self.allocate(view.shape)
+        np.copyto(self.current, view)
+
+        if not self.has_previous:
+            # First frame after start or movement, nothing to compare with yet
+            self.current, self.previous = self.previous, self.current
+            self.has_previous = True
+            return False
+
+        np.subtract(self.current, self.previous, out=self.diff, dtype=np.int16)
+        np.abs(self.diff, out=self.diff)
+        np.greater(self.diff, self.pixel_threshold, out=self.mask)
+        changed = np.count_nonzero(self.mask) / self.mask.size
+        self.current, self.previous = self.previous, self.current
+
+        if changed < self.threshold:
+            self.stable_count += 1
+        else:
+            self.stable_count = 0
+        return self.stable_count >= self.stable_frames
+
+    def allocate(self, shape):
+        self.current = np.empty(shape, dtype=np.uint8)
+        self.previous = np.empty(shape, dtype=np.uint8)
+        self.diff = np.empty(shape, dtype=np.int16)
+        self.mask = np.empty(shape, dtype=bool)
+        self.has_previous = False
@@ -0,0 +1,165 @@
+import itertools
+import numpy as np
+
+class MultiObjectTracker:
+    def __init__(self, **kwargs):
+        """
+        MultiObjectTracker class
+        Associates detections between frames and gives each object a stable ID.
+        Every track has a constant-velocity Kalman filter on the box center, all tracks are predicted and updated together with numpy.
+        Detections are matched to the predicted boxes by IoU, falling back to the distance between centers for fast moving objects.
+        A track that is not seen is kept on its predicted position for max_misses frames, so short occlusions do not lose it.
+        :param kwargs: iou_threshold, gate, min_hits, max_misses, process_noise, measurement_noise, size_smoothing
+        :param iou_threshold: minimum IoU to match a detection to a track
+        :param gate: maximum center distance for a match without overlap, as a multiple of the track size
+        :param min_hits: detections needed before a track is confirmed
+        :param max_misses: frames a track survives without a detection
+        :param process_noise: acceleration noise of the motion model (pixels / s^2)
+        :param measurement_noise: standard deviation of a detection's center (pixels)
+        :param size_smoothing: weight of a new detection's width and height (0-1)
+
+        Example:
+        tracker = MultiObjectTracker()
+        tracks = tracker.update(np.array([[10, 20, 50, 100]]), monotonic())
+        """
+        self.iou_threshold = kwargs.get('iou_threshold', 0.2)
+        self.gate = kwargs.get('gate', 1.0)
+        self.min_hits = kwargs.get('min_hits', 2)
+        self.max_misses = kwargs.get('max_misses', 15)
+        self.process_noise = kwargs.get('process_noise', 500.0)
+        self.measurement_noise = kwargs.get('measurement_noise', 10.0)
+        self.size_smoothing = kwargs.get('size_smoothing', 0.5)
+
+        self.ids = itertools.count(1)
+        self.state = np.zeros((0, 4))  # cx, cy, vx, vy
+        self.covariance = np.zeros((0, 4, 4))
+        self.sizes = np.zeros((0, 2))  # w, h
+        self.track_ids = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+        self.detections = np.zeros(0, dtype=np.int64)  # index of the detection matched this frame, -1 if none
+        self.last_time = None
+
+    def predict(self, dt):
+        """Move every track forward by dt seconds"""
+        if dt <= 0 or not len(self.state):
+            return
+        transition = np.eye(4)
+        transition[0, 2] = transition[1, 3] = dt
+        noise = np.array([[dt * dt / 2, 0], [0, dt * dt / 2], [dt, 0], [0, dt]])
+        self.state = self.state @ transition.T
+        self.covariance = transition @ self.covariance @ transition.T + self.process_noise ** 2 * noise @ noise.T
+
+    def boxes(self):
+        """Predicted boxes (x, y, w, h) of all tracks"""
+        return np.column_stack((self.state[:, :2] - self.sizes / 2, self.sizes))
+
+    @staticmethod
+    def iou(a, b):
+        """IoU between every box in a and every box in b, both (N, 4) arrays of (x, y, w, h)"""
+        left = np.maximum(a[:, None, 0], b[None, :, 0])
+        top = np.maximum(a[:, None, 1], b[None, :, 1])
+        right = np.minimum(a[:, None, 0] + a[:, None, 2], b[None, :, 0] + b[None, :, 2])
+        bottom = np.minimum(a[:, None, 1] + a[:, None, 3], b[None, :, 1] + b[None, :, 3])
+        intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+        union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - intersection
+        return intersection / np.maximum(union, 1e-9)
+
+    def associate(self, detections):
+        """
+        Greedily match tracks to detections, best IoU first, then closest centers
+        :return: (track indexes, detection indexes) of the matches
+        """
+        if not len(self.state) or not len(detections):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        overlap = MultiObjectTracker.iou(self.boxes(), detections)
+        centers = detections[:, :2] + detections[:, 2:] / 2
+        distance = np.linalg.norm(self.state[:, None, :2] - centers[None, :, :], axis=2)
+        gate = self.gate * self.sizes.max(axis=1)[:, None]
+        # IoU matches always rank above matches on distance alone
+        score = np.where(overlap >= self.iou_threshold, 1 + overlap,
+                         np.where(distance < gate, 1 - distance / np.maximum(gate, 1e-9), 0))
+        candidates = np.flatnonzero(score > 0)
+        candidates = candidates[np.argsort(score.ravel()[candidates])[::-1]]
+        tracks, found = [], []
+        for t, d in zip(*np.unravel_index(candidates, score.shape)):
+            if t in tracks or d in found:
+                continue
+            tracks.append(t)
+            found.append(d)
+        return np.array(tracks, dtype=np.int64), np.array(found, dtype=np.int64)
+
+    def update(self, detections, now):
+        """
+        Advance all tracks to now and update them with this frame's detections
+        :param detections: (N, 4) array of boxes (x, y, w, h)
+        :param now: timestamp of the frame in seconds
+        :return: list of confirmed tracks
+        """
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 4)
+        if self.last_time is not None:
+            self.predict(now - self.last_time)
+        self.last_time = now
+
+        tracks, found = self.associate(detections)
+        self.misses += 1
+        self.detections[:] = -1
+        if len(tracks):
+            self.correct(tracks, detections[found])
+            self.hits[tracks] += 1
+            self.misses[tracks] = 0
+            self.detections[tracks] = found
+
+        new = np.setdiff1d(np.arange(len(detections)), found)
+        if len(new):
+            self.add(detections[new])
+            self.detections[-len(new):] = new
+
+        keep = self.misses <= self.max_misses
+        if not keep.all():
+            self.state, self.covariance, self.sizes = self.state[keep], self.covariance[keep], self.sizes[keep]
+            self.track_ids, self.hits, self.misses = self.track_ids[keep], self.hits[keep], self.misses[keep]
+            self.detections = self.detections[keep]
+        return self.tracks()
+
+    def correct(self, tracks, detections):
+        """Kalman update of the matched tracks with the detected centers, the size is smoothed separately"""
+        centers = detections[:, :2] + detections[:, 2:] / 2
+        covariance = self.covariance[tracks]
+        innovation = covariance[:, :2, :2] + np.eye(2) * self.measurement_noise ** 2
+        gain = covariance[:, :, :2] @ np.linalg.inv(innovation)
+        residual = centers - self.state[tracks, :2]
+        self.state[tracks] += (gain @ residual[:, :, None])[:, :, 0]
+        self.covariance[tracks] = covariance - gain @ covariance[:, :2, :]
+        self.sizes[tracks] += self.size_smoothing * (detections[:, 2:] - self.sizes[tracks])
+
+    def add(self, detections):
+        count = len(detections)
+        state = np.zeros((count, 4))
+        state[:, :2] = detections[:, :2] + detections[:, 2:] / 2
+        covariance = np.zeros((count, 4, 4))
+        covariance[:] = np.diag([self.measurement_noise ** 2] * 2 + [(10 * self.measurement_noise) ** 2] * 2)
+        self.state = np.concatenate((self.state, state))
+        self.covariance = np.concatenate((self.covariance, covariance))
+        self.sizes = np.concatenate((self.sizes, detections[:, 2:]))
+        self.track_ids = np.concatenate((self.track_ids, [next(self.ids) for _ in range(count)]))
+        self.hits = np.concatenate((self.hits, np.ones(count, dtype=np.int64)))
+        self.misses = np.concatenate((self.misses, np.zeros(count, dtype=np.int64)))
+        self.detections = np.concatenate((self.detections, np.full(count, -1, dtype=np.int64)))
+
+    def tracks(self):
+        """
+        :return: list of dicts for confirmed tracks, bbox is the predicted box when the track was not seen this frame
+                 and detection is the index of the detection matched this frame (None if not seen)
+        """
+        confirmed = np.flatnonzero(self.hits >= self.min_hits)
+        boxes = self.boxes()[confirmed].round().astype(int).tolist()
+        return [{
+            'id': int(self.track_ids[i]),
+            'bbox': tuple(box),
+            'center': tuple(self.state[i, :2].tolist()),
+            'velocity': tuple(self.state[i, 2:].tolist()),
+            'hits': int(self.hits[i]),
+            'misses': int(self.misses[i]),
+            'detection': int(self.detections[i]) if self.detections[i] >= 0 else None
+        } for i, box in zip(confirmed.tolist(), boxes)]
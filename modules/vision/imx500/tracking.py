@@ -1,28 +1,55 @@
 import asyncio
 from pubsub import pub
-from threading import Thread
-from time import sleep
+from threading import Thread, Event
+from collections import deque
+from time import sleep, monotonic
+from modules.mailbox import Mailbox
+from modules.vision.imx500.tracker import MultiObjectTracker
+from modules.vision.imx500.pid import PID
+from modules.vision.imx500.online_calibration import OnlineCalibration
 
 class Tracking:
     TRACKING_THRESHOLD = (50, 50)
     VIDEO_SIZE = (640, 480)  # Pixel dimensions of the image
     VIDEO_CENTER = (VIDEO_SIZE[0] / 2, VIDEO_SIZE[1] / 2)
-    PIXELS_PER_DEG = (-12.5, 5.5) # Set during calibration session. Run calibrate_servo_movement() to recalibrate
+    PIXELS_PER_DEG = (-12.5, 5.5) # Refined while tracking and loaded from the calibration file at startup. Run calibrate_servo_movement() to recalibrate
 
     def __init__(self, **kwargs):
         """
         Tracking class
-        :param kwargs: active, camera, filter
+        :param kwargs: active, camera, filter, mailbox, tracker, control, control_rate, latency, pid, calibration
         :param active: True to enable tracking
         :param camera: camera object (optional)
         :param filter: category to filter (e.g., 'person')
+        :param mailbox: name of the Mailbox to read detections from on a consumer thread (None to use 'vision:detections' on pubsub)
+        :param tracker: MultiObjectTracker settings
+        :param control: 'pid' to steer the servos continuously, 'step' to move once and wait for 'vision:stable'
+        :param control_rate: PID control rate in Hz
+        :param latency: seconds between a frame being captured and its detections arriving
+        :param pid: PID settings in pixels (kp, ki, kd, deadband, max_speed in px/s, max_accel in px/s^2)
+        :param calibration: OnlineCalibration settings (path, window, min_samples, min_move, max_gap, save_interval)
         
-        Subscribes to 'vision:detections' to receive new detections
+        Reads the latest detections from the mailbox as fast as it can process them, older detections are skipped
+        Detections are processed on a single long-lived asyncio loop owned by Tracking, submit() hands them over from any thread
+        Detections are given stable IDs by a MultiObjectTracker, the servos follow one track until it is lost
+
+        In 'pid' mode a control task on the same loop steers the servos at control_rate from the followed track's predicted position.
+        Commanded servo moves are converted to pixels with PIXELS_PER_DEG and added to the detections,
+        so the tracker works in camera independent coordinates and the image does not need to be stable.
+        PIXELS_PER_DEG is refined from every commanded move and the displacement of the followed object that follows it.
+        Subscribes to 'vision:detections' to receive new detections when no mailbox is set
         Subscribes to 'vision:stable' to unfreeze tracking
         Subscribes to 'rest' to set tracking state to active
         Subscribes to 'wake' to set tracking state to active
         Subscribes to 'sleep' to set tracking state to inactive
         Subscribes to 'exit' to set tracking state to inactive
+
+        Publishes 'tracking:tracks' for each processed frame
+        - Argument: tracks (list) - confirmed tracks (id, bbox, center, velocity, hits, misses)
+        - Argument: target (int) - id of the followed track or None
+
+        Publishes 'tracking:metrics' in 'pid' mode each time the target has been centered
+        - Argument: metrics (dict) - target, time_to_center (s), overshoot (px per axis), moves
         
         Example:
         pub.sendMessage('vision:detections', matches=matches)
@@ -36,18 +63,107 @@ class Tracking:
         self.moving = False
         self.camera = kwargs.get('camera', None)
         self.filter = kwargs.get('filter', 'person')
+        self.tracker = MultiObjectTracker(**kwargs.get('tracker', {}))
+        self.target = None
+
+        self.control = kwargs.get('control', 'pid')
+        self.control_rate = kwargs.get('control_rate', 20)
+        self.latency = kwargs.get('latency', 0.05)
+        pid = kwargs.get('pid', {})
+        self.pid = [PID(pid.get('kp', 2.0), pid.get('ki', 0.1), pid.get('kd', 0.05), deadband=pid.get('deadband', 15),
+                        output_limit=pid.get('max_speed', 400), rate_limit=pid.get('max_accel', 2000),
+                        integral_limit=pid.get('integral_limit', 200)) for _ in range(2)]
+        self.offset = [0.0, 0.0]  # camera movement in pixels since start, from the commanded servo moves
+        self.offsets = deque(maxlen=100)  # (time, x, y) history to look up the offset at capture time
+        self.remainder = [0.0, 0.0]  # fractions of a percent not sent yet
+        self.target_state = None  # (track, time) in camera independent coordinates
+        self.calibration = OnlineCalibration(Tracking.PIXELS_PER_DEG, **dict({'latency': self.latency}, **kwargs.get('calibration', {})))
+        gains = self.calibration.load()
+        if gains:
+            Tracking.PIXELS_PER_DEG = gains
+        self.episode = None
+
+        self.mailbox = kwargs.get('mailbox', 'vision:detections')
+        self.exit_event = Event()
+        self.loop = asyncio.new_event_loop()
+        self.queue = asyncio.Queue(maxsize=1)
+        self.dropped = 0
+        self.loop_thread = Thread(target=self.run_loop, daemon=True)
+        self.loop_thread.start()
 
         # Subscribe to vision and servo-related topics
-        pub.subscribe(self.handle, 'vision:detections')
+        if self.mailbox:
+            self.thread = Thread(target=self.consume, args=(Mailbox.named(self.mailbox),), daemon=True)
+            self.thread.start()
+        else:
+            pub.subscribe(self.handle, 'vision:detections')
         pub.subscribe(self.unfreeze, 'vision:stable')
         pub.subscribe(self.set_state, 'rest', active=True)
         pub.subscribe(self.set_state, 'wake', active=True)
         pub.subscribe(self.set_state, 'sleep', active=False)
         pub.subscribe(self.set_state, 'exit', active=False)
+        pub.subscribe(self.exit, 'exit')
 
     def set_state(self, active):
         """Set the tracking state (active/inactive)."""
         self.active = active
+
+    def exit(self):
+        self.exit_event.set()
+        self.calibration.save()
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def run_loop(self):
+        """Tracking's event loop thread, runs the detection processing and PID control tasks"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.create_task(self.process())
+        if self.control == 'pid':
+            self.loop.create_task(self.control_loop())
+        self.loop.run_forever()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def submit(self, matches):
+        """Hand detections to the tracking loop, safe to call from any thread, dropped once tracking has exited"""
+        if self.exit_event.is_set() or self.loop.is_closed():
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.put_latest, matches)
+        except RuntimeError:
+            pass  # the loop was closed by exit() meanwhile
+
+    def put_latest(self, matches):
+        # Only the newest frame is waiting at any time, a frame that was not picked up yet is stale
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(matches)
+
+    async def detections(self):
+        """Stream of detections, skips frames that arrived while the previous one was processed"""
+        while True:
+            yield await self.queue.get()
+
+    async def process(self):
+        async for matches in self.detections():
+            try:
+                self.process_matches(matches)
+            except Exception as e:
+                pub.sendMessage('log:error', msg='[Tracking] ' + str(e))
+
+    def consume(self, mailbox):
+        """Consumer thread, handles the newest detections each time it is free"""
+        version = mailbox.version
+        while not self.exit_event.is_set():
+            new_version, matches = mailbox.wait(version, timeout=1)
+            if new_version == version:
+                continue
+            version = new_version
+            self.handle(matches)
         
     def unfreeze(self):
         self.moving = False
@@ -57,43 +173,155 @@ class Tracking:
     #     sleep(movement_duration)
     #     self.moving = False
 
-    async def process_matches(self, matches):
-        """Asynchronously process matches and track the largest."""
+    def process_matches(self, matches):
+        """Process matches on the tracking loop and follow the target track."""
         filtered = self.filter_by_category(matches, self.filter)
-        if len(filtered) > 0:
-            self.track_closest_to_center(filtered)
+        now = monotonic()
+        if self.control == 'pid':
+            # Undo the camera movement, so a still object keeps its position while the servos move
+            offset_x, offset_y = self.offset_at(now - self.latency)
+            boxes = [(x + offset_x, y + offset_y, w, h) for x, y, w, h in (match['bbox'] for match in filtered)]
+            world = self.tracker.update(boxes, now)
+            tracks = Tracking.shift_tracks(world, -self.offset[0], -self.offset[1])
+        else:
+            tracks = self.tracker.update([match['bbox'] for match in filtered], now)
+        target = self.select_target(tracks)
+        pub.sendMessage('tracking:tracks', tracks=tracks, target=self.target)
+        if target is not None and target['detection'] is not None:
+            x, y, w, h = filtered[target['detection']]['bbox']
+            gains = self.calibration.observe(now, target['id'], (x + w / 2, y + h / 2))
+            if gains:
+                Tracking.PIXELS_PER_DEG = gains
+        if self.control == 'pid':
+            self.target_state = (world[tracks.index(target)], now) if target is not None else None
+        elif target is not None:
+            self.moving = True
+            self.track_match(Tracking.track_to_match(target))
 
     def handle(self, matches):
-        """Handle new detections by processing in an asynchronous thread."""
-        if not self.active or self.moving:
+        """Handle new detections by submitting them to the tracking loop."""
+        if not self.active or (self.control == 'step' and self.moving):
             return
-        asyncio.run(self.process_matches(matches))
+        self.submit(matches)
 
     @staticmethod
     def filter_by_category(objects, category):
         """Filter detections by the specified category (e.g., 'person')."""
         return [obj for obj in objects if obj['category'] == category]
 
-    def track_closest_to_center(self, matches):
-        """Track the object closest to the center of the screen."""
-        def distance_from_center(match):
-            (x, y, x2, y2) = match['bbox']
-            center_x = (x + x2) / 2
-            center_y = (y + y2) / 2
+    def select_target(self, tracks):
+        """Keep following the current track while it exists, otherwise pick the track closest to the center of the screen."""
+        for track in tracks:
+            if track['id'] == self.target:
+                return track
+        if not tracks:
+            self.target = None
+            return None
+
+        def distance_from_center(track):
+            center_x, center_y = track['center']
             return abs(center_x - Tracking.VIDEO_CENTER[0]) + abs(center_y - Tracking.VIDEO_CENTER[1])
 
-        closest_match = min(matches, key=distance_from_center)
-        self.track_largest_match([closest_match])
+        track = min(tracks, key=distance_from_center)
+        self.target = track['id']
+        return track
+    @staticmethod
+    def track_to_match(track):
+        """Distances of a track's (predicted) box from the screen center, aiming at the top 20% like the detections"""
+        x, y, w, h = track['bbox']
+        return {
+            'bbox': track['bbox'],
+            'distance_x': int(track['center'][0] - Tracking.VIDEO_CENTER[0]),
+            'distance_y': int(y + 0.2 * h - Tracking.VIDEO_CENTER[1])
+        }
+
+    @staticmethod
+    def shift_tracks(tracks, dx, dy):
+        """Copy of tracks moved by (dx, dy) pixels"""
+        return [dict(track, bbox=(round(track['bbox'][0] + dx), round(track['bbox'][1] + dy), track['bbox'][2], track['bbox'][3]),
+                     center=(track['center'][0] + dx, track['center'][1] + dy)) for track in tracks]
 
-    def track_largest_match(self, matches):
-        """Move servos to track the largest match on the screen."""
-        largest = self._largest(matches)
-        if largest is None or self.moving:
-            return False
+    def offset_at(self, time):
+        """Camera offset at a point in time, from the history of commanded moves"""
+        for moved, x, y in reversed(self.offsets):
+            if moved <= time:
+                return x, y
+        return self.offsets[0][1:] if self.offsets else tuple(self.offset)
+
+    async def control_loop(self):
+        """PID control task, runs at a fixed rate against absolute deadlines"""
+        interval = 1 / self.control_rate
+        last = deadline = monotonic()
+        while not self.exit_event.is_set():
+            deadline += interval
+            wait = deadline - monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            else:
+                deadline = monotonic()
+            now = monotonic()
+            try:
+                self.control_step(now, now - last)
+            except Exception as e:
+                pub.sendMessage('log:error', msg='[Tracking] ' + str(e))
+            last = now
+
+    def control_step(self, now, dt):
+        """Steer the servos towards the predicted position of the followed track"""
+        state = self.target_state
+        if not self.active or state is None or now - state[1] > 1:
+            if self.episode is not None or self.pid[0].output or self.pid[1].output:
+                for pid in self.pid:
+                    pid.reset()
+                self.episode = None
+            return
+        track, updated = state
+        age = now - updated
+        x, y, w, h = track['bbox']
+        # Aim for the top 20% of the box, like the detections
+        error = (track['center'][0] + track['velocity'][0] * age - self.offset[0] - Tracking.VIDEO_CENTER[0],
+                 track['center'][1] + track['velocity'][1] * age - 0.3 * h - self.offset[1] - Tracking.VIDEO_CENTER[1])
+
+        moves = [0, 0]
+        for axis in (0, 1):
+            velocity = self.pid[axis].update(error[axis], dt)
+            # Pixels per second to a relative servo move, only whole percentages are sent
+            self.remainder[axis] += velocity * dt / Tracking.PIXELS_PER_DEG[axis]
+            moves[axis] = int(self.remainder[axis])
+            self.remainder[axis] -= moves[axis]
+            self.offset[axis] += moves[axis] * Tracking.PIXELS_PER_DEG[axis]
+        if moves[0]:
+            pub.sendMessage('servo:pan:mv', percentage=moves[0])
+        if moves[1]:
+            pub.sendMessage('servo:tilt:mv', percentage=moves[1])
+        if moves[0] or moves[1]:
+            self.offsets.append((now, self.offset[0], self.offset[1]))
+            self.calibration.commanded(now, moves)
+        self.measure(track['id'], error, moves, now)
+
+    def measure(self, target, error, moves, now):
+        """Time to center and overshoot for each time the target has to be brought back to the center"""
+        centered = all(abs(error[axis]) <= self.pid[axis].deadband for axis in (0, 1))
+        episode = self.episode
+        if episode is None or episode['target'] != target:
+            if centered:
+                self.episode = None
+                return
+            episode = self.episode = {'target': target, 'start': now, 'sign': [1 if e > 0 else -1 for e in error],
+                                      'overshoot': [0.0, 0.0], 'moves': 0}
+        episode['moves'] += (moves[0] != 0) + (moves[1] != 0)
+        for axis in (0, 1):
+            if error[axis] * episode['sign'][axis] < 0:
+                episode['overshoot'][axis] = max(episode['overshoot'][axis], abs(error[axis]))
+        if centered:
+            self.episode = None
+            pub.sendMessage('tracking:metrics', metrics={
+                'target': target,
+                'time_to_center': round(now - episode['start'], 3),
+                'overshoot': [round(o, 1) for o in episode['overshoot']],
+                'moves': episode['moves']
+            })
 
-        self.moving = True
-        self.track_match(largest)
-        
     def track_match(self, match):
 
         (x, y, x2, y2) = match['bbox']
@@ -107,6 +335,8 @@ class Tracking:
             pub.sendMessage('servo:pan:mv', percentage=x_move)
         if y_move:
             pub.sendMessage('servo:tilt:mv', percentage=y_move)
+        # The serial link sends whole percentages
+        self.calibration.commanded(monotonic(), (int(x_move), int(y_move)))
 
         # move_time = max(abs(max(x_move, y_move)) / 50, 1) # min 1 second
         # print(f"Move time: {move_time}")
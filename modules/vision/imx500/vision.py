@@ -1,5 +1,6 @@
 import argparse
 import sys
+import threading
 from functools import lru_cache
 
 import cv2, json
@@ -13,55 +14,65 @@ from libcamera import Transform
 
 from pubsub import pub
 
+from modules.vision.imx500.stability import StabilityDetector
+from modules.vision.imx500.overlay import Overlay
+from modules.mailbox import Mailbox
+
 
 class Detection:
-    def __init__(self, imx500, picam2, selfref, coords, category, conf, metadata):
-        """Create a Detection object, recording the bounding box, category and confidence."""
+    """
+    A single detection, recorded in pixel coordinates of the ISP output.
+    Records are built for the whole frame at once by Vision.parse_detections.
+    Subscripting works like the dict from json_out(), the label and dict are only looked up when asked for.
+    """
+    __slots__ = ('category', 'conf', 'box', 'distance_x', 'distance_y', 'area', 'labels')
+    FIELDS = ('category', 'confidence', 'bbox', 'distance_x', 'distance_y', 'area')
+
+    def __init__(self, category, conf, box, distance_x, distance_y, area, labels):
         self.category = category
         self.conf = conf
-        self.box = imx500.convert_inference_coords(coords, metadata, picam2)
-        self.piCamImx500 = selfref
-        self.calculate_detection_distances(320, 240)
-
-    def calculate_detection_distances(self, screen_center_x, screen_center_y):
-        """Calculate and store the X and Y distances for a detection."""
-        # Extract the bounding box values (x, y, width, height)
-        x, y, x2, y2 = self.box
-
-        # Calculate the center of the detection box
-        detection_center_x = x + x2 // 2
-        
-        # Calculate the position at the top 20% of the bounding box for Y-axis
-        box_height = y2 - y
-        detection_top_20_y = y + int(0.2 * box_height)
-        #detection_center_y = y + y2 // 2
-
-        # Calculate the distances between detection center and screen center
-        distance_x = int(detection_center_x - screen_center_x)
-        distance_y = int(detection_top_20_y - screen_center_y)
-
-        # Store distances in the detection object
+        self.box = box
         self.distance_x = distance_x
         self.distance_y = distance_y
-        
+        self.area = area
+        self.labels = labels
+
+    def label(self):
+        return self.labels[int(self.category)]
+
+    def __getitem__(self, key):
+        if key == 'category':
+            return self.label()
+        if key == 'confidence':
+            return str(self.conf)
+        if key == 'bbox':
+            return self.box
+        if key in ('distance_x', 'distance_y', 'area'):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return Detection.FIELDS
+
     def display(self):
-        label = f"{self.piCamImx500.get_labels()[int(self.category)]} ({self.conf:.2f}%): {self.box}"
+        label = f"{self.label()} ({self.conf:.2f}%): {self.box}"
         print(label)
         print("")
+
     def json_out(self):
-        return {
-            'category': self.piCamImx500.get_labels()[int(self.category)],
-            'confidence': str(self.conf),
-            'bbox': self.box,
-            'distance_x': self.distance_x,
-            'distance_y': self.distance_y
-        }
-        
+        return {key: self[key] for key in Detection.FIELDS}
+
 class Vision:
     def __init__(self, **kwargs):
         """
         Vision class
-        :param kwargs: model, fps, bbox_normalization, threshold, iou, max_detections, ignore_dash_labels, postprocess, preserve_aspect_ratio, labels, print_self.intrinsics
+        :param kwargs: model, fps, bbox_normalization, threshold, iou, max_detections, ignore_dash_labels, postprocess, preserve_aspect_ratio, labels, print_self.intrinsics, preview
         :param model: Path of the model
         :param fps: Frames per second
         :param bbox_normalization: Normalize bbox
@@ -73,23 +84,37 @@ class Vision:
         :param preserve_aspect_ratio: Preserve the pixel aspect ratio of the input tensor
         :param labels: Path to the labels file
         :param print_self.intrinsics: Print JSON network_intrinsics then exit
+        :param preview: Show the camera preview (also draws the detection overlay)
+        :param overlay: Draw the detection overlay without a preview, e.g. for a stream consumer
+        :param lores_size: (width, height) of the grayscale stream used for the stability check
+        :param stability: StabilityDetector settings (threshold, pixel_threshold, stable_frames, step, settle_time)
+        :param stabilize: Only report detections once the image is stable (not needed when tracking uses 'pid' control)
+        threshold and max_detections can also be set in the config, which takes precedence over the command line
         
         Install: pip install picamera2 libcamera
         
-        Subscribes to 'loop' to scan for detections
-        - Returns: list of detections
+        Frames are captured and parsed on a dedicated thread as they arrive from the camera.
+        The latest detections are kept in the 'vision:detections' Mailbox, consumers read it at their own rate.
+
+        Subscribes to 'loop' to relay new detections to pubsub consumers
+        Subscribes to 'serial:servo' to skip the stability check while the servos move
+        Subscribes to 'vision:overlay' to turn the detection overlay on or off
+        - Argument: enabled (bool)
+        Subscribes to 'power:sleep' to stop the camera until 'power:wake'
+        Subscribes to 'exit' to stop the capture thread
         
-        Publishes to 'vision:detections' with matches
-        - Argument: matches (list) - list of detections
+        Publishes to 'vision:detections' with matches (from 'loop', only when there are new detections)
+        - Argument: matches (list) - list of Detection records, subscript them like a dict or call json_out()
         
-        Example output:
+        Example output (json_out):
         [
             {
                 'category': 'person',
                 'confidence': '0.99',
-                'bbox': [0.0, 0.0, 0.0, 0.0],
+                'bbox': (0, 0, 0, 0),
                 'distance_x': 0,
-                'distance_y': 0
+                'distance_y': 0,
+                'area': 0
             }
         ]
         
@@ -97,11 +122,18 @@ class Vision:
         mycam = Vision()
         while True:
             matches = mycam.scan()
+
+        Example of reading the mailbox:
+        version, matches = Mailbox.named('vision:detections').wait(version, timeout=1)
         """
         self.last_detections = []
         self.last_results = []
         
         self.args = Vision.get_args()
+        self.threshold = kwargs.get('threshold', self.args.threshold)
+        self.max_detections = kwargs.get('max_detections', self.args.max_detections)
+        self.crop = None
+        self.transform = None  # (crop x, y, width, height, scale x, scale y) for the current ScalerCrop
 
         # This must be called before instantiation of Picamera2
         self.imx500 = IMX500(self.args.model)
@@ -132,37 +164,103 @@ class Vision:
         #     exit()
 
         self.picam2 = Picamera2(self.imx500.camera_num)
-        config = self.picam2.create_preview_configuration(controls={"FrameRate": self.intrinsics.inference_rate}, buffer_count=12, transform=Transform(vflip=False, hflip=False))
+        self.lores_size = tuple(kwargs.get('lores_size', (320, 240)))
+        config = self.picam2.create_preview_configuration(controls={"FrameRate": self.intrinsics.inference_rate}, buffer_count=12, transform=Transform(vflip=False, hflip=False),
+                                                          lores={"size": self.lores_size, "format": "YUV420"})
 
         self.imx500.show_network_fw_progress_bar()
         self.picam2.start(config, show_preview=kwargs.get('preview', False))
+        # ScalerCrop is in full sensor pixels, detections are reported in ISP output pixels
+        self.sensor_size = tuple(self.picam2.camera_properties['PixelArraySize'])
+        self.isp_size = tuple(self.picam2.camera_configuration()['main']['size'])
 
         if self.intrinsics.preserve_aspect_ratio:
             self.imx500.set_auto_aspect_ratio()
 
-        self.picam2.pre_callback = self.draw_detections_with_distance
+        self.overlay = Overlay(self.imx500, self.get_labels(), self.intrinsics.preserve_aspect_ratio)
+        self.set_overlay(kwargs.get('preview', False) or kwargs.get('overlay', False))
         
-        self.previous_frame = None
-        self.stable_frame_count = 0
+        self.stabilize = kwargs.get('stabilize', True)
+        self.stability = StabilityDetector(**kwargs.get('stability', {}))
         self.moving = False
         
-        pub.subscribe(self.scan, 'loop')
+        self.mailbox = Mailbox.named('vision:detections')
+        self.relayed = self.mailbox.version
+        self.exit_event = threading.Event()
+        self.awake = threading.Event()
+        self.awake.set()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        pub.subscribe(self.relay, 'loop')
+        pub.subscribe(self.stability.motion, 'serial:servo')
+        pub.subscribe(self.set_overlay, 'vision:overlay')
+        pub.subscribe(self.pause, 'power:sleep')
+        pub.subscribe(self.resume, 'power:wake')
+        pub.subscribe(self.exit, 'exit')
+
+    def run(self):
+        """Capture thread, capture_request blocks until the next frame so this runs at the camera frame rate"""
+        while not self.exit_event.is_set():
+            if not self.awake.is_set():
+                # Paused, the camera is stopped and started on this thread so no capture is in progress
+                self.picam2.stop()
+                self.awake.wait()
+                if self.exit_event.is_set():
+                    break
+                self.picam2.start()
+                # Do not compare the first frames with the one from before the pause
+                self.stability.motion()
+                continue
+            try:
+                self.mailbox.put(self.capture())
+            except Exception as e:
+                pub.sendMessage('log:error', msg='[Vision] Capture failed: ' + str(e))
+                self.exit_event.wait(1)
+
+    def pause(self):
+        self.awake.clear()
+
+    def resume(self):
+        self.awake.set()
+
+    def exit(self):
+        self.exit_event.set()
+        self.awake.set()
+        self.thread.join(1)
+
+    def relay(self):
+        """Publish the latest detections on the bus, if there are new ones since the last relay"""
+        version, matches = self.mailbox.get()
+        if version != self.relayed:
+            self.relayed = version
+            pub.sendMessage('vision:detections', matches=matches)
 
     def scan(self):
-        self.last_results = self.parse_detections(self.picam2.capture_metadata())
-        this_capture = []
-        for i in self.last_results:
-            this_capture = [obj.json_out() for obj in self.last_results]
-
-        pub.sendMessage('vision:detections', matches=this_capture)
-        return this_capture
-
-    def parse_detections(self, metadata: dict):
+        """Return and publish the next detections, e.g. for calibration or direct use"""
+        if self.thread.is_alive():
+            version, matches = self.mailbox.wait(self.mailbox.get()[0], timeout=1)
+        else:
+            matches = self.capture()
+        pub.sendMessage('vision:detections', matches=matches)
+        return matches
+
+    def capture(self):
+        request = self.picam2.capture_request()
+        try:
+            metadata = request.get_metadata()
+            stable = self.calculate_stabilization(request) if self.stabilize else True
+        finally:
+            request.release()
+        self.last_results = self.parse_detections(metadata, stable)
+        return self.last_results
+
+    def parse_detections(self, metadata: dict, stable=True):
         """Parse the output tensor into a number of detected objects, scaled to the ISP out."""
         
         self.last_detections = []
          # Check if the image is stable before parsing detections
-        if not self.calculate_stabilization():
+        if not stable:
             # print("Image is not stable. Skipping detections.")
             self.moving = True
             return self.last_detections
@@ -171,9 +269,9 @@ class Vision:
             pub.sendMessage('vision:stable')
     
         bbox_normalization = self.intrinsics.bbox_normalization
-        threshold = self.args.threshold
+        threshold = self.threshold
         iou = self.args.iou
-        max_detections = self.args.max_detections
+        max_detections = self.max_detections
 
         np_outputs = self.imx500.get_outputs(metadata, add_batch=True)
         input_w, input_h = self.imx500.get_input_size()
@@ -190,59 +288,68 @@ class Vision:
             if bbox_normalization:
                 boxes = boxes / input_h
 
-            boxes = np.array_split(boxes, 4, axis=1)
-            boxes = zip(*boxes)
+        # Threshold, convert and measure all boxes in one go
+        scores = np.asarray(scores).reshape(-1)
+        keep = np.flatnonzero(scores > threshold)[:max_detections]
+        if keep.size == 0:
+            return self.last_detections
+        pixels = self.convert_boxes(np.asarray(boxes, dtype=np.float64).reshape(-1, 4)[keep], metadata)
+        x, y, w, h = pixels.T
+        distance_x = x + w // 2 - 320
+        # Aim for the top 20% of the box rather than the center
+        distance_y = y + (0.2 * (h - y)).astype(np.int32) - 240
+        area = w * h
 
+        labels = self.get_labels()
         self.last_detections = [
-            Detection(self.imx500, self.picam2, self, box, category, score, metadata)
-            for box, score, category in zip(boxes, scores, classes)
-            if score > threshold
+            Detection(category, score, tuple(box), dx, dy, a, labels)
+            for category, score, box, dx, dy, a in zip(np.asarray(classes)[keep].tolist(), scores[keep].tolist(), pixels.tolist(),
+                                                         distance_x.tolist(), distance_y.tolist(), area.tolist())
         ]
         return self.last_detections
 
-
-    def calculate_stabilization(self, threshold=0.70, stable_frames_required=8):
+    def convert_boxes(self, boxes, metadata):
+        """
+        Convert inference boxes (y0, x0, y1, x1) to ISP output pixels (x, y, w, h) for a whole frame.
+        Same mapping as imx500.convert_inference_coords for each box: relative coordinates are scaled to the
+        full sensor, clipped to the ScalerCrop, moved to its origin and scaled from the crop to the ISP output.
+        The scale and offset only change with the crop, so they are worked out once per crop and applied with numpy.
+        :param boxes: (N, 4) array of relative inference coordinates
+        :param metadata: frame metadata
+        :return: (N, 4) int32 array
+        """
+        full_w, full_h = self.sensor_size
+        crop = tuple(metadata.get('ScalerCrop') or (0, 0, full_w, full_h))
+        if self.transform is None or crop != self.crop:
+            crop_x, crop_y, crop_w, crop_h = crop
+            isp_w, isp_h = self.isp_size
+            self.transform = (crop_x, crop_y, crop_w, crop_h, isp_w / crop_w, isp_h / crop_h)
+            self.crop = crop
+        crop_x, crop_y, crop_w, crop_h, scale_x, scale_y = self.transform
+        x0 = np.clip(boxes[:, 1] * full_w, crop_x, crop_x + crop_w)
+        y0 = np.clip(boxes[:, 0] * full_h, crop_y, crop_y + crop_h)
+        x1 = np.clip(boxes[:, 3] * full_w, x0, crop_x + crop_w)
+        y1 = np.clip(boxes[:, 2] * full_h, y0, crop_y + crop_h)
+        pixels = np.empty(boxes.shape, dtype=np.int32)
+        pixels[:, 0] = (x0 - crop_x) * scale_x
+        pixels[:, 1] = (y0 - crop_y) * scale_y
+        pixels[:, 2] = (x1 - x0) * scale_x
+        pixels[:, 3] = (y1 - y0) * scale_y
+        return pixels
+
+    def calculate_stabilization(self, request):
         """
-        Calculate if the image has stabilized based on frame differences.
-        Stability is defined as the average pixel difference between consecutive frames
-        being below a given threshold for a certain number of frames.
-        :param threshold: Percentage of pixels that must remain stable (default 1%).
-        :param stable_frames_required: Number of consecutive stable frames to confirm stabilization.
+        Check if the image has stabilized using the lores luma plane of the same request as the metadata,
+        so no second full resolution capture is needed.
+        :param request: completed camera request
         :return: Boolean indicating if the image is stable.
         """
-        current_frame = self.picam2.capture_array()
-
-        if self.previous_frame is None:
-            # If this is the first frame, store it and return False (not yet stable)
-            self.previous_frame = current_frame
+        if self.stability.is_moving():
+            # Servos are moving, skip mapping the frame at all
             return False
-
-        # Calculate the absolute difference between the current frame and the previous frame
-        frame_diff = cv2.absdiff(current_frame, self.previous_frame)
-
-        # Convert the frame difference to grayscale for easier analysis
-        gray_diff = cv2.cvtColor(frame_diff, cv2.COLOR_BGR2GRAY)
-
-        # Calculate the percentage of pixels with significant change (non-zero value in diff)
-        non_zero_count = np.count_nonzero(gray_diff)
-        total_pixels = gray_diff.size
-        diff_percentage = non_zero_count / total_pixels
-
-        # Update the previous frame to be the current frame
-        self.previous_frame = current_frame
-
-        # print(diff_percentage)
-        # Check if the difference is below the threshold
-        if diff_percentage < threshold:
-            self.stable_frame_count += 1
-        else:
-            self.stable_frame_count = 0
-
-        # If the number of consecutive stable frames is greater than or equal to the required count, return True
-        if self.stable_frame_count >= stable_frames_required:
-            return True
-
-        return False
+        width, height = self.lores_size
+        with MappedArray(request, 'lores') as m:
+            return self.stability.update(m.array[:height, :width])
 
     @lru_cache
     def get_labels(self):
@@ -254,96 +361,11 @@ class Vision:
 
     def draw_detections_with_distance(self, request, stream="main"):
         """Draw the detections for this request onto the ISP output."""
-        detections = self.last_results
-        if detections is None:
-            return
-        labels = self.get_labels()
-        
-        # Assuming m.array contains the frame, get the dimensions of the image to find the screen center
-        with MappedArray(request, stream) as m:
-            height, width, _ = m.array.shape
-            screen_center_x = width // 2
-            screen_center_y = height // 2
-
-            for detection in detections:
-                x, y, w, h = detection.box
-                label = f"{labels[int(detection.category)]} ({detection.conf:.2f})"
-                
-                # Calculate the center of the detection box
-                detection_center_x = x + w // 2
-                detection_center_y = y + h // 2
-
-                # Calculate the distances between detection center and screen center
-                distance_x = abs(detection.distance_x)
-                distance_y = abs(detection.distance_y)
-
-                # Draw the distance as text near the detection box
-                distance_label_x = f"X-Dist: {int(distance_x)} px {int(detection_center_x - screen_center_x)}"
-                distance_label_y = f"Y-Dist: {int(distance_y)} px {int(detection_center_y - screen_center_y)}"
-
-                # Text positions for the X and Y distances
-                (text_width_x, text_height_x), baseline_x = cv2.getTextSize(distance_label_x, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                (text_width_y, text_height_y), baseline_y = cv2.getTextSize(distance_label_y, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                text_x = x + 5
-                text_y_x = y + 30  # Below the detection box label
-                text_y_y = y + 45  # Below the X-distance label
-
-                # Create a copy of the array to draw the background with opacity
-                overlay = m.array.copy()
-
-                # Draw the background rectangles for the X and Y distance text
-                cv2.rectangle(overlay,
-                            (text_x, text_y_x - text_height_x),
-                            (text_x + text_width_x, text_y_x + baseline_x),
-                            (255, 255, 255),  # Background color (white)
-                            cv2.FILLED)
-                cv2.rectangle(overlay,
-                            (text_x, text_y_y - text_height_y),
-                            (text_x + text_width_y, text_y_y + baseline_y),
-                            (255, 255, 255),  # Background color (white)
-                            cv2.FILLED)
-
-                alpha = 0.30
-                cv2.addWeighted(overlay, alpha, m.array, 1 - alpha, 0, m.array)
-
-                # Draw the distance text for X and Y axes
-                cv2.putText(m.array, distance_label_x, (text_x, text_y_x),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-                cv2.putText(m.array, distance_label_y, (text_x, text_y_y),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-
-                # Draw detection box
-                cv2.rectangle(m.array, (x, y), (x + w, y + h), (0, 255, 0, 0), thickness=2)
-                
-                # Draw horizontal line (X-axis)
-                cv2.line(m.array, (detection_center_x, detection_center_y), (screen_center_x, detection_center_y), (0, 255, 255), 2)
-                
-                # Draw vertical line (Y-axis)
-                cv2.line(m.array, (screen_center_x, detection_center_y), (screen_center_x, screen_center_y), (255, 0, 255), 2)
-
-                # Calculate text size and position for detection label
-                (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                text_x = x + 5
-                text_y = y + 15
-
-                # Draw background rectangle for detection label
-                cv2.rectangle(overlay,
-                            (text_x, text_y - text_height),
-                            (text_x + text_width, text_y + baseline),
-                            (255, 255, 255),  # Background color (white)
-                            cv2.FILLED)
-
-                cv2.addWeighted(overlay, alpha, m.array, 1 - alpha, 0, m.array)
-
-                # Draw detection label
-                cv2.putText(m.array, label, (text_x, text_y),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-                
-            if self.intrinsics.preserve_aspect_ratio:
-                b_x, b_y, b_w, b_h = self.imx500.get_roi_scaled(request)
-                color = (255, 0, 0)  # red
-                cv2.putText(m.array, "ROI", (b_x + 5, b_y + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-                cv2.rectangle(m.array, (b_x, b_y), (b_x + b_w, b_y + b_h), (255, 0, 0, 0))
+        self.overlay.draw(request, self.last_results, stream)
+
+    def set_overlay(self, enabled):
+        """Only attach the overlay renderer while something is looking at the frames"""
+        self.picam2.pre_callback = self.draw_detections_with_distance if enabled else None
 
     @staticmethod
     def get_args():
@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import MagicMock
+import json
+import os
+import tempfile
+
+# Mock gpiozero and pubsub libraries
+import sys
+sys.modules['gpiozero'] = MagicMock()
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from modules.animate import Animate
+
+class TestAnimate(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.write('wake', [{'servo:tilt:mvabs': 50}, {'sleep': 0.5}])
+        self.write('nod', [
+            {'animate': 'wake'},
+            {'servo:tilt:mv': -10},
+            {'sleep': 0.25},
+            {'servo:tilt:mv': 20},
+            {'sleep': 1}
+        ])
+        self.write('stand', [
+            {'servo:leg_l_hip:mvabs': 20},
+            {'servo:leg_r_hip:mvabs': 80},
+            {'servo:pan:mv': 10},
+            {'led:eye': 'blue'}
+        ])
+        self.animate = Animate(path=self.dir.name)
+        self.addCleanup(self.animate.exit)
+
+    def write(self, name, steps):
+        with open(os.path.join(self.dir.name, name + '.json'), 'w') as f:
+            json.dump(steps, f)
+
+    def test_compiled_at_startup(self):
+        self.assertEqual(sorted(self.animate.compiled), ['nod', 'stand', 'wake'])
+
+    def test_nested_animation_is_flattened(self):
+        steps = self.animate.load('nod')
+        self.assertEqual([(s[0], s[2]) for s in steps], [
+            (0, 'servo:tilt:mvabs'),
+            (0.5, 'servo:tilt:mv'),
+            (0.75, 'servo:tilt:mv'),
+            (1.75, None)
+        ])
+        self.assertEqual(steps[-1][1], Animate.WAIT)
+
+    def test_servo_steps_are_batched(self):
+        steps = self.animate.load('stand')
+        self.assertEqual(steps[0][2], 'servo:multi')
+        self.assertEqual(steps[0][3], {'targets': {'leg_l_hip': 20, 'leg_r_hip': 80}, 'relative': False})
+        self.assertEqual(steps[1][2:], ('servo:pan:mv', {'percentage': 10}))
+        self.assertEqual(steps[2][2:], ('led:eye', {'color': 'blue'}))
+
+    def test_recompiled_when_nested_file_changes(self):
+        before = self.animate.load('nod')
+        self.assertIs(self.animate.load('nod'), before)
+        self.write('wake', [{'servo:tilt:mvabs': 60}])
+        path = os.path.join(self.dir.name, 'wake.json')
+        os.utime(path, (0, os.path.getmtime(path) + 10))
+        after = self.animate.load('nod')
+        self.assertIsNot(after, before)
+        self.assertEqual(after[0][3], {'percentage': 60})
+
+    def test_recursive_animation_is_rejected(self):
+        self.write('loop', [{'animate': 'loop'}])
+        with self.assertRaises(ValueError):
+            self.animate.load('loop')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import MagicMock
+
+from modules.network.coalescer import Coalescer
+
+class TestCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.sink = MagicMock()
+        self.coalescer = Coalescer(self.sink, rate=50)
+        # Stop the background thread so flushes only happen when the test asks
+        self.coalescer.exit_event.set()
+        self.coalescer.ready.set()
+        self.coalescer.thread.join(1)
+        self.sink.reset_mock()
+
+    def test_relative_moves_are_summed(self):
+        self.coalescer.add(7, 5, relative=True)
+        self.coalescer.add(7, -2, relative=True)
+        self.coalescer.add(7, 4, relative=True)
+        self.coalescer.flush()
+        self.sink.assert_called_once_with([(7, 7, True)])
+
+    def test_absolute_supersedes(self):
+        self.coalescer.add(7, 5, relative=True)
+        self.coalescer.add(7, 30)
+        self.coalescer.add(7, 60)
+        self.coalescer.flush()
+        self.sink.assert_called_once_with([(7, 60, False)])
+
+    def test_relative_folded_into_absolute(self):
+        self.coalescer.add(6, 90)
+        self.coalescer.add(6, 20, relative=True)
+        self.coalescer.flush()
+        # Clamped to the percentage range
+        self.sink.assert_called_once_with([(6, 100, False)])
+
+    def test_servos_are_independent(self):
+        self.coalescer.add(6, 10, relative=True)
+        self.coalescer.add(7, 50)
+        self.coalescer.flush()
+        # One batch per flush, each servo keeps its own target
+        self.sink.assert_called_once_with([(6, 10, True), (7, 50, False)])
+        self.assertEqual(self.coalescer.received, 2)
+        self.assertEqual(self.coalescer.sent, 2)
+
+    def test_cancelled_relative_move_is_dropped(self):
+        self.coalescer.add(7, 5, relative=True)
+        self.coalescer.add(7, -5, relative=True)
+        self.coalescer.flush()
+        self.sink.assert_not_called()
+        self.coalescer.flush()
+        self.sink.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from modules.neopixel.compositor import Compositor
+
+class TestCompositor(unittest.TestCase):
+    def setUp(self):
+        self.pixels = MagicMock()
+        self.compositor = Compositor(self.pixels, 4, fps=50)
+        # Stop the render thread so frames are only composed when the test asks
+        self.compositor.exit_event.set()
+        self.compositor.ready.set()
+        self.compositor.thread.join(1)
+
+    def frame(self):
+        self.compositor.compose()
+        return self.compositor.frame.tolist()
+
+    def test_top_layer_wins(self):
+        self.compositor.set('status', [0, 1], (10, 0, 0))
+        self.compositor.set('override', [1], (255, 255, 255))
+        self.assertEqual([[10, 0, 0], [255, 255, 255], [0, 0, 0], [0, 0, 0]], self.frame())
+
+    def test_clear_reveals_layer_below(self):
+        self.compositor.set('status', [2], (0, 10, 0))
+        self.compositor.set('eye', [2], (0, 0, 10))
+        self.assertEqual([0, 0, 10], self.frame()[2])
+        self.compositor.clear('eye')
+        self.assertEqual([0, 10, 0], self.frame()[2])
+
+    def test_animation_steps_and_stops(self):
+        def blink():
+            while True:
+                yield (50, 0, 0), 0.1
+                yield (0, 0, 0), 0.1
+        self.compositor.set('status', [3], (0, 0, 7))
+        self.compositor.play('animation', [3], blink())
+        now = time.monotonic()
+        next_due = self.compositor.step(now)
+        self.assertAlmostEqual(now + 0.1, next_due)
+        self.assertEqual([50, 0, 0], self.frame()[3])
+        # Not due yet
+        self.compositor.step(now + 0.05)
+        self.assertEqual([50, 0, 0], self.frame()[3])
+        self.compositor.step(now + 0.1)
+        self.assertEqual([0, 0, 0], self.frame()[3])
+        self.compositor.stop_animation('animation')
+        self.assertFalse(self.compositor.playing('animation'))
+        self.assertEqual([0, 0, 7], self.frame()[3])
+
+    def test_finished_animation_uncovers_pixels(self):
+        self.compositor.set('status', [0], (1, 2, 3))
+        self.compositor.play('animation', [0], iter([((9, 9, 9), 0)]))
+        now = time.monotonic()
+        self.compositor.step(now)
+        self.assertEqual([9, 9, 9], self.frame()[0])
+        self.assertIsNone(self.compositor.step(now + 1))
+        self.assertEqual([1, 2, 3], self.frame()[0])
+
+    def test_render_thread_plays_animation(self):
+        pixels = MagicMock()
+        compositor = Compositor(pixels, 2, fps=100)
+        compositor.play('animation', [0, 1], iter([((0, 5, 0), 0.01), ((0, 6, 0), 10)]))
+        time.sleep(0.1)
+        compositor.stop()
+        self.assertEqual((0, 6, 0), compositor[0])
+
+if __name__ == '__main__':
+    unittest.main()
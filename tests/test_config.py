@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from modules.config import Snapshot, thaw
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.write('buzzer.yml', "buzzer:\n  enabled: true\n  path: modules.audio.buzzer.Buzzer\n  config:\n    pin: 27\n"
+                                 "  dependencies:\n    python:\n      - gpiozero\n")
+        self.write('servos.yml', "servos:\n  enabled: false\n  config:\n    range: [20, 160]\n")
+
+    def write(self, name, text):
+        with open(os.path.join(self.dir.name, name), 'w') as f:
+            f.write(text)
+
+    def test_merged_and_read_only(self):
+        snapshot = Snapshot(Snapshot.parse(self.dir.name))
+        self.assertEqual(27, snapshot.config['buzzer']['config']['pin'])
+        self.assertEqual((20, 160), snapshot.config['servos']['config']['range'])
+        with self.assertRaises(TypeError):
+            snapshot.config['buzzer']['enabled'] = False
+        self.assertEqual({'range': [20, 160]}, thaw(snapshot.config['servos']['config']))
+
+    def test_cache_reused_until_a_file_changes(self):
+        Snapshot.parse(self.dir.name)
+        with patch('modules.config.yaml.safe_load') as safe_load:
+            files = Snapshot.parse(self.dir.name)
+            safe_load.assert_not_called()
+        self.assertEqual(27, files[os.path.join(self.dir.name, 'buzzer.yml')]['buzzer']['config']['pin'])
+
+        self.write('buzzer.yml', "buzzer:\n  enabled: true\n  config:\n    pin: 17\n")
+        files = Snapshot.parse(self.dir.name)
+        self.assertEqual(17, files[os.path.join(self.dir.name, 'buzzer.yml')]['buzzer']['config']['pin'])
+
+    def test_shared_per_folder(self):
+        self.assertIs(Snapshot.load(self.dir.name), Snapshot.load(self.dir.name))
+        Snapshot.snapshots.pop(self.dir.name)
+
+    def test_reload_when_a_file_changes(self):
+        self.addCleanup(Snapshot.snapshots.pop, self.dir.name, None)
+        snapshot = Snapshot.load(self.dir.name)
+        self.assertIsNone(Snapshot.reload(self.dir.name))
+        self.write('servos.yml', "servos:\n  enabled: false\n  config:\n    range: [10, 170]\n")
+        reloaded = Snapshot.reload(self.dir.name)
+        self.assertEqual((10, 170), reloaded.config['servos']['config']['range'])
+        self.assertIs(reloaded, Snapshot.load(self.dir.name))
+        self.assertEqual(27, snapshot.config['buzzer']['config']['pin'])
+
+    def test_dependencies(self):
+        snapshot = Snapshot(Snapshot.parse(self.dir.name))
+        self.assertEqual(['MODULE:buzzer', 'PYTHON:gpiozero'], list(snapshot.dependencies()))
+
+if __name__ == '__main__':
+    unittest.main()
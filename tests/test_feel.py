@@ -0,0 +1,91 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from modules.behaviours.feel import Feel
+from modules.behaviours.sleep import Sleep
+from modules.config import Config
+
+class TestFeel(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('modules.behaviours.feel.monotonic', return_value=1000.0)
+        self.monotonic = patcher.start()
+        self.addCleanup(patcher.stop)
+        behaviours = SimpleNamespace(faces=SimpleNamespace(face_detected=False),
+                                     motion=SimpleNamespace(is_motion=lambda: False))
+        self.feel = Feel(SimpleNamespace(behaviours=behaviours))
+        self.pub = sys.modules['modules.behaviours.feel'].pub
+        self.pub.sendMessage.reset_mock()
+
+    def changes(self):
+        return [call.kwargs['feelings'] for call in self.pub.sendMessage.call_args_list if call.args == ('feel:changed',)]
+
+    def test_first_tick_publishes_feelings(self):
+        self.feel.loop()
+        self.assertEqual([['ok']], self.changes())
+        self.feel.loop()
+        self.assertEqual([['ok']], self.changes())
+
+    def test_decay_from_elapsed_time(self):
+        self.feel.loop()
+        self.monotonic.return_value = 1010.0
+        self.assertAlmostEqual(50 - 7.5, self.feel.attention)
+        self.assertAlmostEqual(50 - 1.5, self.feel.wakefulness)
+        self.monotonic.return_value = 1100.0
+        self.assertEqual(0, self.feel.happiness)
+
+    def test_recomputed_only_when_a_threshold_is_reached(self):
+        self.feel.loop()
+        # Attention reaches 30 after (50 - 30) / 0.75 seconds
+        self.assertAlmostEqual(1000 + 20 / 0.75, self.feel.next_change)
+        self.monotonic.return_value = 1020.0
+        with patch.object(self.feel, 'update') as update:
+            self.feel.loop()
+            update.assert_not_called()
+        self.monotonic.return_value = 1027.0
+        self.feel.loop()
+        self.assertEqual(['bored'], self.changes()[-1])
+        self.assertEqual(['bored'], self.feel.get_feelings())
+
+    def test_input_changes_feelings(self):
+        self.monotonic.return_value = 1030.0
+        self.assertIn('bored', self.feel.get_feelings())
+        self.feel.input(Feel.INPUT_TYPE_MAX)
+        self.assertEqual(['excited'], self.changes()[-1])
+        self.assertEqual(100, self.feel.attention)
+
+class TestSleep(unittest.TestCase):
+    def state(self, state):
+        personality = SimpleNamespace(state=state)
+        personality.is_asleep = lambda: personality.state == Config.STATE_SLEEPING
+        personality.is_resting = lambda: personality.state in (Config.STATE_SLEEPING, Config.STATE_RESTING)
+
+        def set_state(new):
+            personality.state = new
+        personality.set_state = set_state
+        return personality
+
+    @patch('modules.behaviours.sleep.Config.is_night', return_value=False)
+    def test_wakes_up_to_idle(self, is_night):
+        personality = self.state(Config.STATE_SLEEPING)
+        Sleep(personality).changed(['ok'], [])
+        self.assertEqual(Config.STATE_IDLE, personality.state)
+
+    @patch('modules.behaviours.sleep.Config.is_night', return_value=True)
+    def test_stays_asleep_at_night(self, is_night):
+        personality = self.state(Config.STATE_SLEEPING)
+        Sleep(personality).changed(['bored'], ['bored', 'tired'])
+        self.assertEqual(Config.STATE_SLEEPING, personality.state)
+
+    def test_tired_sleeps(self):
+        personality = self.state(Config.STATE_IDLE)
+        Sleep(personality).changed(['tired'], ['ok'])
+        self.assertEqual(Config.STATE_SLEEPING, personality.state)
+
+if __name__ == '__main__':
+    unittest.main()
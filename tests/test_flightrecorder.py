@@ -0,0 +1,61 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from modules.flightrecorder import FlightRecorder, summarize
+
+class Topic:
+    def __init__(self, name):
+        self.name = name
+
+    def getName(self):
+        return self.name
+
+class TestFlightRecorder(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.file = os.path.join(self.dir.name, 'flightrecorder.bin')
+        self.recorder = FlightRecorder(size=4, width=32, path=self.file, exclude=['loop'])
+        self.addCleanup(setattr, threading, 'excepthook', self.recorder.excepthook)
+
+    def test_summary(self):
+        summary = summarize({'identifiers': 'status5', 'color': (0, 0, 100), 'value': 0.123456}, 64)
+        self.assertEqual(b'identifiers=status5 color=tuple[3] value=0.1235', summary)
+
+    def test_ring_keeps_latest_in_order(self):
+        pan, loop = Topic('servo:pan:mv'), Topic('loop')
+        for i in range(6):
+            self.recorder.record(pan, percentage=i)
+        self.recorder.record(loop)
+        self.assertEqual(self.file, self.recorder.dump(reason='test'))
+        dump = FlightRecorder.load(self.file)
+        self.assertEqual('test', dump['reason'])
+        self.assertEqual(['percentage=2', 'percentage=3', 'percentage=4', 'percentage=5'],
+                         [summary for _, _, summary in dump['records']])
+        self.assertEqual({'servo:pan:mv'}, {topic for _, topic, _ in dump['records']})
+        times = [time for time, _, _ in dump['records']]
+        self.assertEqual(sorted(times), times)
+        self.assertLessEqual(times[-1], dump['time'])
+
+    def test_dump_skipped_without_new_messages(self):
+        self.assertIsNone(self.recorder.dump())
+        self.recorder.record(Topic('led'), identifiers=1, color='red')
+        self.assertIsNotNone(self.recorder.dump())
+        self.assertIsNone(self.recorder.dump())
+
+    def test_summary_is_truncated(self):
+        self.recorder.record(Topic('speak'), msg='x' * 100)
+        self.recorder.dump()
+        summary = FlightRecorder.load(self.file)['records'][0][2]
+        self.assertEqual('msg=' + 'x' * 28, summary)
+
+if __name__ == '__main__':
+    unittest.main()
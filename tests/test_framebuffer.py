@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from modules.neopixel.framebuffer import FrameBuffer
+
+class TestFrameBuffer(unittest.TestCase):
+    def setUp(self):
+        self.pixels = MagicMock()
+        self.buffer = FrameBuffer(self.pixels, 4, fps=30)
+        # Stop the render thread so frames are only shown when the test asks
+        self.buffer.exit_event.set()
+        self.buffer.ready.set()
+        self.buffer.thread.join(1)
+        self.pixels.reset_mock()
+
+    def test_one_show_per_frame(self):
+        self.buffer.update([0], (1, 0, 0))
+        self.buffer.update([1, 2], [(0, 1, 0), (0, 0, 1)])
+        self.buffer.update([0], (2, 0, 0))
+        self.assertTrue(self.buffer.flush())
+        self.pixels.show.assert_called_once()
+        self.pixels.__setitem__.assert_any_call(0, (2, 0, 0))
+        self.assertEqual(3, self.pixels.__setitem__.call_count)
+
+    def test_unchanged_pixels_are_not_shown(self):
+        self.buffer.update([0, 1], (1, 0, 0))
+        self.buffer.flush()
+        self.pixels.reset_mock()
+        self.buffer.update([0, 1], (1, 0, 0))
+        self.assertFalse(self.buffer.flush())
+        self.pixels.show.assert_not_called()
+
+    def test_render_thread_flushes(self):
+        pixels = MagicMock()
+        buffer = FrameBuffer(pixels, 2, fps=100)
+        buffer.update([1], (0, 0, 5))
+        buffer.stop()
+        pixels.__setitem__.assert_called_with(1, (0, 0, 5))
+        self.assertEqual(1, buffer.frames)
+        self.assertEqual((0, 0, 5), buffer[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+sys.modules['pubsub.core'] = MagicMock()
+sys.modules['pubsub.core.listener'] = MagicMock()
+
+import modules.instrumentation
+from modules.instrumentation import Instrumentation
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class FakeTopic:
+    def __init__(self, name):
+        self.name = name
+
+    def getName(self):
+        return self.name
+
+class FakeListener:
+    """Calls its function with the message like pypubsub's Listener"""
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+    def __call__(self, kwargs, actualTopic, allKwargs=None):
+        self.function(**kwargs)
+        return True
+
+    def typeName(self):
+        return self.name
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        for patcher in (patch('modules.instrumentation.perf_counter', self.clock),
+                        patch('modules.instrumentation.Listener', FakeListener),
+                        patch('modules.instrumentation.pub')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.original = FakeListener.__call__
+        self.instrumentation = Instrumentation(samples=100)
+        self.addCleanup(self.instrumentation.uninstall)
+
+    def stats(self):
+        return {(item['topic'], item['listener']): item for item in self.instrumentation.summary()}
+
+    def test_percentiles_per_topic(self):
+        for ms in range(1, 101):
+            self.instrumentation.record('loop', 'Servo.move', ms / 1000, ms / 1000, False)
+        self.instrumentation.record('speech', 'Servo.move', 0.5, 0.5, True)
+        stats = self.stats()
+        loop = stats[('loop', 'Servo.move')]
+        self.assertEqual(100, loop['count'])
+        self.assertEqual(50.0, loop['p50_ms'])
+        self.assertEqual(95.0, loop['p95_ms'])
+        self.assertEqual(99.0, loop['p99_ms'])
+        self.assertEqual(100.0, loop['max_ms'])
+        self.assertEqual(0, loop['errors'])
+        # The same listener on another topic is kept apart
+        speech = stats[('speech', 'Servo.move')]
+        self.assertEqual(1, speech['count'])
+        self.assertEqual(500.0, speech['p50_ms'])
+        self.assertEqual(1, speech['errors'])
+        # Slowest first
+        self.assertEqual('loop', self.instrumentation.summary(1)[0]['topic'])
+
+    def test_self_time_excludes_nested_listeners(self):
+        def inner():
+            self.clock.now += 2
+
+        inner_listener = FakeListener('inner', inner)
+
+        def outer():
+            self.clock.now += 1
+            inner_listener({}, FakeTopic('nested'))
+            self.clock.now += 0.5
+
+        FakeListener('outer', outer)({}, FakeTopic('loop'))
+        stats = self.stats()
+        self.assertEqual(3500.0, stats[('loop', 'outer')]['total_ms'])
+        self.assertEqual(1500.0, stats[('loop', 'outer')]['self_ms'])
+        self.assertEqual(2000.0, stats[('nested', 'inner')]['total_ms'])
+        self.assertEqual(2000.0, stats[('nested', 'inner')]['self_ms'])
+
+    def test_errors_are_counted_and_raised(self):
+        def fail():
+            raise ValueError('broken')
+
+        with self.assertRaises(ValueError):
+            FakeListener('fail', fail)({}, FakeTopic('loop'))
+        self.assertEqual(1, self.stats()[('loop', 'fail')]['errors'])
+
+    def test_uninstall_restores_listener(self):
+        self.assertIsNot(self.original, FakeListener.__call__)
+        self.instrumentation.uninstall()
+        self.assertIs(self.original, FakeListener.__call__)
+        # Installing twice keeps the real original
+        self.instrumentation.install()
+        self.instrumentation.install()
+        self.instrumentation.uninstall()
+        self.assertIs(self.original, FakeListener.__call__)
+        # Deliveries are no longer timed
+        FakeListener('quiet', lambda: None)({}, FakeTopic('loop'))
+        self.assertEqual({}, self.stats())
+
+if __name__ == '__main__':
+    unittest.main()
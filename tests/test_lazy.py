@@ -0,0 +1,19 @@
+import unittest
+
+from modules import lazy
+from modules.lazy import lazy_import
+
+class TestLazyImport(unittest.TestCase):
+    def test_imported_on_first_use(self):
+        colorsys = lazy_import('colorsys')
+        self.assertNotIn('colorsys', lazy.profile)
+        self.assertEqual((1.0, 0.0, 0.0), colorsys.hls_to_rgb(0, 0.5, 1))
+        self.assertIn('colorsys', lazy.profile)
+
+    def test_missing_module_fails_on_use(self):
+        missing = lazy_import('module_that_does_not_exist')
+        with self.assertRaises(ImportError):
+            missing.anything
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import gzip
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from modules.logwrapper import LogWrapper
+
+class TestLogWrapper(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        def restore():
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+                handler.close()
+            for handler in handlers:
+                root.addHandler(handler)
+            root.setLevel(level)
+            self.dir.cleanup()
+        self.addCleanup(restore)
+
+    def create(self, **kwargs):
+        return LogWrapper(path=self.dir.name, **kwargs)
+
+    def read(self):
+        with open(os.path.join(self.dir.name, 'app.log')) as f:
+            return f.read()
+
+    def test_args_are_formatted_on_write(self):
+        log = self.create()
+        log.log('info', '[Test] %s moved to %d', ('pan', 40))
+        log.exit()
+        self.assertIn('INFO: ', self.read())
+        self.assertIn('[Test] pan moved to 40', self.read())
+
+    def test_disabled_level_is_not_formatted(self):
+        log = self.create(level='info')
+        arg = MagicMock()
+        log.log('debug', '[Test] %s', (arg,))
+        log.exit()
+        arg.__str__.assert_not_called()
+        self.assertEqual('', self.read())
+
+    def test_rate_limit_per_tag(self):
+        log = self.create(rate=0.001, burst=2)
+        for i in range(5):
+            log.log('info', '[Busy] message %d', (i,))
+        log.log('info', '[Quiet] message')
+        log.log('error', '[Busy] failed')
+        log.exit()
+        text = self.read()
+        self.assertIn('[Busy] message 1', text)
+        self.assertNotIn('[Busy] message 2', text)
+        self.assertIn('[Quiet] message', text)
+        self.assertIn('[Busy] failed', text)
+
+    def test_dropped_messages_are_reported(self):
+        log = self.create(rate=0.001, burst=1)
+        log.log('info', '[Busy] one')
+        log.log('info', '[Busy] two')
+        log.buckets['[Busy]'][0] = 1
+        log.log('info', '[Busy] three')
+        log.exit()
+        self.assertIn('Dropped 1 messages like: [Busy] three', self.read())
+
+    def test_rotated_files_are_compressed(self):
+        log = self.create(max_bytes=200, backup_count=2)
+        for i in range(20):
+            log.log('info', '[Test%d] %s', (i, 'x' * 40))
+        log.exit()
+        with gzip.open(os.path.join(self.dir.name, 'app.log.1.gz'), 'rt') as f:
+            self.assertIn('xxxx', f.read())
+
+    def test_translator_runs_on_writer_thread(self):
+        translator = MagicMock()
+        log = self.create()
+        log.translator = translator
+        log.log('info', '[Test] %s', ('hello',))
+        log.exit()
+        translator.request.assert_called_once_with('[Test] hello')
+
+if __name__ == '__main__':
+    unittest.main()
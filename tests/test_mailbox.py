@@ -0,0 +1,32 @@
+import unittest
+import threading
+
+from modules.mailbox import Mailbox
+
+class TestMailbox(unittest.TestCase):
+    def test_latest_value_wins(self):
+        mailbox = Mailbox()
+        mailbox.put(1)
+        mailbox.put(2)
+        self.assertEqual(mailbox.get(), (2, 2))
+        self.assertEqual(mailbox.replaced, 1)
+
+    def test_wait_times_out_without_new_value(self):
+        mailbox = Mailbox()
+        mailbox.put('a')
+        version, value = mailbox.get()
+        self.assertEqual(mailbox.wait(version, timeout=0.01), (version, 'a'))
+
+    def test_wait_wakes_on_put(self):
+        mailbox = Mailbox()
+        timer = threading.Timer(0.01, mailbox.put, ['frame'])
+        timer.start()
+        self.assertEqual(mailbox.wait(0, timeout=1), (1, 'frame'))
+        timer.join()
+
+    def test_named_is_shared(self):
+        self.assertIs(Mailbox.named('test:shared'), Mailbox.named('test:shared'))
+        self.assertIsNot(Mailbox.named('test:shared'), Mailbox.named('test:other'))
+
+if __name__ == '__main__':
+    unittest.main()
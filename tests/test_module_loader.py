@@ -0,0 +1,259 @@
+import os
+import tempfile
+import threading
+import time
+import types
+from types import SimpleNamespace
+import unittest
+from unittest.mock import MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from module_loader import ModuleLoader
+
+class TestModuleLoader(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def loader(self, text):
+        with open(os.path.join(self.dir.name, 'modules.yml'), 'w') as f:
+            f.write(text)
+        return ModuleLoader(config_folder=self.dir.name)
+
+    def test_levels_follow_dependencies(self):
+        loader = self.loader(
+            "servos:\n  enabled: true\n  path: a.Servo\n  depends_on: ['serial']\n"
+            "serial:\n  enabled: true\n  path: a.Serial\n"
+            "vision:\n  enabled: true\n  path: a.Vision\n"
+            "tracking:\n  enabled: true\n  path: a.Tracking\n  depends_on: ['servos', 'missing']\n"
+            "buzzer:\n  enabled: false\n  path: a.Buzzer\n")
+        self.assertEqual([['serial', 'vision'], ['servos'], ['tracking']], loader.levels())
+
+    def test_circular_dependency(self):
+        loader = self.loader(
+            "a:\n  enabled: true\n  path: a.A\n  depends_on: ['b']\n"
+            "b:\n  enabled: true\n  path: a.B\n  depends_on: ['a']\n")
+        with self.assertRaises(ValueError):
+            loader.levels()
+
+    def test_parallel_start_and_report(self):
+        loader = self.loader(
+            "slow1:\n  enabled: true\n  path: a.Slow1\n"
+            "slow2:\n  enabled: true\n  path: a.Slow2\n"
+            "after:\n  enabled: true\n  path: a.After\n  depends_on: ['slow1', 'slow2']\n"
+            "service:\n  enabled: true\n  path: a.Service\n  background: true\n"
+            "broken:\n  enabled: true\n  path: a.Broken\n")
+        started = {}
+        release = threading.Event()
+
+        def create(name, module, only=None):
+            name = module['path'].split('.')[-1]
+            started[name] = time.perf_counter()
+            if name.startswith('Slow'):
+                time.sleep(0.2)
+            if name == 'Service':
+                release.wait(5)
+            if name == 'Broken':
+                raise RuntimeError('no device')
+            yield name, object()
+
+        loader.create = create
+        begin = time.perf_counter()
+        instances = loader.load_modules()
+        self.addCleanup(release.set)
+        # Both slow modules ran together and the dependent module waited for them
+        self.assertLess(time.perf_counter() - begin, 0.39)
+        self.assertGreaterEqual(started['After'] - started['Slow1'], 0.19)
+        self.assertEqual({'Slow1', 'Slow2', 'After'}, set(instances))
+        self.assertIn('no device', loader.timings['broken']['error'])
+        self.assertTrue(loader.timings['service']['background'])
+        self.assertIn('slow1', loader.report())
+
+    def test_topic_creation_is_guarded(self):
+        import module_loader
+        pub = Bus()
+        self.addCleanup(setattr, module_loader, 'pub', module_loader.pub)
+        module_loader.pub = pub
+        self.loader("mailbox:\n  enabled: true\n  path: modules.mailbox.Mailbox\n").load_modules()
+        self.assertTrue(pub.manager.guarded)
+        topic = pub.manager.getOrCreateTopic('speech')
+        self.assertIs(pub.manager.root.subtopics['speech'], topic)
+        guarded = pub.manager.getOrCreateTopic
+        ModuleLoader.guard_topics()
+        # Wrapped once, publishing is left alone
+        self.assertIs(guarded, pub.manager.getOrCreateTopic)
+        self.assertNotIn('sendMessage', vars(pub))
+
+    def test_imports_package_module(self):
+        loader = self.loader("mailbox:\n  enabled: true\n  path: modules.mailbox.Mailbox\n")
+        instances = loader.load_modules()
+        from modules.mailbox import Mailbox
+        # The same class as a normal import, not a second copy of the file
+        self.assertIsInstance(instances['Mailbox'], Mailbox)
+        self.assertIsNotNone(loader.timings['mailbox']['import'])
+
+    def test_reload_only_changed_instances(self):
+        import module_loader
+        pub = Bus()
+        self.addCleanup(setattr, module_loader, 'pub', module_loader.pub)
+        module_loader.pub = pub
+        loader = self.loader(
+            "servos:\n  enabled: true\n  path: a.Servo\n  instances:\n"
+            "    - name: pan\n      range: [0, 180]\n    - name: tilt\n      range: [0, 180]\n    - name: legs\n      pin: 4\n"
+            "buzzer:\n  enabled: true\n  path: a.Buzzer\n  config:\n    pin: 27\n")
+        created = []
+        # Held by every widget but created by none of them
+        plugin = types.ModuleType('plugin')
+        shared = SimpleNamespace()
+
+        class Helper:
+            def handle(self):
+                pass
+
+        class Widget:
+            def __init__(self, **kwargs):
+                self.config = kwargs
+                self.stopped = False
+                self.helper = Helper()
+                self.plugin = plugin
+                self.shared = shared
+                self.worker = threading.Thread(target=self.handle)
+                created.append(self)
+                pub.subscribe(self.handle, 'widget')
+                pub.subscribe(self.helper.handle, 'widget:helper')
+                pub.subscribe(Widget.shared, 'widget')
+
+            def handle(self):
+                pass
+
+            @staticmethod
+            def shared():
+                pass
+
+            def reload(self, **kwargs):
+                # Range can change in place, a pin needs the device opened again
+                if kwargs.get('pin') != self.config.get('pin'):
+                    return False
+                self.config = kwargs
+                return True
+
+            def exit(self):
+                self.stopped = True
+
+        def create(name, module, only=None):
+            for instance_name, config in ModuleLoader.instance_configs(module):
+                if only is None or instance_name in only:
+                    yield instance_name, Widget(**config)
+
+        loader.create = create
+        plugin.service = Helper()
+        shared.handle = Helper().handle
+        pub.subscribe(plugin.service.handle, 'plugin')
+        pub.subscribe(shared.handle, 'shared')
+        instances = loader.load_modules()
+        self.assertEqual({'Servo_pan', 'Servo_tilt', 'Servo_legs', 'Buzzer'}, set(instances))
+        pan, tilt, legs, buzzer = instances['Servo_pan'], instances['Servo_tilt'], instances['Servo_legs'], instances['Buzzer']
+        # Topic creation is locked while the bus itself is left alone
+        self.assertTrue(pub.manager.guarded)
+        self.assertNotIn('sendMessage', vars(pub))
+        self.assertNotIn('subscribe', vars(pub))
+
+        # Change a range, a pin and remove a module
+        time.sleep(0.01)
+        with open(os.path.join(self.dir.name, 'modules.yml'), 'w') as f:
+            f.write("servos:\n  enabled: true\n  path: a.Servo\n  instances:\n"
+                    "    - name: pan\n      range: [10, 170]\n    - name: tilt\n      range: [0, 180]\n    - name: legs\n      pin: 5\n")
+        # The reload runs off the watched topic's thread
+        thread = loader.check()
+        self.assertIsNot(threading.current_thread(), thread)
+        thread.join(5)
+        self.assertIn('Servo_pan, Servo_legs, Buzzer', pub.messages[-1][1]['msg'])
+        # Nothing changed since
+        self.assertIsNone(loader.check())
+        # Updated in place and unchanged instances are kept
+        self.assertIs(pan, instances['Servo_pan'])
+        self.assertEqual((10, 170), pan.config['range'])
+        self.assertIs(tilt, instances['Servo_tilt'])
+        self.assertFalse(tilt.stopped)
+        # Rebuilt and removed instances are stopped and unsubscribed, with the objects they hold
+        self.assertTrue(legs.stopped)
+        self.assertIsNot(legs, instances['Servo_legs'])
+        self.assertEqual(5, instances['Servo_legs'].config['pin'])
+        self.assertTrue(buzzer.stopped)
+        self.assertNotIn('Buzzer', instances)
+        listeners = pub.listeners()
+        for gone in (legs.handle, legs.helper.handle, buzzer.handle, buzzer.helper.handle):
+            self.assertNotIn(gone, listeners)
+        for kept in (pan.handle, pan.helper.handle, tilt.handle, instances['Servo_legs'].handle):
+            self.assertIn(kept, listeners)
+        # Functions shared by the class and listeners of shared objects stay subscribed
+        self.assertIn(Widget.shared, listeners)
+        self.assertIn(plugin.service.handle, listeners)
+        self.assertIn(shared.handle, listeners)
+        self.assertEqual(5, len(created))
+
+class Listener:
+    def __init__(self, function):
+        self.function = function
+
+    def getCallable(self):
+        return self.function
+
+class Topic:
+    """Just enough of a pypubsub topic tree to walk"""
+    def __init__(self):
+        self.subtopics = {}
+        self.subscribed = []
+
+    def getSubtopics(self):
+        return list(self.subtopics.values())
+
+    def getListeners(self):
+        return [Listener(function) for function in self.subscribed]
+
+    def unsubscribe(self, function):
+        self.subscribed.remove(function)
+
+class Manager:
+    def __init__(self):
+        self.root = Topic()
+
+    def getRootAllTopics(self):
+        return self.root
+
+    def getOrCreateTopic(self, name, protoListener=None):
+        topic = self.root
+        for part in name.split(':'):
+            topic = topic.subtopics.setdefault(part, Topic())
+        return topic
+
+class Bus:
+    def __init__(self):
+        self.manager = Manager()
+        self.messages = []
+
+    def getDefaultTopicMgr(self):
+        return self.manager
+
+    def subscribe(self, listener, topicName):
+        topic = self.manager.getOrCreateTopic(topicName)
+        if listener not in topic.subscribed:
+            topic.subscribed.append(listener)
+
+    def sendMessage(self, topicName, **kwargs):
+        self.messages.append((topicName, kwargs))
+
+    def listeners(self):
+        found, topics = [], [self.manager.root]
+        while topics:
+            topic = topics.pop()
+            topics.extend(topic.getSubtopics())
+            found.extend(topic.subscribed)
+        return found
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import os
+import tempfile
+
+from modules.vision.imx500.online_calibration import OnlineCalibration
+
+class TestOnlineCalibration(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'calibration.json')
+        self.calibration = OnlineCalibration((-12.5, 5.5), path=self.path, min_samples=3, latency=0, save_interval=0)
+
+    def move(self, now, moves, center, target=1):
+        self.calibration.commanded(now, moves)
+        return self.calibration.observe(now + 0.1, target, center)
+
+    def test_gain_from_moves(self):
+        self.calibration.observe(0, 1, (400, 200))
+        x = 400
+        for i in range(5):
+            x -= 2 * -20  # 2% pan with a true gain of -20 px/%
+            self.move(i + 0.5, (2, 0), (x, 200))
+        self.assertAlmostEqual(self.calibration.gains[0], -20)
+        self.assertEqual(self.calibration.gains[1], 5.5)
+
+    def test_outliers_are_ignored(self):
+        self.calibration.observe(0, 1, (400, 200))
+        x = 400
+        for i, jump in enumerate([0, 0, 300, 0, 0]):
+            x += 40 + jump
+            self.move(i + 0.5, (2, 0), (x, 200))
+        self.assertAlmostEqual(self.calibration.gains[0], -20)
+
+    def test_new_target_does_not_give_a_sample(self):
+        self.calibration.observe(0, 1, (400, 200))
+        self.move(0.5, (2, 0), (100, 200), target=2)
+        self.assertEqual(len(self.calibration.samples[0]), 0)
+
+    def test_persisted(self):
+        self.calibration.gains = (-18.0, 6.0)
+        self.calibration.save()
+        loaded = OnlineCalibration((-12.5, 5.5), path=self.path)
+        self.assertEqual(loaded.load(), (-18.0, 6.0))
+        self.assertIsNone(OnlineCalibration((-12.5, 5.5), path=self.path + '.missing').load())
+
+if __name__ == '__main__':
+    unittest.main()
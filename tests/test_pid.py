@@ -0,0 +1,40 @@
+import unittest
+
+from modules.vision.imx500.pid import PID
+
+class TestPID(unittest.TestCase):
+    def test_proportional(self):
+        pid = PID(2.0)
+        self.assertEqual(pid.update(10, 0.1), 20)
+
+    def test_deadband(self):
+        pid = PID(2.0, ki=1.0, deadband=5)
+        self.assertEqual(pid.update(4, 0.1), 0)
+        self.assertEqual(pid.integral, 0)
+
+    def test_output_limit_stops_windup(self):
+        pid = PID(1.0, ki=1.0, output_limit=5)
+        for _ in range(10):
+            self.assertEqual(pid.update(100, 0.1), 5)
+        self.assertEqual(pid.integral, 0)
+
+    def test_rate_limit(self):
+        pid = PID(1.0, rate_limit=100)
+        self.assertAlmostEqual(pid.update(50, 0.1), 10)
+        self.assertAlmostEqual(pid.update(50, 0.1), 20)
+        # Slows down at the same rate
+        self.assertAlmostEqual(pid.update(0, 0.1), 10)
+
+    def test_integral_and_derivative(self):
+        pid = PID(0.0, ki=1.0, kd=0.5)
+        self.assertAlmostEqual(pid.update(10, 0.5), 5)
+        self.assertAlmostEqual(pid.update(20, 0.5), 15 + 0.5 * 20)
+
+    def test_reset(self):
+        pid = PID(1.0, ki=1.0)
+        pid.update(10, 1)
+        pid.reset()
+        self.assertEqual((pid.integral, pid.output, pid.last_error), (0.0, 0.0, None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+sys.modules['speech_recognition'] = MagicMock()
+
+from modules.power import Power
+from modules.audio.speechinput import SpeechInput
+
+class TestPower(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('modules.power.monotonic', return_value=1000.0)
+        self.monotonic = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.power = Power(rates={'loop': 1}, wake_time=30)
+        self.pub = sys.modules['modules.power'].pub
+        self.pub.sendMessage.reset_mock()
+
+    def sent(self, topic):
+        return [call.kwargs for call in self.pub.sendMessage.call_args_list if call.args == (topic,)]
+
+    def test_sleep_pauses_and_slows_down(self):
+        self.power.sleep()
+        self.assertTrue(self.power.low_power)
+        self.assertEqual([{}], self.sent('power:sleep'))
+        self.assertEqual([{'topic': 'loop', 'interval': 1}], self.sent('scheduler:rate'))
+        # Only once
+        self.power.sleep()
+        self.assertEqual(1, len(self.sent('power:sleep')))
+
+    def test_wake_restores_rates(self):
+        self.power.sleep()
+        self.pub.sendMessage.reset_mock()
+        self.power.wake()
+        self.assertFalse(self.power.low_power)
+        self.assertEqual([{}], self.sent('power:wake'))
+        self.assertEqual([{'topic': 'loop', 'interval': self.power.awake_rates['loop']}], self.sent('scheduler:rate'))
+        self.assertIsNotNone(self.power.awake_rates['loop'])
+
+    def test_motion_resumes_until_wake_time(self):
+        self.power.motion()
+        self.assertEqual([], self.sent('power:wake'))
+        self.power.sleep()
+        self.power.motion()
+        self.assertFalse(self.power.low_power)
+        self.monotonic.return_value = 1020.0
+        self.power.loop()
+        self.assertFalse(self.power.low_power)
+        self.monotonic.return_value = 1031.0
+        self.power.loop()
+        self.assertTrue(self.power.low_power)
+
+    def test_loop_does_nothing_while_awake(self):
+        self.power.loop()
+        self.assertFalse(self.power.low_power)
+        self.assertEqual([], self.sent('power:sleep'))
+
+class Bus:
+    """Delivers messages to listeners in the order they subscribed"""
+    def __init__(self):
+        self.topics = {}
+
+    def subscribe(self, listener, topicName):
+        self.topics.setdefault(topicName, []).append(listener)
+
+    def sendMessage(self, topicName, **kwargs):
+        for listener in list(self.topics.get(topicName, [])):
+            listener(**kwargs)
+
+class TestSleepingSpeech(unittest.TestCase):
+    def boot(self, speech_first):
+        bus = Bus()
+        for patcher in (patch('modules.power.pub', bus), patch('modules.audio.speechinput.pub', bus),
+                        patch('modules.power.monotonic', return_value=1000.0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        thread = patch('modules.audio.speechinput.Thread')
+        self.thread = thread.start()
+        self.addCleanup(thread.stop)
+        if speech_first:
+            speech, power = SpeechInput(), Power(rates={'loop': 1}, wake_time=30)
+        else:
+            power, speech = Power(rates={'loop': 1}, wake_time=30), SpeechInput()
+        return bus, power, speech
+
+    def test_speech_stays_stopped_until_listen(self):
+        # Modules start in parallel, so either may have subscribed to 'rest' first
+        for speech_first in (True, False):
+            with self.subTest(speech_first=speech_first):
+                bus, power, speech = self.boot(speech_first)
+                bus.sendMessage('speech:listen')
+                self.assertEqual(1, self.thread.call_count)
+                bus.sendMessage('sleep')
+                self.assertFalse(speech.listening)
+                # Motion while asleep wakes the producers but not the microphone
+                bus.sendMessage('motion')
+                self.assertFalse(power.low_power)
+                self.assertFalse(speech.listening)
+                bus.sendMessage('rest')
+                self.assertFalse(power.sleeping)
+                self.assertFalse(speech.listening)
+                self.assertEqual(1, self.thread.call_count)
+                bus.sendMessage('speech:listen')
+                self.assertTrue(speech.listening)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from modules.scheduler import Scheduler
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class FakeEvent:
+    """Advances the fake clock instead of sleeping"""
+    def __init__(self, clock):
+        self.clock = clock
+        self.waits = []
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        self.clock.now += timeout
+
+    def set(self):
+        pass
+
+    def clear(self):
+        pass
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch('modules.scheduler.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_until(self, scheduler, mock_pub, topic, count, work=0):
+        sent = []
+        def send(name, **kwargs):
+            if name in scheduler.tasks:
+                sent.append(name)
+                self.clock.now += work
+                if sent.count(topic) >= count:
+                    scheduler.stop()
+        mock_pub.sendMessage.side_effect = send
+        scheduler.wake = FakeEvent(self.clock)
+        scheduler.run()
+        return sent
+
+    @patch('modules.scheduler.pub')
+    def test_sleeps_until_deadline(self, mock_pub):
+        scheduler = Scheduler(topics={'loop': 0.1, 'loop:1': 1}, report_interval=0)
+        sent = self.run_until(scheduler, mock_pub, 'loop:1', 2)
+        self.assertEqual(sent.count('loop'), 20)
+        self.assertEqual(sent.count('loop:1'), 2)
+        # Never asked to busy-wait
+        self.assertTrue(all(t > 0 for t in scheduler.wake.waits))
+
+    @patch('modules.scheduler.pub')
+    def test_no_drift(self, mock_pub):
+        scheduler = Scheduler(topics={'loop': 0.1}, report_interval=0)
+        start = self.clock.now
+        self.run_until(scheduler, mock_pub, 'loop', 10, work=0.03)
+        # Listener time is absorbed by the sleep, deadlines stay on the 0.1s grid
+        self.assertAlmostEqual(scheduler.tasks['loop'].deadline, start + 1.1)
+        self.assertEqual(scheduler.tasks['loop'].overruns, 0)
+
+    @patch('modules.scheduler.pub')
+    def test_overrun_skips_missed_ticks(self, mock_pub):
+        scheduler = Scheduler(topics={'loop': 0.1}, report_interval=0)
+        start = self.clock.now
+        self.run_until(scheduler, mock_pub, 'loop', 3, work=0.25)
+        task = scheduler.tasks['loop']
+        self.assertEqual(task.ticks, 3)
+        self.assertGreater(task.overruns, 0)
+        self.assertGreater(task.skipped, 0)
+        # Deadline stays aligned to the original grid
+        steps = (task.deadline - start) / 0.1
+        self.assertAlmostEqual(steps, round(steps), places=6)
+
+    @patch('modules.scheduler.pub')
+    def test_set_rate(self, mock_pub):
+        scheduler = Scheduler(topics={'loop': 0.1}, report_interval=0)
+        scheduler.set_rate('loop', 0.5)
+        scheduler.set_rate('loop:1', 1)
+        # Rejected, a zero interval would stop the loop with a division by zero
+        scheduler.set_rate('loop:1', 0)
+        scheduler.set_rate('loop', -1)
+        scheduler.set_rate('loop:10', 0)
+        self.assertEqual(3, len([c for c in mock_pub.sendMessage.call_args_list if c.args == ('log:error',)]))
+        self.assertNotIn('loop:10', scheduler.tasks)
+        sent = self.run_until(scheduler, mock_pub, 'loop:1', 1)
+        self.assertEqual(sent.count('loop'), 2)
+        self.assertEqual(scheduler.tasks['loop'].interval, 0.5)
+        self.assertEqual(scheduler.tasks['loop:1'].interval, 1)
+
+    @patch('modules.scheduler.pub')
+    def test_topic_added_while_running(self, mock_pub):
+        scheduler = Scheduler(topics={'loop': 0.1}, report_interval=0)
+        sent = []
+        def send(name, **kwargs):
+            if name in scheduler.tasks:
+                sent.append(name)
+                # As Power does from a listener while the loop is ticking
+                if sent == ['loop']:
+                    scheduler.set_rate('loop:new', 0.25)
+                if sent.count('loop:new') >= 2:
+                    scheduler.stop()
+        mock_pub.sendMessage.side_effect = send
+        scheduler.wake = FakeEvent(self.clock)
+        start = self.clock.now
+        scheduler.run()
+        self.assertEqual(2, sent.count('loop:new'))
+        self.assertAlmostEqual(start + 0.1 + 0.75, scheduler.tasks['loop:new'].deadline)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import unittest
+from collections import deque
+from unittest.mock import patch, MagicMock
+
+from modules.network.robust_serial.robust_serial import I16
+from modules.network.robust_serial.threads import Command, ListenerThread
+
+class TestListenerThread(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('modules.network.robust_serial.threads.time.monotonic', return_value=100.0)
+        self.monotonic = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pending = deque()
+        self.semaphore = threading.Semaphore(2)
+        self.serial_file = MagicMock()
+        self.acks = []
+        self.listener = ListenerThread(self.serial_file, threading.Event(), self.semaphore, self.pending,
+                                       ack_timeout=10, resync_timeout=30, on_ack=self.acks.append)
+
+    def send(self, wait=False):
+        """Same steps as the CommandThread"""
+        self.assertTrue(self.semaphore.acquire(blocking=False))
+        command = Command(b'', reply=True, wait=wait)
+        command.sent = self.monotonic.return_value
+        self.pending.append(command)
+        return command
+
+    def test_ack_matched_in_order(self):
+        first, second = self.send(), self.send()
+        self.listener.receive(I16.pack(40)[:1])
+        self.assertIsNone(first.result)
+        self.listener.receive(I16.pack(40)[1:])
+        self.listener.receive(I16.pack(3))
+        self.assertEqual((40, 3), (first.result, second.result))
+        self.assertEqual(2, self.semaphore._value)
+
+    def test_late_ack_does_not_shift_replies(self):
+        servo = self.send()
+        self.monotonic.return_value = 111.0
+        read = self.send(wait=True)
+        self.listener.expire()
+        # The sender stops waiting but the send token is kept until the reply arrives
+        self.assertTrue(servo.expired)
+        self.assertEqual([servo], self.acks)
+        self.assertFalse(self.semaphore.acquire(blocking=False))
+
+        self.listener.receive(I16.pack(90))  # late servo acknowledgement
+        self.assertEqual(90, servo.late)
+        self.assertIsNone(servo.result)
+        self.assertTrue(self.semaphore.acquire(blocking=False))
+        self.semaphore.release()
+
+        self.listener.receive(I16.pack(512))  # pin value
+        self.assertEqual(512, read.wait(0))
+
+    def test_resync_when_ack_lost(self):
+        lost, queued = self.send(), self.send()
+        self.listener.receive(I16.pack(1)[:1])
+        self.monotonic.return_value = 131.0
+        self.listener.expire()
+        self.serial_file.reset_input_buffer.assert_called_once_with()
+        self.assertEqual(0, len(self.pending))
+        self.assertTrue(lost.expired and queued.expired)
+        self.assertEqual(2, self.semaphore._value)
+        # A partial reply from before the resync is not combined with the next one
+        newer = self.send()
+        self.listener.receive(I16.pack(7))
+        self.assertEqual(7, newer.result)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import struct
+import unittest
+from unittest.mock import patch, MagicMock, call
+
+# Mock pubsub and pigpio libraries
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+sys.modules['pigpio'] = MagicMock()
+
+from modules.network.robust_serial.robust_serial import Order, encode_servo_multi
+from modules.network.arduinoserial import ArduinoSerial
+from modules.actuators.servo import Servo
+
+def decode_servo_multi(frame):
+    """Read a frame the way the Arduino sketch does: order, count, then an index and percentage per servo"""
+    order, count = struct.unpack_from('<bb', frame)
+    pairs = [struct.unpack_from('<bh', frame, 2 + 3 * i) for i in range(count)]
+    return Order(order), pairs
+
+class TestEncodeServoMulti(unittest.TestCase):
+    def test_round_trip(self):
+        pairs = [(0, 20), (3, -15), (7, 100), (11, 32767), (127, -32768)]
+        for order in (Order.SERVO_MULTI, Order.SERVO_MULTI_RELATIVE):
+            frame = encode_servo_multi(order, pairs)
+            self.assertEqual(2 + 3 * len(pairs), len(frame))
+            self.assertEqual((order, pairs), decode_servo_multi(frame))
+
+    def test_layout(self):
+        frame = encode_servo_multi(Order.SERVO_MULTI, [(1, 258), (2, -1)])
+        self.assertEqual(bytes([10, 2, 1, 0x02, 0x01, 2, 0xff, 0xff]), frame)
+
+    def test_empty(self):
+        self.assertEqual(bytes([11, 0]), encode_servo_multi(Order.SERVO_MULTI_RELATIVE, []))
+
+class TestWriteServos(unittest.TestCase):
+    def test_groups_relative_and_absolute(self):
+        serial = ArduinoSerial.__new__(ArduinoSerial)
+        serial.enqueue = MagicMock()
+        serial.write_servos([(0, 20, False), (1, 5, True), (2, 80, False), (3, -5, True), (4, 50, True)])
+        frames = [decode_servo_multi(c.args[0].frame) for c in serial.enqueue.call_args_list]
+        self.assertEqual([(Order.SERVO_MULTI, [(0, 20), (2, 80)]),
+                          (Order.SERVO_MULTI_RELATIVE, [(1, 5), (3, -5), (4, 50)])], frames)
+
+    def test_single_target_uses_servo_order(self):
+        serial = ArduinoSerial.__new__(ArduinoSerial)
+        serial.enqueue = MagicMock()
+        serial.write_servos([(0, 20, False), (1, 5, True), (2, -5, True)])
+        absolute, relative = [c.args[0].frame for c in serial.enqueue.call_args_list]
+        self.assertEqual(struct.pack('<bbh', Order.SERVO.value, 0, 20), absolute)
+        self.assertEqual((Order.SERVO_MULTI_RELATIVE, [(1, 5), (2, -5)]), decode_servo_multi(relative))
+
+class TestMoveMulti(unittest.TestCase):
+    def setUp(self):
+        for patcher in (patch.dict(Servo.instances, clear=True), patch('modules.actuators.servo.pub')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.pub = sys.modules['modules.actuators.servo'].pub
+        self.hip = Servo(name='hip', id=3, range=[0, 180])
+        self.knee = Servo(name='knee', id=4, range=[0, 180])
+        self.pi = MagicMock()
+        self.tail = Servo(name='tail', pin=18, range=[1000, 2000], serial=None, pi=self.pi)
+        self.pub.sendMessage.reset_mock()
+
+    def serial(self):
+        return [c.kwargs for c in self.pub.sendMessage.call_args_list if c.args == ('serial',)]
+
+    def test_absolute_targets_in_one_order(self):
+        Servo.move_multi({'hip': 20, 'knee': 80})
+        self.assertEqual([{'type': ArduinoSerial.DEVICE_SERVO_MULTI, 'identifier': [3, 4], 'message': [20, 80]}], self.serial())
+        self.assertEqual((36, 144), (self.hip.pos, self.knee.pos))
+
+    def test_relative_targets_in_one_order(self):
+        Servo.move_multi({'hip': 10, 'knee': -10}, relative=True)
+        self.assertEqual([{'type': ArduinoSerial.DEVICE_SERVO_MULTI_RELATIVE, 'identifier': [3, 4], 'message': [10, -10]}], self.serial())
+        # The Arduino applies relative moves, the positions here are left alone
+        self.assertEqual((90, 90), (self.hip.pos, self.knee.pos))
+
+    def test_unknown_and_pin_servos_are_not_in_the_order(self):
+        Servo.move_multi({'hip': 20, 'tail': 50, 'missing': 10})
+        self.assertEqual([{'type': ArduinoSerial.DEVICE_SERVO_MULTI, 'identifier': [3], 'message': [20]}], self.serial())
+        # Moved on its own, as with 'servo:tail:mvabs'
+        self.pi.set_servo_pulsewidth.assert_called_with(18, 50)
+        self.assertEqual(1500, self.tail.pos)
+        self.assertIn(call('log:error', msg='[Servo] Unknown servo missing'), self.pub.sendMessage.call_args_list)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+
+from modules.vision.imx500.stability import StabilityDetector
+
+class TestStabilityDetector(unittest.TestCase):
+    def setUp(self):
+        self.detector = StabilityDetector(stable_frames=3, step=2, pixel_threshold=10, threshold=0.05)
+        self.rng = np.random.default_rng(0)
+        self.frame = self.rng.integers(0, 200, (240, 320), dtype=np.uint8)
+
+    def noisy(self):
+        """Same scene with small sensor noise on every pixel"""
+        return (self.frame + self.rng.integers(0, 5, self.frame.shape)).astype(np.uint8)
+
+    def test_noise_is_stable(self):
+        results = [self.detector.update(self.noisy()) for _ in range(4)]
+        self.assertEqual(results, [False, False, False, True])
+
+    def test_scene_change_resets(self):
+        for _ in range(4):
+            self.detector.update(self.noisy())
+        self.frame = self.rng.integers(0, 200, self.frame.shape, dtype=np.uint8)
+        self.assertFalse(self.detector.update(self.frame))
+        self.assertEqual(self.detector.stable_count, 0)
+
+    def test_buffers_are_reused(self):
+        self.detector.update(self.noisy())
+        buffers = {id(self.detector.current), id(self.detector.previous), id(self.detector.diff)}
+        self.detector.update(self.noisy())
+        self.detector.update(self.noisy())
+        self.assertEqual(buffers, {id(self.detector.current), id(self.detector.previous), id(self.detector.diff)})
+
+    @patch('modules.vision.imx500.stability.monotonic')
+    def test_servo_motion_skips_check(self, mock_monotonic):
+        mock_monotonic.return_value = 10.0
+        for _ in range(4):
+            self.detector.update(self.noisy())
+        self.detector.motion()
+        mock_monotonic.return_value = 10.2
+        self.assertFalse(self.detector.update(None))
+        self.assertEqual(self.detector.skipped, 1)
+        mock_monotonic.return_value = 11.0
+        results = [self.detector.update(self.noisy()) for _ in range(4)]
+        self.assertEqual(results, [False, False, False, True])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from modules.vision.imx500.tracker import MultiObjectTracker
+
+class TestMultiObjectTracker(unittest.TestCase):
+    def setUp(self):
+        self.tracker = MultiObjectTracker(min_hits=2, max_misses=3)
+
+    def frames(self, count, start=0, dt=0.1):
+        """Two people walking towards each other"""
+        for i in range(start, start + count):
+            yield i * dt, [[100 + 10 * i, 100, 60, 120], [400 - 10 * i, 120, 60, 120]]
+
+    def ids_by_x(self, tracks):
+        return [track['id'] for track in sorted(tracks, key=lambda track: track['center'][0])]
+
+    def test_ids_are_stable(self):
+        results = [self.tracker.update(boxes, now) for now, boxes in self.frames(8)]
+        self.assertEqual(results[0], [])  # not confirmed yet
+        self.assertEqual(self.ids_by_x(results[1]), [1, 2])
+        for tracks in results[1:]:
+            self.assertEqual(self.ids_by_x(tracks), [1, 2])
+
+    def test_velocity_is_estimated(self):
+        for now, boxes in self.frames(10):
+            tracks = self.tracker.update(boxes, now)
+        velocities = {track['id']: track['velocity'][0] for track in tracks}
+        self.assertAlmostEqual(velocities[1], 100, delta=15)
+        self.assertAlmostEqual(velocities[2], -100, delta=15)
+
+    def test_survives_short_occlusion(self):
+        for now, boxes in self.frames(6):
+            self.tracker.update(boxes, now)
+        # First person hidden for two frames, their track keeps moving on the prediction
+        for now, boxes in self.frames(2, start=6):
+            tracks = self.tracker.update(boxes[1:], now)
+        hidden = [track for track in tracks if track['id'] == 1][0]
+        self.assertEqual(hidden['misses'], 2)
+        self.assertAlmostEqual(hidden['center'][0], 100 + 10 * 7 + 30, delta=10)
+        for now, boxes in self.frames(1, start=8):
+            tracks = self.tracker.update(boxes, now)
+        self.assertEqual(self.ids_by_x(tracks), [1, 2])
+
+    def test_lost_track_is_removed(self):
+        for now, boxes in self.frames(3):
+            self.tracker.update(boxes, now)
+        for i in range(4):
+            tracks = self.tracker.update([], 1 + i * 0.1)
+        self.assertEqual(tracks, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import asyncio
+import unittest
+from threading import Event
+from unittest.mock import MagicMock
+
+# Mock pubsub library
+import sys
+sys.modules['pubsub'] = MagicMock()
+sys.modules['pubsub.pub'] = MagicMock()
+
+from modules.vision.imx500.tracking import Tracking
+
+class TestTrackingExit(unittest.TestCase):
+    def tracking(self):
+        tracking = Tracking.__new__(Tracking)
+        tracking.exit_event = Event()
+        tracking.calibration = MagicMock()
+        tracking.loop = asyncio.new_event_loop()
+        self.addCleanup(tracking.loop.close)
+        tracking.queue = asyncio.Queue(maxsize=1)
+        tracking.dropped = 0
+        return tracking
+
+    def test_late_detections_after_exit_are_dropped(self):
+        tracking = self.tracking()
+        tracking.exit()
+        tracking.submit([])
+        tracking.loop.close()
+        # Detections from a vision thread that has not stopped yet
+        tracking.submit([])
+        tracking.exit()
+        tracking.calibration.save.assert_called()
+
+    def test_closed_loop_is_not_used(self):
+        tracking = self.tracking()
+        tracking.loop.close()
+        tracking.submit([])
+        self.assertEqual(0, tracking.queue.qsize())
@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+
+# Mock camera, opencv and pubsub libraries
+import sys
+for name in ('cv2', 'libcamera', 'picamera2', 'picamera2.devices', 'picamera2.devices.imx500', 'pubsub', 'pubsub.pub'):
+    sys.modules[name] = MagicMock()
+
+from modules.vision.imx500.vision import Vision
+
+def reference(coords, scaler_crop, full, raw, isp):
+    """
+    Per box conversion as done by picamera2's IMX500.convert_inference_coords,
+    with libcamera's integer Rectangle scaled_by, bounded_to and translated_by
+    """
+    def scaled(rect, numerator, denominator):
+        x, y, w, h = rect
+        return (x * numerator[0] // denominator[0], y * numerator[1] // denominator[1],
+                w * numerator[0] // denominator[0], h * numerator[1] // denominator[1])
+
+    def bounded(rect, bound):
+        x, y = max(rect[0], bound[0]), max(rect[1], bound[1])
+        right, bottom = min(rect[0] + rect[2], bound[0] + bound[2]), min(rect[1] + rect[3], bound[1] + bound[3])
+        return x, y, max(right - x, 0), max(bottom - y, 0)
+
+    y0, x0, y1, x1 = coords
+    obj = tuple(np.maximum(np.array([x0 * full[0], y0 * full[1], (x1 - x0) * full[0], (y1 - y0) * full[1]]), 0).astype(np.int32).tolist())
+    sensor_crop = scaled(scaler_crop, raw, full)
+    obj = bounded(scaled(obj, raw, full), sensor_crop)
+    obj = (obj[0] - sensor_crop[0], obj[1] - sensor_crop[1], obj[2], obj[3])
+    return scaled(obj, isp, sensor_crop[2:])
+
+class TestConvertBoxes(unittest.TestCase):
+    FULL = (4056, 3040)
+    RAW = (2028, 1520)
+    ISP = (640, 480)
+
+    def setUp(self):
+        self.vision = Vision.__new__(Vision)
+        self.vision.sensor_size = TestConvertBoxes.FULL
+        self.vision.isp_size = TestConvertBoxes.ISP
+        self.vision.crop = None
+        self.vision.transform = None
+        rng = np.random.default_rng(0)
+        corners = rng.uniform(0, 1, (200, 2, 2))
+        corners.sort(axis=1)
+        # (y0, x0, y1, x1)
+        self.boxes = np.concatenate([corners[:, 0], corners[:, 1]], axis=1)
+
+    def check(self, scaler_crop):
+        # picamera2 leaves a box that starts past the far edge of the crop outside the image, those are checked separately
+        x, y, w, h = scaler_crop
+        inside = (self.boxes[:, 1] * self.FULL[0] < x + w) & (self.boxes[:, 0] * self.FULL[1] < y + h)
+        self.boxes = self.boxes[inside]
+        pixels = self.vision.convert_boxes(self.boxes, {'ScalerCrop': scaler_crop})
+        expected = np.array([reference(tuple(box), scaler_crop, self.FULL, self.RAW, self.ISP) for box in self.boxes.tolist()])
+        # The reference rounds down at every step, the whole frame conversion only once
+        np.testing.assert_allclose(pixels, expected, atol=3)
+
+    def test_full_sensor(self):
+        self.check((0, 0, 4056, 3040))
+
+    def test_aspect_ratio_crop(self):
+        # set_auto_aspect_ratio crops the sides to the square input tensor
+        self.check((508, 0, 3040, 3040))
+
+    def test_offset_crop(self):
+        self.check((1000, 600, 2000, 1500))
+        # Boxes outside the crop are clipped to its edge
+        pixels = self.vision.convert_boxes(np.array([[0.0, 0.0, 0.1, 0.1], [0.9, 0.9, 1.0, 1.0]]), {'ScalerCrop': (1000, 600, 2000, 1500)})
+        self.assertEqual([[0, 0, 0, 0], [640, 480, 0, 0]], pixels.tolist())
+
+if __name__ == '__main__':
+    unittest.main()